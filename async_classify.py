@@ -0,0 +1,504 @@
+import asyncio
+import contextlib
+import functools
+import time
+from typing import Callable, List, Dict, Optional, Tuple
+
+from work_4 import create_llm, build_system_prompt, build_chain, parse_response
+from metrics import usage_handler
+from retry import AdaptiveConcurrency, RetryPolicy, is_rate_limit, is_retryable
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Roughly estimates the number of tokens in a text (about 4 characters per token).
+
+    Args:
+        text (str): Text to measure.
+
+    Returns:
+        int: Estimated number of tokens.
+    """
+    return len(text) // 4 + 1
+
+
+class TokenBucket:
+    """
+    Token bucket that refills continuously at a fixed rate per minute.
+
+    Waiters are served in arrival order, so a large request cannot be starved by small ones.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        """
+        Args:
+            rate_per_minute (float): Number of units added to the bucket every minute.
+            capacity (float, optional): Maximum burst size. Defaults to rate_per_minute.
+        """
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(capacity if capacity is not None else rate_per_minute)
+        self.available = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        # Add the units accumulated since the last update, up to the capacity
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        """
+        Waits until `amount` units are available and takes them from the bucket.
+
+        Args:
+            amount (float, optional): Number of units to take. Defaults to 1.0.
+        """
+        # A single request larger than the bucket would wait forever, so clamp it
+        amount = min(float(amount), self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+                await asyncio.sleep((amount - self.available) / self.rate)
+
+
+class RateLimiter:
+    """
+    Combined requests-per-minute and tokens-per-minute limiter.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None
+    ):
+        """
+        Args:
+            requests_per_minute (float, optional): Maximum requests per minute. Unlimited if None.
+            tokens_per_minute (float, optional): Maximum tokens per minute. Unlimited if None.
+        """
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    async def acquire(self, tokens: int = 0) -> None:
+        """
+        Waits for one request slot and `tokens` tokens.
+
+        Args:
+            tokens (int, optional): Estimated number of tokens used by the request. Defaults to 0.
+        """
+        if self.requests is not None:
+            await self.requests.acquire(1)
+        if self.tokens is not None and tokens:
+            await self.tokens.acquire(tokens)
+
+
+class AsyncClassifier:
+    """
+    Classifies filenames concurrently with an existing chain.
+
+    A fixed pool of workers pulls filenames from the input, so memory stays bounded
+    however many filenames are submitted. Results are returned in input order.
+    """
+
+    def __init__(
+        self,
+        chain,
+        labels: List[str],
+        default_label: str = "Others",
+        max_concurrency: int = 16,
+        rate_limiter: Optional[RateLimiter] = None,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 64,
+        cache_scope=None,
+        parse_fn: Callable[[str, List[str], str], Dict[str, str]] = parse_response,
+        metrics=None,
+        retry_policy: Optional[RetryPolicy] = None,
+        concurrency: Optional[AdaptiveConcurrency] = None,
+        key_fn: Optional[Callable[[str], str]] = None
+    ):
+        """
+        Args:
+            chain: LLMChain expecting a 'filename' input variable.
+            labels (List[str]): List of predefined labels.
+            default_label (str, optional): Default label for unmatched filenames. Defaults to "Others".
+            max_concurrency (int, optional): Maximum number of requests in flight. Defaults to 16.
+            rate_limiter (RateLimiter, optional): Limiter applied before every request. Defaults to None.
+            prompt_tokens (int, optional): Estimated tokens of the system prompt. Defaults to 0.
+            completion_tokens (int, optional): Estimated tokens of a completion. Defaults to 64.
+            cache_scope (CacheScope, optional): Response cache bound to the chain's model and prompt. Defaults to None.
+            parse_fn (Callable, optional): Parser of the raw response. Defaults to work_4.parse_response.
+            metrics (Metrics, optional): Instrumentation receiving every request. Defaults to None.
+            retry_policy (RetryPolicy, optional): Backoff for retryable errors; no retries if None.
+            concurrency (AdaptiveConcurrency, optional): AIMD limit of requests in flight; when set,
+                its max_limit replaces max_concurrency as the number of workers.
+            key_fn (Callable, optional): Key of a filename for coalescing duplicate requests in
+                flight, e.g. canonicalize.canonicalize_filename. Defaults to the filename itself.
+        """
+        self.chain = chain
+        self.labels = labels
+        self.default_label = default_label
+        self.max_concurrency = max_concurrency
+        self.rate_limiter = rate_limiter
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.cache_scope = cache_scope
+        self.parse_fn = parse_fn
+        self.metrics = metrics
+        self.retry_policy = retry_policy
+        self.concurrency = concurrency
+        self.key_fn = key_fn
+        self.failures: List[Dict[str, object]] = []
+        self.coalesced = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def _record(self, filename: str, started: float, outcome: str, handler, response: str, attempt: int = 0) -> None:
+        # Prefer the usage reported by the API, fall back to estimates
+        prompt_tokens = handler.prompt_tokens or self.prompt_tokens + estimate_tokens(filename)
+        completion_tokens = handler.completion_tokens or (estimate_tokens(response) if response else 0)
+        self.metrics.record_request(
+            filename,
+            time.perf_counter() - started,
+            outcome,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            attempt=attempt
+        )
+
+    def _cached(self, filename: str) -> Optional[Dict[str, str]]:
+        # Reuse the stored result if this request was already answered
+        if self.cache_scope is None:
+            return None
+        cached = self.cache_scope.get(filename)
+        if self.metrics is not None:
+            self.metrics.increment('cache_hits' if cached is not None else 'cache_misses')
+        return cached
+
+    def _store(self, filename: str, result: Dict[str, str]) -> None:
+        # Store the result so that a re-run does not call the model again
+        if self.cache_scope is not None:
+            self.cache_scope.put(filename, result)
+
+    def _failure(self, filename: str, error: Exception, attempts: int) -> Dict[str, str]:
+        # Report the final failure separately and return 'Error' as the label
+        print(f"Error processing filename {filename}: {error}")
+        self.failures.append({
+            'filename': filename,
+            'error': str(error),
+            'error_type': type(error).__name__,
+            'retryable': is_retryable(error),
+            'attempts': attempts
+        })
+        if self.metrics is not None:
+            self.metrics.increment('failures')
+        return {
+            'label': "Error",
+            'explanation': str(error)
+        }
+
+    def _should_retry(self, attempt: int, error: Exception) -> bool:
+        if self.retry_policy is None or not self.retry_policy.should_retry(attempt, error):
+            return False
+        if self.metrics is not None:
+            self.metrics.increment('retries')
+        return True
+
+    def _join(self, filename: str) -> Tuple[str, Optional[asyncio.Future]]:
+        # Return the key of a filename and the pending call for that key, if any
+        key = self.key_fn(filename) if self.key_fn is not None else filename
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            if self.metrics is not None:
+                self.metrics.increment('coalesced_calls')
+        return key, future
+
+    def _own(self, key: str) -> asyncio.Future:
+        # Register this call as the owner of the key; duplicates will wait for its result
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        return future
+
+    def _settle(self, key: str, future: asyncio.Future, result: Optional[Dict[str, str]]) -> None:
+        # Hand the result to the waiting duplicates, or cancel them if the owner gave up
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        if not future.done():
+            if result is not None:
+                future.set_result(result)
+            else:
+                future.cancel()
+
+    async def _attempt(self, filename: str, attempt: int = 0) -> Dict[str, str]:
+        """
+        Sends one request for a filename and parses the response; raises on failure.
+
+        `attempt` counts the retries before this request; it goes to the trace log only, since
+        the 'retries' counter is incremented once per retry by _should_retry.
+        """
+        handler = usage_handler() if self.metrics is not None else None
+        response = ""
+        outcome = "error"
+        started = time.perf_counter()
+        try:
+            # Wait for the rate limiter before sending the request
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire(
+                    self.prompt_tokens + estimate_tokens(filename) + self.completion_tokens
+                )
+
+            # Run the chain with the current filename, within the adaptive concurrency limit
+            async with self.concurrency or contextlib.nullcontext():
+                started = time.perf_counter()
+                response = await self.chain.arun(
+                    filename=filename,
+                    callbacks=[handler] if handler is not None else None
+                )
+
+            # Parse the response
+            outcome = "parse_failure"
+            result = self.parse_fn(response, self.labels, self.default_label)
+            outcome = "ok"
+
+        except Exception as e:
+            if self.concurrency is not None and is_rate_limit(e):
+                self.concurrency.on_rate_limited()
+            raise
+
+        finally:
+            if handler is not None:
+                self._record(filename, started, outcome, handler, response, attempt)
+
+        if self.concurrency is not None:
+            self.concurrency.on_success()
+        return result
+
+    async def classify_one(self, filename: str) -> Dict[str, str]:
+        """
+        Classifies a single filename, retrying transient errors.
+
+        Args:
+            filename (str): Filename to classify.
+
+        Returns:
+            Dict[str, str]: Dictionary containing 'label' and 'explanation'.
+        """
+        cached = self._cached(filename)
+        if cached is not None:
+            return cached
+
+        # Wait for an identical request already in flight instead of sending another one
+        key, inflight = self._join(filename)
+        if inflight is not None:
+            return dict(await asyncio.shield(inflight))
+
+        future = self._own(key)
+        result = None
+        try:
+            result = await self._classify_uncached(filename)
+        finally:
+            self._settle(key, future, result)
+        return result
+
+    async def _classify_uncached(self, filename: str) -> Dict[str, str]:
+        # Call the model, retrying transient errors with backoff
+        attempt = 0
+        while True:
+            try:
+                result = await self._attempt(filename, attempt)
+            except Exception as e:
+                if self._should_retry(attempt, e):
+                    await asyncio.sleep(self.retry_policy.delay(attempt, e))
+                    attempt += 1
+                    continue
+                return self._failure(filename, e, attempt + 1)
+
+            self._store(filename, result)
+            return result
+
+    async def classify(self, filenames: List[str], progress: bool = True) -> List[Dict[str, str]]:
+        """
+        Classifies filenames concurrently.
+
+        A filename failing with a retryable error is re-queued after its backoff delay, so the
+        worker moves on to other filenames instead of sleeping. Filenames that still fail are
+        labeled 'Error' and listed in `failures`. A filename whose key is already in flight
+        waits for that call instead of sending its own; `coalesced` counts the saved calls.
+
+        Args:
+            filenames (List[str]): List of filenames to classify.
+            progress (bool, optional): Show a progress bar. Defaults to True.
+
+        Returns:
+            List[Dict[str, str]]: List of dictionaries containing 'label' and 'explanation' for each filename.
+        """
+        results: List[Optional[Dict[str, str]]] = [None] * len(filenames)
+        if not filenames:
+            return results
+
+        pending = ((index, filename, 0) for index, filename in enumerate(filenames))
+        retries: asyncio.Queue = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        limit = self.concurrency.max_limit if self.concurrency is not None else self.max_concurrency
+        workers = max(1, min(limit, len(filenames)))
+        done = 0
+        owned: Dict[int, Tuple[str, asyncio.Future]] = {}
+        bar = None
+        if progress:
+            from tqdm import tqdm  # For the progress bar
+            bar = tqdm(total=len(filenames), desc="Classifying filenames")
+
+        def finish(index: int, result: Dict[str, str]) -> None:
+            nonlocal done
+            if index in owned:
+                self._settle(*owned.pop(index), result)
+            results[index] = result
+            done += 1
+            if bar is not None:
+                bar.update(1)
+            # Wake every worker up once the last result is in
+            if done == len(filenames):
+                for _ in range(workers):
+                    retries.put_nowait(None)
+
+        def follow(index: int, inflight: asyncio.Future) -> None:
+            if inflight.cancelled():
+                finish(index, {'label': "Error", 'explanation': "Coalesced request was cancelled"})
+            else:
+                finish(index, dict(inflight.result()))
+
+        async def worker():
+            while True:
+                # Due retries first, then new filenames, then wait for a retry or the end
+                if not retries.empty():
+                    item = retries.get_nowait()
+                else:
+                    item = next(pending, None)
+                    if item is None:
+                        item = await retries.get()
+                if item is None:
+                    return
+
+                index, filename, attempt = item
+                if attempt == 0:
+                    cached = self._cached(filename)
+                    if cached is not None:
+                        finish(index, cached)
+                        continue
+
+                    # Follow an identical request already in flight without holding this worker
+                    key, inflight = self._join(filename)
+                    if inflight is not None:
+                        inflight.add_done_callback(functools.partial(follow, index))
+                        continue
+                    owned[index] = (key, self._own(key))
+
+                try:
+                    result = await self._attempt(filename, attempt)
+                except Exception as e:
+                    if self._should_retry(attempt, e):
+                        # Re-queue after the backoff delay without blocking this worker
+                        delay = self.retry_policy.delay(attempt, e)
+                        loop.call_later(delay, retries.put_nowait, (index, filename, attempt + 1))
+                    else:
+                        finish(index, self._failure(filename, e, attempt + 1))
+                    continue
+
+                self._store(filename, result)
+                finish(index, result)
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(workers)))
+        finally:
+            # Release the duplicates of calls that never completed
+            for key, future in owned.values():
+                self._settle(key, future, None)
+            if bar is not None:
+                bar.close()
+
+        return results
+
+
+async def classify_filenames_async(
+    filenames: List[str],
+    labels_dict: Dict[str, str],
+    default_label: str = "Others",
+    max_concurrency: int = 16,
+    requests_per_minute: Optional[float] = None,
+    tokens_per_minute: Optional[float] = None,
+    cache=None,
+    metrics=None,
+    max_attempts: int = 6,
+    adaptive_concurrency: bool = False,
+    key_fn: Optional[Callable[[str], str]] = None
+) -> List[Dict[str, str]]:
+    """
+    Asynchronous version of work_4.classify_filenames running many requests at once.
+
+    Args:
+        filenames (List[str]): List of filenames to classify.
+        labels_dict (Dict[str, str]): Dictionary with labels as keys and descriptions as values.
+        default_label (str, optional): Default label for unmatched filenames. Defaults to "Others".
+        max_concurrency (int, optional): Maximum number of requests in flight. Defaults to 16.
+        requests_per_minute (float, optional): Requests-per-minute limit. Defaults to None.
+        tokens_per_minute (float, optional): Tokens-per-minute limit. Defaults to None.
+        cache (ResponseCache, optional): Persistent cache of previous results. Defaults to None.
+        metrics (Metrics, optional): Instrumentation receiving every request. Defaults to None.
+        max_attempts (int, optional): Attempts per filename with jittered backoff on retryable errors. Defaults to 6.
+        adaptive_concurrency (bool, optional): Adapt the requests in flight (AIMD) up to max_concurrency,
+            halving them on rate limits. Defaults to False.
+        key_fn (Callable, optional): Key under which duplicate requests in flight are coalesced.
+            Defaults to the filename itself.
+
+    Returns:
+        List[Dict[str, str]]: List of dictionaries containing 'label' and 'explanation' for each filename.
+    """
+    # Build the same prompt and chain as the synchronous version; retries are handled
+    # by the engine, so the client must not retry on its own as well
+    system_prompt = build_system_prompt(labels_dict, default_label)
+    llm = create_llm(max_retries=0) if max_attempts > 1 else create_llm()
+    chain = build_chain(llm, system_prompt)
+
+    classifier = AsyncClassifier(
+        chain,
+        list(labels_dict.keys()),
+        default_label=default_label,
+        max_concurrency=max_concurrency,
+        rate_limiter=RateLimiter(requests_per_minute, tokens_per_minute),
+        prompt_tokens=estimate_tokens(system_prompt),
+        cache_scope=cache.scope(llm.model_name, system_prompt) if cache is not None else None,
+        metrics=metrics,
+        retry_policy=RetryPolicy(max_attempts) if max_attempts > 1 else None,
+        concurrency=AdaptiveConcurrency(
+            initial=max(1, max_concurrency // 4), max_limit=max_concurrency
+        ) if adaptive_concurrency else None,
+        key_fn=key_fn
+    )
+    results = await classifier.classify(filenames)
+    if metrics is None and classifier.coalesced:
+        print(f"Coalesced {classifier.coalesced} duplicate requests")
+    return results
+
+
+def classify_filenames_concurrent(
+    filenames: List[str],
+    labels_dict: Dict[str, str],
+    default_label: str = "Others",
+    **kwargs
+) -> List[Dict[str, str]]:
+    """
+    Drop-in synchronous replacement for work_4.classify_filenames using the async engine.
+
+    Args:
+        filenames (List[str]): List of filenames to classify.
+        labels_dict (Dict[str, str]): Dictionary with labels as keys and descriptions as values.
+        default_label (str, optional): Default label for unmatched filenames. Defaults to "Others".
+        **kwargs: Concurrency and rate limit options of classify_filenames_async.
+
+    Returns:
+        List[Dict[str, str]]: List of dictionaries containing 'label' and 'explanation' for each filename.
+    """
+    return asyncio.run(classify_filenames_async(filenames, labels_dict, default_label, **kwargs))
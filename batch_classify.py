@@ -0,0 +1,344 @@
+import asyncio
+import json
+from typing import List, Dict, Optional
+
+from work_4 import create_llm, build_chain
+from async_classify import RateLimiter, estimate_tokens
+from taxonomy_index import index_for_labels
+
+# Context window (in tokens) of the models we use; prompt and completion share it
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-4-32k-0613": 32768,
+    "gpt-4-32k": 32768,
+    "gpt-4": 8192,
+    "gpt-4-0613": 8192,
+    "gpt-3.5-turbo": 4096,
+    "gpt-3.5-turbo-16k": 16384,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+}
+
+
+def build_batch_system_prompt(labels_dict: Dict[str, str], default_label: str = "Others") -> str:
+    """
+    Renders the system prompt for classifying several filenames in one request.
+
+    Args:
+        labels_dict (Dict[str, str]): Dictionary with labels as keys and descriptions as values.
+        default_label (str, optional): Default label for unmatched filenames. Defaults to "Others".
+
+    Returns:
+        str: The rendered system prompt.
+    """
+    # Prepare the labels and descriptions for the prompt
+    descriptions = [f"{label}: {description}" for label, description in labels_dict.items()]
+    labels_with_descriptions = "\n".join(descriptions)
+
+    # Define the system prompt with instructions for the model
+    return f"""
+You are an expert classifier working with a Medical Insurance company.
+
+Instructions:
+- I will provide a numbered list of FILENAMES and a LIST of predefined categories with their DESCRIPTIONS.
+- Assign every FILENAME to the most appropriate LABEL from the LIST.
+- Use the DESCRIPTIONS to make the best decision.
+- If a FILENAME does not clearly fit any LABEL, assign it to the default category '{default_label}'.
+- Only choose '{default_label}' if the FILENAME does not fit any other category.
+
+Constraints:
+- Provide your response as a JSON array with one object per FILENAME, in the same order.
+- Each object must have three keys: "filename", "label" and "explanation".
+- "filename" must repeat the FILENAME exactly as given.
+- "label" should be one of the predefined LABELS.
+- "explanation" should be a brief justification for your choice.
+- Do not include any additional text outside the JSON array.
+- Do not create new labels.
+
+LIST of LABELS and DESCRIPTIONS:
+{labels_with_descriptions}
+"""
+
+
+def format_batch(filenames: List[str]) -> str:
+    """
+    Formats a batch of filenames as a numbered list for the human message.
+
+    Args:
+        filenames (List[str]): Filenames of the batch.
+
+    Returns:
+        str: The numbered list of filenames.
+    """
+    return "\n".join(f"{number}. {filename}" for number, filename in enumerate(filenames, start=1))
+
+
+def parse_batch_response(
+    response: str,
+    filenames: List[str],
+    labels: List[str],
+    default_label: str = "Others"
+) -> Dict[str, Dict[str, str]]:
+    """
+    Parses a JSON array response and keeps only valid entries for the requested filenames.
+
+    Args:
+        response (str): Raw text returned by the model.
+        filenames (List[str]): Filenames that were sent in the batch.
+        labels (List[str]): List of predefined labels.
+        default_label (str, optional): Label used when the model answers outside of labels. Defaults to "Others".
+
+    Returns:
+        Dict[str, Dict[str, str]]: Mapping of filename to its 'label' and 'explanation'.
+            Filenames that are missing or malformed in the response are absent.
+    """
+    text = response.strip()
+
+    # Remove a Markdown code fence if the model added one
+    if text.startswith("```"):
+        text = text.strip("`")
+        if text.lower().startswith("json"):
+            text = text[len("json"):]
+
+    items = json.loads(text)
+    if not isinstance(items, list):
+        raise ValueError("Response is not a JSON array")
+
+    requested = set(filenames)
+    index = index_for_labels(labels)
+    parsed = {}
+    for item in items:
+        # Skip entries that are not objects or refer to a filename we did not send
+        if not isinstance(item, dict):
+            continue
+        filename = item.get('filename')
+        label = item.get('label')
+        if filename not in requested or not isinstance(label, str):
+            continue
+
+        # Rescue near-miss labels through the taxonomy index, assign default_label otherwise
+        resolved = index.resolve(label.strip())
+        label = resolved if resolved is not None else default_label
+
+        parsed[filename] = {
+            'label': label,
+            'explanation': str(item.get('explanation', '')).strip()
+        }
+
+    return parsed
+
+
+def plan_batches(
+    filenames: List[str],
+    prompt_tokens: int,
+    context_window: int,
+    max_batch_size: int = 50,
+    completion_tokens_per_item: int = 48,
+    safety_margin: float = 0.1
+) -> List[List[str]]:
+    """
+    Packs filenames into batches that fit in the context window of the model.
+
+    Args:
+        filenames (List[str]): Filenames to pack.
+        prompt_tokens (int): Estimated tokens of the system prompt.
+        context_window (int): Context window of the model in tokens.
+        max_batch_size (int, optional): Upper bound of filenames per batch. Defaults to 50.
+        completion_tokens_per_item (int, optional): Estimated completion tokens per filename,
+            on top of the echoed filename. Defaults to 48.
+        safety_margin (float, optional): Fraction of the window kept free. Defaults to 0.1.
+
+    Returns:
+        List[List[str]]: Batches of filenames in input order.
+    """
+    budget = int(context_window * (1 - safety_margin)) - prompt_tokens
+    if budget <= 0:
+        raise ValueError("The system prompt does not fit in the context window")
+
+    batches = []
+    current: List[str] = []
+    used = 0
+    for filename in filenames:
+        # Each filename appears in the request and is echoed back in the response
+        cost = 2 * estimate_tokens(filename) + completion_tokens_per_item + 4
+        if current and (used + cost > budget or len(current) >= max_batch_size):
+            batches.append(current)
+            current, used = [], 0
+        current.append(filename)
+        used += cost
+    if current:
+        batches.append(current)
+
+    return batches
+
+
+class BatchClassifier:
+    """
+    Classifies filenames by sending several of them in every request.
+
+    Entries missing or malformed in a response are re-split into smaller batches
+    and retried, so one bad answer does not cost the whole batch.
+    """
+
+    def __init__(
+        self,
+        chain,
+        labels: List[str],
+        default_label: str = "Others",
+        prompt_tokens: int = 0,
+        context_window: int = 32768,
+        max_batch_size: int = 50,
+        max_concurrency: int = 4,
+        max_retries: int = 3,
+        rate_limiter: Optional[RateLimiter] = None
+    ):
+        """
+        Args:
+            chain: LLMChain expecting a 'filenames' input variable.
+            labels (List[str]): List of predefined labels.
+            default_label (str, optional): Default label for unmatched filenames. Defaults to "Others".
+            prompt_tokens (int, optional): Estimated tokens of the system prompt. Defaults to 0.
+            context_window (int, optional): Context window of the model. Defaults to 32768.
+            max_batch_size (int, optional): Upper bound of filenames per batch. Defaults to 50.
+            max_concurrency (int, optional): Maximum number of batches in flight. Defaults to 4.
+            max_retries (int, optional): Number of times missing entries are retried. Defaults to 3.
+            rate_limiter (RateLimiter, optional): Limiter applied before every request. Defaults to None.
+        """
+        self.chain = chain
+        self.labels = labels
+        self.default_label = default_label
+        self.prompt_tokens = prompt_tokens
+        self.context_window = context_window
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.rate_limiter = rate_limiter
+        self.requests = 0
+        self.retried_items = 0
+        self.failures: List[Dict[str, object]] = []
+
+    async def _request(self, batch: List[str]) -> Dict[str, Dict[str, str]]:
+        # Wait for the rate limiter, then send the whole batch in one human message
+        if self.rate_limiter is not None:
+            tokens = self.prompt_tokens + sum(2 * estimate_tokens(f) + 48 for f in batch)
+            await self.rate_limiter.acquire(tokens)
+        self.requests += 1
+        response = await self.chain.arun(filenames=format_batch(batch))
+        return parse_batch_response(response, batch, self.labels, self.default_label)
+
+    async def classify_batch(self, batch: List[str], attempt: int = 0) -> Dict[str, Dict[str, str]]:
+        """
+        Classifies one batch, retrying the entries that are missing from the response.
+
+        Args:
+            batch (List[str]): Unique filenames of the batch.
+            attempt (int, optional): Current retry depth. Defaults to 0.
+
+        Returns:
+            Dict[str, Dict[str, str]]: Mapping of filename to its 'label' and 'explanation'.
+        """
+        try:
+            parsed = await self._request(batch)
+            error = "Filename missing or malformed in the response"
+        except Exception as e:
+            parsed = {}
+            error = str(e)
+
+        missing = [filename for filename in batch if filename not in parsed]
+        if not missing:
+            return parsed
+
+        if attempt >= self.max_retries:
+            # Give up on the remaining entries and report them as errors, listed in `failures`
+            for filename in missing:
+                print(f"Error processing filename {filename}: {error}")
+                parsed[filename] = {'label': "Error", 'explanation': error}
+                self.failures.append({'filename': filename, 'error': error, 'attempts': attempt + 1})
+            return parsed
+
+        # Re-split the missing entries in halves so a problematic filename gets isolated
+        self.retried_items += len(missing)
+        middle = (len(missing) + 1) // 2
+        halves = [half for half in (missing[:middle], missing[middle:]) if half]
+        for result in await asyncio.gather(*(self.classify_batch(half, attempt + 1) for half in halves)):
+            parsed.update(result)
+
+        return parsed
+
+    async def classify(self, filenames: List[str], progress: bool = True) -> List[Dict[str, str]]:
+        """
+        Classifies filenames in batches.
+
+        Args:
+            filenames (List[str]): List of filenames to classify.
+            progress (bool, optional): Show a progress bar. Defaults to True.
+
+        Returns:
+            List[Dict[str, str]]: List of dictionaries containing 'label' and 'explanation' for each filename.
+        """
+        # Duplicates inside a batch would be ambiguous in the response, so classify unique names only
+        unique = list(dict.fromkeys(filenames))
+        batches = plan_batches(unique, self.prompt_tokens, self.context_window, self.max_batch_size)
+
+        results: Dict[str, Dict[str, str]] = {}
+        pending = iter(batches)
+        bar = None
+        if progress:
+            from tqdm import tqdm  # For the progress bar
+            bar = tqdm(total=len(unique), desc="Classifying filenames")
+
+        async def worker():
+            for batch in pending:
+                results.update(await self.classify_batch(batch))
+                if bar is not None:
+                    bar.update(len(batch))
+
+        try:
+            workers = max(1, min(self.max_concurrency, len(batches)))
+            await asyncio.gather(*(worker() for _ in range(workers)))
+        finally:
+            if bar is not None:
+                bar.close()
+
+        return [dict(results[filename]) for filename in filenames]
+
+
+def classify_filenames_batched(
+    filenames: List[str],
+    labels_dict: Dict[str, str],
+    default_label: str = "Others",
+    model_name: str = "gpt-4-32k-0613",
+    max_batch_size: int = 50,
+    max_concurrency: int = 4,
+    requests_per_minute: Optional[float] = None,
+    tokens_per_minute: Optional[float] = None
+) -> List[Dict[str, str]]:
+    """
+    Classifies filenames with several filenames per request, sharing one system prompt.
+
+    Args:
+        filenames (List[str]): List of filenames to classify.
+        labels_dict (Dict[str, str]): Dictionary with labels as keys and descriptions as values.
+        default_label (str, optional): Default label for unmatched filenames. Defaults to "Others".
+        model_name (str, optional): Name of the OpenAI model. Defaults to "gpt-4-32k-0613".
+        max_batch_size (int, optional): Upper bound of filenames per batch. Defaults to 50.
+        max_concurrency (int, optional): Maximum number of batches in flight. Defaults to 4.
+        requests_per_minute (float, optional): Requests-per-minute limit. Defaults to None.
+        tokens_per_minute (float, optional): Tokens-per-minute limit. Defaults to None.
+
+    Returns:
+        List[Dict[str, str]]: List of dictionaries containing 'label' and 'explanation' for each filename.
+    """
+    system_prompt = build_batch_system_prompt(labels_dict, default_label)
+    chain = build_chain(create_llm(model_name), system_prompt, human_template="FILENAMES:\n{filenames}")
+
+    classifier = BatchClassifier(
+        chain,
+        list(labels_dict.keys()),
+        default_label=default_label,
+        prompt_tokens=estimate_tokens(system_prompt),
+        context_window=MODEL_CONTEXT_WINDOWS.get(model_name, 8192),
+        max_batch_size=max_batch_size,
+        max_concurrency=max_concurrency,
+        rate_limiter=RateLimiter(requests_per_minute, tokens_per_minute)
+    )
+    return asyncio.run(classifier.classify(filenames))
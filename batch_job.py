@@ -0,0 +1,506 @@
+import argparse
+import functools
+import hashlib
+import json
+import os
+import time
+import urllib.parse
+import urllib.request
+import uuid
+from typing import Iterable, Iterator, List, Dict, Optional, Set, Tuple, Union
+
+from stream_pipeline import load_checkpoint, save_checkpoint
+from work_4 import build_system_prompt, parse_response
+
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+# Limits of one input file of the Batch API, with a margin under the 200 MB cap
+MAX_BATCH_REQUESTS = 50000
+MAX_BATCH_BYTES = 190 * 1024 * 1024
+
+# Size of the pieces a request file is uploaded in
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+class BatchAPI:
+    """
+    Minimal client of the OpenAI files and batches endpoints.
+    """
+
+    def __init__(self, base_url: Optional[str] = None, api_key: Optional[str] = None, timeout: float = 60.0):
+        """
+        Args:
+            base_url (str, optional): Base URL of the API; read from BASE_URL if None, the OpenAI API
+                if unset. Defaults to None.
+            api_key (str, optional): API key; read from OPENAI_API_KEY if None. Defaults to None.
+            timeout (float, optional): Seconds before an HTTP request times out. Defaults to 60.0.
+        """
+        from dotenv import load_dotenv
+
+        # Same environment variables as work_4.create_llm
+        load_dotenv()
+        self.base_url = (base_url or os.environ.get("BASE_URL") or "https://api.openai.com/v1").rstrip("/")
+        self.api_key = api_key or os.environ.get("OPENAI_API_KEY", "")
+        self.timeout = timeout
+
+    def _request(
+        self,
+        method: str,
+        path: str,
+        data: Optional[Union[bytes, Iterable[bytes]]] = None,
+        content_type: str = "application/json",
+        content_length: Optional[int] = None
+    ):
+        request = urllib.request.Request(self.base_url + path, data=data, method=method)
+        request.add_header("Authorization", f"Bearer {self.api_key}")
+        if data is not None:
+            request.add_header("Content-Type", content_type)
+        # An iterable body is sent as it is produced; its length avoids a chunked upload
+        if content_length is not None:
+            request.add_header("Content-Length", str(content_length))
+        return urllib.request.urlopen(request, timeout=self.timeout)
+
+    def _json(self, method: str, path: str, body: Optional[Dict] = None) -> Dict:
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        with self._request(method, path, data) as response:
+            return json.load(response)
+
+    def upload_file(self, path: str) -> str:
+        """
+        Uploads a JSONL request file with purpose 'batch' and returns its file id.
+
+        The multipart body is streamed from disk, so a request file of hundreds of megabytes
+        is never held in memory.
+        """
+        boundary = uuid.uuid4().hex
+        head = (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="purpose"\r\n\r\nbatch\r\n'
+            f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{os.path.basename(path)}"\r\n'
+            "Content-Type: application/jsonl\r\n\r\n"
+        ).encode("utf-8")
+        tail = f"\r\n--{boundary}--\r\n".encode("utf-8")
+
+        def body() -> Iterator[bytes]:
+            yield head
+            with open(path, "rb") as f:
+                yield from iter(functools.partial(f.read, UPLOAD_CHUNK_BYTES), b"")
+            yield tail
+
+        length = len(head) + os.path.getsize(path) + len(tail)
+        with self._request("POST", "/files", body(), f"multipart/form-data; boundary={boundary}", length) as response:
+            return json.load(response)['id']
+
+    def create_batch(self, input_file_id: str, endpoint: str = "/v1/chat/completions") -> Dict:
+        """
+        Creates a batch over an uploaded request file.
+        """
+        return self._json("POST", "/batches", {
+            'input_file_id': input_file_id,
+            'endpoint': endpoint,
+            'completion_window': "24h"
+        })
+
+    def get_batch(self, batch_id: str) -> Dict:
+        """
+        Returns the current state of a batch.
+        """
+        return self._json("GET", f"/batches/{batch_id}")
+
+    def list_batches(self, page_size: int = 100) -> Iterator[Dict]:
+        """
+        Yields the batches of the account, newest first, following the pagination.
+        """
+        after = None
+        while True:
+            query = {'limit': page_size}
+            if after is not None:
+                query['after'] = after
+            page = self._json("GET", "/batches?" + urllib.parse.urlencode(query))
+            yield from page['data']
+            if not page.get("has_more") or not page['data']:
+                return
+            after = page['data'][-1]['id']
+
+    def find_batch(self, input_file_id: str) -> Optional[Dict]:
+        """
+        Returns the batch created over an uploaded file, or None if there is none.
+        """
+        for batch in self.list_batches():
+            if batch.get("input_file_id") == input_file_id:
+                return batch
+        return None
+
+    def iter_file_lines(self, file_id: str) -> Iterator[Dict]:
+        """
+        Streams the lines of an output or error file, parsed one at a time.
+        """
+        with self._request("GET", f"/files/{file_id}/content") as response:
+            for line in response:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def request_line(custom_id: str, filename: str, system_prompt: str, model_name: str = "gpt-4-32k-0613") -> str:
+    """
+    Renders the request of one filename as a line of the JSONL format of the Batch API.
+
+    The messages are those of work_4.classify_filenames: the system prompt built from the
+    labels, then "FILENAME: <name>".
+    """
+    return json.dumps({
+        'custom_id': custom_id,
+        'method': "POST",
+        'url': "/v1/chat/completions",
+        'body': {
+            'model': model_name,
+            'temperature': 0,
+            'messages': [
+                {'role': "system", 'content': system_prompt},
+                {'role': "user", 'content': f"FILENAME: {filename}"}
+            ]
+        }
+    }, ensure_ascii=False) + "\n"
+
+
+def render_requests(
+    path: str,
+    filenames: List[str],
+    custom_ids: List[str],
+    system_prompt: str,
+    model_name: str = "gpt-4-32k-0613"
+) -> None:
+    """
+    Writes one request per filename in the JSONL format of the Batch API.
+
+    Args:
+        path (str): Path of the JSONL file to write.
+        filenames (List[str]): Filenames to classify.
+        custom_ids (List[str]): Id of each request, used to merge the answers back.
+        system_prompt (str): The rendered system prompt.
+        model_name (str, optional): Name of the OpenAI model. Defaults to "gpt-4-32k-0613".
+    """
+    temporary = path + ".tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        for custom_id, filename in zip(custom_ids, filenames):
+            f.write(request_line(custom_id, filename, system_prompt, model_name))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+def split_requests(
+    filenames: List[str],
+    custom_ids: List[str],
+    system_prompt: str,
+    model_name: str = "gpt-4-32k-0613",
+    max_requests: int = MAX_BATCH_REQUESTS,
+    max_bytes: int = MAX_BATCH_BYTES
+) -> List[Tuple[List[str], List[str]]]:
+    """
+    Splits requests into groups that each fit in one input file of the Batch API.
+
+    Args:
+        filenames (List[str]): Filenames to classify.
+        custom_ids (List[str]): Id of each request.
+        system_prompt (str): The rendered system prompt.
+        model_name (str, optional): Name of the OpenAI model. Defaults to "gpt-4-32k-0613".
+        max_requests (int, optional): Maximum number of requests per file. Defaults to MAX_BATCH_REQUESTS.
+        max_bytes (int, optional): Maximum size of a file in bytes. Defaults to MAX_BATCH_BYTES.
+
+    Returns:
+        List[Tuple[List[str], List[str]]]: (filenames, custom_ids) of every group, in order.
+    """
+    groups = []
+    group_filenames, group_ids, size = [], [], 0
+    for custom_id, filename in zip(custom_ids, filenames):
+        line_bytes = len(request_line(custom_id, filename, system_prompt, model_name).encode("utf-8"))
+        if group_ids and (len(group_ids) >= max_requests or size + line_bytes > max_bytes):
+            groups.append((group_filenames, group_ids))
+            group_filenames, group_ids, size = [], [], 0
+        group_filenames.append(filename)
+        group_ids.append(custom_id)
+        size += line_bytes
+    if group_ids:
+        groups.append((group_filenames, group_ids))
+    return groups
+
+
+class BatchJob:
+    """
+    Classifies filenames through the Batch API, surviving process restarts.
+
+    Every unique filename becomes one request whose custom_id is its position. Requests are
+    split into as many batches as the limits of an input file require. The job directory holds
+    the rendered request files, the parsed results as JSONL and a state file listing the
+    batches in flight, written atomically. The id of an uploaded file is saved before its batch
+    is created, so a restarted job finds the batches it had created, by listing them if the
+    crash came before their id was saved, instead of submitting them again. Requests that
+    failed are resubmitted in new batches, up to `max_rounds` rounds.
+    """
+
+    def __init__(
+        self,
+        job_dir: str,
+        labels_dict: Dict[str, str],
+        default_label: str = "Others",
+        model_name: str = "gpt-4-32k-0613",
+        api: Optional[BatchAPI] = None,
+        poll_seconds: float = 30.0,
+        max_rounds: int = 3,
+        max_batch_requests: int = MAX_BATCH_REQUESTS,
+        max_batch_bytes: int = MAX_BATCH_BYTES
+    ):
+        """
+        Args:
+            job_dir (str): Directory holding the state of the job.
+            labels_dict (Dict[str, str]): Dictionary with labels as keys and descriptions as values.
+            default_label (str, optional): Default label for unmatched filenames. Defaults to "Others".
+            model_name (str, optional): Name of the OpenAI model. Defaults to "gpt-4-32k-0613".
+            api (BatchAPI, optional): Client of the batches endpoints. Defaults to BatchAPI().
+            poll_seconds (float, optional): Seconds between two status checks. Defaults to 30.0.
+            max_rounds (int, optional): Maximum number of submission rounds, the first included.
+                Defaults to 3.
+            max_batch_requests (int, optional): Maximum number of requests per batch.
+                Defaults to MAX_BATCH_REQUESTS.
+            max_batch_bytes (int, optional): Maximum size of the input file of a batch.
+                Defaults to MAX_BATCH_BYTES.
+        """
+        self.job_dir = job_dir
+        self.labels_dict = labels_dict
+        self.labels = list(labels_dict.keys())
+        self.default_label = default_label
+        self.model_name = model_name
+        self.api = api or BatchAPI()
+        self.poll_seconds = poll_seconds
+        self.max_rounds = max_rounds
+        self.max_batch_requests = max_batch_requests
+        self.max_batch_bytes = max_batch_bytes
+        self.system_prompt = build_system_prompt(labels_dict, default_label)
+        self.state_path = os.path.join(job_dir, "state.json")
+        self.results_path = os.path.join(job_dir, "results.jsonl")
+        os.makedirs(job_dir, exist_ok=True)
+
+    def fingerprint(self, filenames: List[str]) -> str:
+        """
+        Hashes the model, prompt and filenames, so a job directory is never reused for other inputs.
+        """
+        digest = hashlib.sha256()
+        digest.update(self.model_name.encode("utf-8"))
+        digest.update(self.system_prompt.encode("utf-8"))
+        for filename in filenames:
+            digest.update(b"\0" + filename.encode("utf-8"))
+        return digest.hexdigest()[:16]
+
+    def load_state(self, filenames: List[str]) -> Dict:
+        """
+        Loads the state of the job, or a fresh one.
+
+        Raises:
+            ValueError: If the directory holds a job over other filenames, labels or model.
+        """
+        fingerprint = self.fingerprint(filenames)
+        if not os.path.exists(self.state_path):
+            return {'fingerprint': fingerprint, 'rounds': 0, 'batches': [], 'failed': {}}
+        state = load_checkpoint(self.state_path)
+        if state['fingerprint'] != fingerprint:
+            raise ValueError(f"Job directory {self.job_dir} belongs to another job")
+        return state
+
+    def load_results(self) -> Dict[str, Dict[str, str]]:
+        """
+        Loads the results parsed so far, by custom_id.
+        """
+        results = {}
+        if os.path.exists(self.results_path):
+            with open(self.results_path, encoding="utf-8") as f:
+                for line in f:
+                    # A line cut short by a crash is ignored and its request resubmitted
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    results[record['custom_id']] = record['result']
+        return results
+
+    def plan(self, state: Dict, filenames: List[str], custom_ids: List[str]) -> None:
+        """
+        Renders the request files of a new round and records them in the state file.
+        """
+        groups = split_requests(
+            filenames, custom_ids, self.system_prompt, self.model_name, self.max_batch_requests, self.max_batch_bytes
+        )
+        for part, (group_filenames, group_ids) in enumerate(groups):
+            path = os.path.join(self.job_dir, f"requests_{state['rounds']}_{part}.jsonl")
+            render_requests(path, group_filenames, group_ids, self.system_prompt, self.model_name)
+            state['batches'].append({'path': path, 'requests': len(group_ids), 'file_id': None, 'batch_id': None})
+        state['rounds'] += 1
+        save_checkpoint(self.state_path, state)
+
+    def submit(self, state: Dict, entry: Dict) -> None:
+        """
+        Uploads the request file of a planned batch and creates the batch, saving each step.
+
+        The file id is saved before the batch is created: an entry with a file id but no batch
+        id may have been submitted just before a crash, so the batches are searched for one over
+        that file before a new one is created.
+        """
+        if entry['batch_id'] is not None:
+            return
+
+        batch = None
+        if entry['file_id'] is None:
+            entry['file_id'] = self.api.upload_file(entry['path'])
+            save_checkpoint(self.state_path, state)
+        else:
+            batch = self.api.find_batch(entry['file_id'])
+
+        if batch is None:
+            batch = self.api.create_batch(entry['file_id'])
+            print(f"Submitted batch {batch['id']} with {entry['requests']} requests")
+        entry['batch_id'] = batch['id']
+        save_checkpoint(self.state_path, state)
+
+    def wait(self, batch_id: str) -> Dict:
+        """
+        Polls a batch until it reaches a terminal status.
+        """
+        while True:
+            batch = self.api.get_batch(batch_id)
+            if batch['status'] in TERMINAL_STATUSES:
+                return batch
+            time.sleep(self.poll_seconds)
+
+    def collect(self, state: Dict, entry: Dict, batch: Dict, done: Set[str]) -> None:
+        """
+        Stream-parses the output and error files of a finished batch into the results file.
+
+        Parsed answers are appended to the results file; errors are kept in the state so the
+        last one can be reported for requests that never succeed.
+        """
+        with open(self.results_path, "a", encoding="utf-8") as results:
+            if batch.get("output_file_id"):
+                for line in self.api.iter_file_lines(batch['output_file_id']):
+                    custom_id = line['custom_id']
+                    response = line.get("response") or {}
+                    try:
+                        if response.get("status_code") != 200:
+                            raise ValueError(f"HTTP {response.get('status_code')}")
+                        content = response['body']['choices'][0]['message']['content']
+                        result = parse_response(content, self.labels, self.default_label)
+                    except Exception as e:
+                        state['failed'][custom_id] = str(e)
+                        continue
+                    results.write(json.dumps({'custom_id': custom_id, 'result': result}, ensure_ascii=False) + "\n")
+                    state['failed'].pop(custom_id, None)
+                    done.add(custom_id)
+
+            if batch.get("error_file_id"):
+                for line in self.api.iter_file_lines(batch['error_file_id']):
+                    error = line.get("error") or (line.get("response") or {}).get("body", {}).get("error") or {}
+                    state['failed'][line['custom_id']] = error.get("message", "Request failed")
+
+            results.flush()
+            os.fsync(results.fileno())
+
+        if batch['status'] != "completed":
+            print(f"Batch {batch['id']} ended with status {batch['status']}")
+
+        # The batch is consumed only once its results are on disk
+        state['batches'].remove(entry)
+        save_checkpoint(self.state_path, state)
+
+    def run(self, filenames: List[str]) -> List[Dict[str, str]]:
+        """
+        Runs the job to completion, resuming from the job directory.
+
+        Args:
+            filenames (List[str]): List of filenames to classify.
+
+        Returns:
+            List[Dict[str, str]]: List of dictionaries containing 'label' and 'explanation' for each
+                filename, in input order.
+        """
+        unique = list(dict.fromkeys(filenames))
+        custom_ids = [str(position) for position in range(len(unique))]
+        state = self.load_state(unique)
+        done = set(self.load_results())
+
+        while True:
+            # Submit every planned batch before waiting, so they run side by side; after a
+            # restart, this resumes the batches of the interrupted round
+            for entry in list(state['batches']):
+                self.submit(state, entry)
+            for entry in list(state['batches']):
+                self.collect(state, entry, self.wait(entry['batch_id']), done)
+
+            missing = [custom_id for custom_id in custom_ids if custom_id not in done]
+            if not missing or state['rounds'] >= self.max_rounds:
+                break
+            self.plan(state, [unique[int(custom_id)] for custom_id in missing], missing)
+
+        # Merge back into input order; requests that never succeeded are reported as errors
+        results = self.load_results()
+        by_filename = {}
+        for custom_id, filename in zip(custom_ids, unique):
+            if custom_id in results:
+                by_filename[filename] = results[custom_id]
+            else:
+                error = state['failed'].get(custom_id, "Request was not answered")
+                print(f"Error processing filename {filename}: {error}")
+                by_filename[filename] = {'label': "Error", 'explanation': error}
+        return [by_filename[filename] for filename in filenames]
+
+
+def classify_filenames_batch(
+    filenames: List[str],
+    labels_dict: Dict[str, str],
+    default_label: str = "Others",
+    job_dir: str = "batch_job",
+    model_name: str = "gpt-4-32k-0613",
+    poll_seconds: float = 30.0,
+    max_rounds: int = 3
+) -> List[Dict[str, str]]:
+    """
+    Classifies filenames through the Batch API; see BatchJob.
+
+    Args:
+        filenames (List[str]): List of filenames to classify.
+        labels_dict (Dict[str, str]): Dictionary with labels as keys and descriptions as values.
+        default_label (str, optional): Default label for unmatched filenames. Defaults to "Others".
+        job_dir (str, optional): Directory holding the state of the job. Defaults to "batch_job".
+        model_name (str, optional): Name of the OpenAI model. Defaults to "gpt-4-32k-0613".
+        poll_seconds (float, optional): Seconds between two status checks. Defaults to 30.0.
+        max_rounds (int, optional): Maximum number of submission rounds. Defaults to 3.
+
+    Returns:
+        List[Dict[str, str]]: List of dictionaries containing 'label' and 'explanation' for each filename.
+    """
+    job = BatchJob(job_dir, labels_dict, default_label, model_name, poll_seconds=poll_seconds, max_rounds=max_rounds)
+    return job.run(filenames)
+
+
+if __name__ == "__main__":
+    import pandas as pd
+    from taxonomy import load_bins
+
+    parser = argparse.ArgumentParser(description="Classify filenames offline through the Batch API.")
+    parser.add_argument("input", help="Input .xlsx or .csv file with a 'file names' column")
+    parser.add_argument("output", help="Output .csv file")
+    parser.add_argument("--job-dir", default="batch_job", help="Directory holding the job state; rerun to resume")
+    parser.add_argument("--model", default="gpt-4-32k-0613")
+    parser.add_argument("--poll-seconds", type=float, default=30.0)
+    parser.add_argument("--max-rounds", type=int, default=3, help="Submission rounds at most, resubmissions included")
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.input) if args.input.endswith(".csv") else pd.read_excel(args.input)
+    results = classify_filenames_batch(
+        df['file names'].astype(str).tolist(),
+        load_bins(),
+        job_dir=args.job_dir,
+        model_name=args.model,
+        poll_seconds=args.poll_seconds,
+        max_rounds=args.max_rounds
+    )
+    df['LLM_label'] = [result['label'] for result in results]
+    df['Explanation'] = [result['explanation'] for result in results]
+    df.to_csv(args.output, index=False)
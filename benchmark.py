@@ -0,0 +1,312 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+import urllib.request
+from queue import Empty
+from typing import Callable, List, Dict
+
+from taxonomy import load_bins
+
+# Words used to generate a synthetic inventory of filenames
+TOPICS = [
+    "financial_report", "budget_overview", "payroll", "employee_handbook", "hr_policy",
+    "legal_compliance_audit", "privacy_policy", "grievance_procedure", "system_error_log",
+    "database_migration", "support_ticket", "customer_service_feedback", "insurance_policy",
+    "benefit_summary", "claims_processing", "provider_payment", "patient_medical_report",
+    "therapy_session_notes", "wellness_program", "random_notes", "company_brand_guidelines",
+    "travel_itinerary", "w9_form", "translation_request",
+]
+EXTENSIONS = [".pdf", ".docx", ".xlsx", ".csv", ".txt", ".pptx"]
+
+
+def generate_filenames(count: int, seed: int = 0) -> List[str]:
+    """
+    Generates a reproducible inventory of realistic filenames with dates, quarters and versions.
+
+    Args:
+        count (int): Number of filenames.
+        seed (int, optional): Random seed. Defaults to 0.
+
+    Returns:
+        List[str]: The generated filenames.
+    """
+    rng = random.Random(seed)
+    filenames = []
+    for _ in range(count):
+        suffix = rng.choice([
+            f"_{rng.randint(2018, 2024)}",
+            f"_Q{rng.randint(1, 4)}",
+            f"_v{rng.randint(1, 5)}",
+            f"_{rng.randint(1000, 99999)}",
+            "",
+        ])
+        filenames.append(rng.choice(TOPICS) + suffix + rng.choice(EXTENSIONS))
+    return filenames
+
+
+def run_sequential(filenames: List[str], bins: Dict[str, str]) -> List[Dict[str, str]]:
+    from work_4 import classify_filenames
+    return classify_filenames(filenames, bins)
+
+
+def run_async(filenames: List[str], bins: Dict[str, str]) -> List[Dict[str, str]]:
+    from async_classify import classify_filenames_concurrent
+    return classify_filenames_concurrent(filenames, bins, max_concurrency=32)
+
+
+def run_batched(filenames: List[str], bins: Dict[str, str]) -> List[Dict[str, str]]:
+    from batch_classify import classify_filenames_batched
+    return classify_filenames_batched(filenames, bins, max_concurrency=8)
+
+
+def run_dedup(filenames: List[str], bins: Dict[str, str]) -> List[Dict[str, str]]:
+    from async_classify import classify_filenames_concurrent
+    from canonicalize import classify_with_dedup
+    return classify_with_dedup(filenames, bins, classify_fn=classify_filenames_concurrent)[0]
+
+
+def run_tiered(filenames: List[str], bins: Dict[str, str]) -> List[Dict[str, str]]:
+    from async_classify import classify_filenames_concurrent
+    from rule_classifier import KeywordClassifier, TieredClassifier
+    tiered = TieredClassifier(KeywordClassifier(labels_dict=bins), classify_fn=classify_filenames_concurrent)
+    return tiered.classify(filenames, bins)
+
+
+def run_compact(filenames: List[str], bins: Dict[str, str]) -> List[Dict[str, str]]:
+    from compact_classify import classify_filenames_compact
+    return classify_filenames_compact(filenames, bins, explain_fraction=0.1, max_concurrency=32)
+
+
+def run_cascade(filenames: List[str], bins: Dict[str, str]) -> List[Dict[str, str]]:
+    from cascade_classify import classify_filenames_cascade
+    return classify_filenames_cascade(filenames, bins, max_concurrency=32)
+
+
+def run_streaming(filenames: List[str], bins: Dict[str, str]) -> List[Dict[str, str]]:
+    from streaming_classify import classify_filenames_streaming
+    return classify_filenames_streaming(filenames, bins, max_concurrency=32)
+
+
+# Prompt-prefix modes: short runs sharing the backend, each building the bins in its own order
+# and with its own default label, as separate pipelines or re-runs do
+PROMPT_RUN_SIZE = 4
+PROMPT_RUN_DEFAULTS = ("Others", "Other", "Misc", "Unclassified")
+
+
+def _run_prompt_variants(filenames: List[str], bins: Dict[str, str], build_prompt) -> List[Dict[str, str]]:
+    import asyncio
+    from async_classify import AsyncClassifier
+    from work_4 import build_chain, create_llm
+
+    llm = create_llm()
+
+    async def run():
+        # Eight runs at a time, four requests in flight each
+        slots = asyncio.Semaphore(8)
+
+        async def one_run(index: int, part: List[str]) -> List[Dict[str, str]]:
+            keys = list(bins)
+            random.Random(index).shuffle(keys)
+            default_label = PROMPT_RUN_DEFAULTS[index % len(PROMPT_RUN_DEFAULTS)]
+            chain = build_chain(llm, build_prompt({key: bins[key] for key in keys}, default_label))
+            async with slots:
+                return await AsyncClassifier(chain, keys, default_label, max_concurrency=4).classify(part, progress=False)
+
+        parts = await asyncio.gather(*(
+            one_run(index, filenames[start:start + PROMPT_RUN_SIZE])
+            for index, start in enumerate(range(0, len(filenames), PROMPT_RUN_SIZE))
+        ))
+        return [result for part in parts for result in part]
+
+    return asyncio.run(run())
+
+
+def run_prefix_legacy(filenames: List[str], bins: Dict[str, str]) -> List[Dict[str, str]]:
+    from work_4 import build_system_prompt
+    return _run_prompt_variants(filenames, bins, build_system_prompt)
+
+
+def run_prefix_stable(filenames: List[str], bins: Dict[str, str]) -> List[Dict[str, str]]:
+    from prompt_layout import build_stable_system_prompt
+    return _run_prompt_variants(filenames, bins, build_stable_system_prompt)
+
+
+# Classification modes benchmarked; each takes (filenames, bins) and returns the results
+BENCHMARK_MODES: Dict[str, Callable[[List[str], Dict[str, str]], List[Dict[str, str]]]] = {
+    'sequential': run_sequential,
+    'async': run_async,
+    'batched': run_batched,
+    'dedup': run_dedup,
+    'tiered': run_tiered,
+    'compact': run_compact,
+    'cascade': run_cascade,
+    'streaming': run_streaming,
+    'prefix_legacy': run_prefix_legacy,
+    'prefix_stable': run_prefix_stable,
+}
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """
+    Returns the nearest-rank percentile of a list of values.
+
+    Args:
+        values (List[float]): Values to summarize.
+        fraction (float): Percentile as a fraction, e.g. 0.95.
+
+    Returns:
+        float: The percentile, or 0.0 for an empty list.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def _run_mode(mode: str, filenames: List[str], bins: Dict[str, str], queue) -> None:
+    # Runs in a child process so that the peak RSS belongs to this mode only
+    started = time.perf_counter()
+    try:
+        results = BENCHMARK_MODES[mode](filenames, bins)
+    except Exception as e:
+        # The parent waits on the queue, so a failure must be sent there too
+        queue.put({'error': f"{type(e).__name__}: {e}"})
+        return
+    elapsed = time.perf_counter() - started
+    queue.put({
+        'seconds': elapsed,
+        'errors': sum(1 for result in results if result['label'] == "Error"),
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    })
+
+
+def _request(base_url: str, path: str, method: str = "GET") -> Dict:
+    root = base_url.rsplit("/v1", 1)[0]
+    request = urllib.request.Request(root + path, data=b"{}" if method == "POST" else None, method=method)
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def benchmark_mode(mode: str, filenames: List[str], bins: Dict[str, str], base_url: str) -> Dict[str, float]:
+    """
+    Runs one classification mode against a running stub server and summarizes it.
+
+    Args:
+        mode (str): Key of BENCHMARK_MODES.
+        filenames (List[str]): Filenames to classify.
+        bins (Dict[str, str]): Labels and descriptions.
+        base_url (str): Base URL of the stub server.
+
+    Returns:
+        Dict[str, float]: Files per second, latency percentiles (ms), tokens per file, requests,
+            errors and peak RSS (MB).
+
+    Raises:
+        RuntimeError: If the mode raised or its process died without reporting.
+    """
+    _request(base_url, "/reset", "POST")
+
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_run_mode, args=(mode, filenames, bins, queue))
+    process.start()
+    outcome = None
+    while outcome is None:
+        # Checked before waiting, so a report sent just before the exit is still read
+        alive = process.is_alive()
+        try:
+            outcome = queue.get(timeout=1.0)
+        except Empty:
+            # A child killed by a signal or the OOM killer never reports
+            if not alive:
+                break
+    process.join()
+
+    if outcome is None:
+        raise RuntimeError(f"Mode {mode} exited with code {process.exitcode} without reporting")
+    if 'error' in outcome:
+        raise RuntimeError(f"Mode {mode} failed: {outcome['error']}")
+
+    stats = _request(base_url, "/stats")
+    latencies = stats['latencies']
+    return {
+        'mode': mode,
+        'files': len(filenames),
+        'seconds': round(outcome['seconds'], 3),
+        'files_per_sec': round(len(filenames) / outcome['seconds'], 1),
+        'requests': stats['requests'],
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+        'prompt_tokens_per_file': round(stats['prompt_tokens'] / len(filenames), 1),
+        'completion_tokens_per_file': round(stats['completion_tokens'] / len(filenames), 1),
+        'cached_prompt_tokens_per_file': round(stats.get('cached_prompt_tokens', 0) / len(filenames), 1),
+        'errors': outcome['errors'],
+        'peak_rss_mb': round(outcome['peak_rss_mb'], 1)
+    }
+
+
+def start_stub_process(port: int, latency_ms: float, latency_sigma: float, error_rate: float,
+                       rate_limit_rate: float, prefill_ms_per_1k: float = 0.0,
+                       prefix_cache: bool = False) -> subprocess.Popen:
+    """
+    Starts stub_server.py in its own process and waits until it accepts requests.
+    """
+    process = subprocess.Popen(
+        [
+            sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "stub_server.py"),
+            "--port", str(port),
+            "--latency-ms", str(latency_ms),
+            "--latency-sigma", str(latency_sigma),
+            "--error-rate", str(error_rate),
+            "--rate-limit-rate", str(rate_limit_rate),
+            "--prefill-ms-per-1k", str(prefill_ms_per_1k),
+            *(["--prefix-cache"] if prefix_cache else []),
+        ],
+        stdout=subprocess.PIPE,
+        text=True
+    )
+    # The server prints one line once it is listening
+    process.stdout.readline()
+    return process
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline throughput benchmark against the stub server.")
+    parser.add_argument("--files", type=int, default=500, help="Number of synthetic filenames")
+    parser.add_argument("--modes", default=",".join(BENCHMARK_MODES), help="Comma-separated modes")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--latency-sigma", type=float, default=0.3)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--prefill-ms-per-1k", type=float, default=0.0, help="Stub latency per 1000 uncached prompt tokens")
+    parser.add_argument("--prefix-cache", action="store_true", help="Stub caches prompt prefixes, as many backends do")
+    parser.add_argument("--output", default=None, help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    stub = start_stub_process(
+        args.port, args.latency_ms, args.latency_sigma, args.error_rate, args.rate_limit_rate,
+        args.prefill_ms_per_1k, args.prefix_cache
+    )
+    base_url = f"http://127.0.0.1:{args.port}/v1"
+    os.environ["BASE_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+
+    try:
+        filenames = generate_filenames(args.files)
+        bins = load_bins()
+        report = [benchmark_mode(mode, filenames, bins, base_url) for mode in args.modes.split(",")]
+    finally:
+        stub.terminate()
+
+    for row in report:
+        print(json.dumps(row))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,135 @@
+import os
+import re
+from typing import Callable, List, Dict, Tuple
+
+# Separators between words in a filename, including camelCase boundaries
+SEPARATOR_PATTERN = re.compile(r"[\s_\-.,;()\[\]{}+&]+|(?<=[a-z])(?=[A-Z])")
+
+MONTH = (
+    r"(?i:jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?"
+    r"|aug(?:ust)?|sep(?:t|tember)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)"
+)
+
+# Start and end of a word: a non-letter or a camelCase boundary
+WORD_START = r"(?:(?<![A-Za-z])|(?<=[a-z])(?=[A-Z]))"
+WORD_END = r"(?:(?![A-Za-z])|(?<=[a-z0-9])(?=[A-Z]))"
+
+# Dates and periods: a month name only next to a day or year, so 'may' or 'mar' alone stay
+DATE_PATTERN = re.compile(
+    WORD_START + r"(?:"
+    r"\d{1,4}[\s_\-.]*" + MONTH + r"(?:[\s_\-.]*\d{2,4})?"          # 15-mar-2023, 15mar
+    r"|" + MONTH + r"[\s_\-.]*\d{1,4}"                               # March_2023, mar15
+    r"|(?i:q[1-4]|fy\d{2,4}|cy\d{2,4})"                            # quarters, fiscal years
+    r")" + WORD_END
+)
+
+# Version suffixes attached to a separator, e.g. '_v2', '-ver1.3' or ' rev4'; a lone 'v' stays
+VERSION_PATTERN = re.compile(r"(?<=[\s_\-.])(?i:v|ver|version|rev)\.?\d+(?:\.\d+)*" + WORD_END)
+
+# Copy markers at the end of the name, e.g. 'report (1)', 'report - Copy' or 'report - Copy (2)'
+COPY_MARKER_PATTERN = re.compile(r"(?:\s*-\s*(?i:copy)(?:\s*\(\d+\))?|\s*\(\d+\))+$")
+
+# Digits glued to words, e.g. 'report2023' or 'inv00123'
+DIGITS_PATTERN = re.compile(r"\d+")
+
+
+def canonicalize_filename(filename: str, ignore_extension: bool = False) -> str:
+    """
+    Reduces a filename to a template without dates, quarters, versions, ids, copy markers,
+    case and separators. Ordinary words are kept, even when they look like a month or a
+    revision, e.g. 'may', 'new' or 'final'.
+
+    For example 'financial_report_Q1.pdf' and 'Financial-Report-Q2.pdf' both become
+    'financial report.pdf'.
+
+    Args:
+        filename (str): Filename to canonicalize.
+        ignore_extension (bool, optional): Drop the extension from the template. Defaults to False.
+
+    Returns:
+        str: The normalized template.
+    """
+    stem, extension = os.path.splitext(os.path.basename(filename))
+
+    # Variable parts become separators, so the words around them stay apart
+    variable = COPY_MARKER_PATTERN.sub("", stem)
+    variable = VERSION_PATTERN.sub(" ", variable)
+    variable = DATE_PATTERN.sub(" ", variable)
+
+    tokens = []
+    for token in SEPARATOR_PATTERN.split(variable):
+        # Drop numbers and digits glued to words, e.g. ids such as 'inv00123'
+        token = DIGITS_PATTERN.sub("", token.lower())
+        if token:
+            tokens.append(token)
+
+    # A name made only of variable parts would collapse into one huge group, so keep it as is
+    template = " ".join(tokens) if tokens else stem.lower()
+
+    if not ignore_extension:
+        template += extension.lower()
+
+    return template
+
+
+def group_by_template(filenames: List[str], ignore_extension: bool = False) -> Dict[str, List[int]]:
+    """
+    Groups filenames by their canonical template.
+
+    Args:
+        filenames (List[str]): Filenames to group.
+        ignore_extension (bool, optional): Ignore extensions when grouping. Defaults to False.
+
+    Returns:
+        Dict[str, List[int]]: Mapping of template to the positions of its members, in input order.
+    """
+    groups: Dict[str, List[int]] = {}
+    for index, filename in enumerate(filenames):
+        groups.setdefault(canonicalize_filename(filename, ignore_extension), []).append(index)
+    return groups
+
+
+def classify_with_dedup(
+    filenames: List[str],
+    labels_dict: Dict[str, str],
+    default_label: str = "Others",
+    classify_fn: Callable[..., List[Dict[str, str]]] = None,
+    ignore_extension: bool = False
+) -> Tuple[List[Dict[str, str]], Dict[str, float]]:
+    """
+    Classifies one representative filename per template and fans its label out to the group.
+
+    Args:
+        filenames (List[str]): List of filenames to classify.
+        labels_dict (Dict[str, str]): Dictionary with labels as keys and descriptions as values.
+        default_label (str, optional): Default label for unmatched filenames. Defaults to "Others".
+        classify_fn (Callable, optional): Function with the signature of work_4.classify_filenames.
+            Defaults to work_4.classify_filenames.
+        ignore_extension (bool, optional): Ignore extensions when grouping. Defaults to False.
+
+    Returns:
+        Tuple[List[Dict[str, str]], Dict[str, float]]: The results in input order, and a report with
+            'filenames', 'groups' and 'compression_ratio'.
+    """
+    if classify_fn is None:
+        from work_4 import classify_filenames as classify_fn
+
+    groups = group_by_template(filenames, ignore_extension)
+
+    # The first member of every group stands for the whole group
+    representatives = [filenames[members[0]] for members in groups.values()]
+    representative_results = classify_fn(representatives, labels_dict, default_label) if representatives else []
+
+    # Copy the representative's label and explanation to every member
+    results: List[Dict[str, str]] = [None] * len(filenames)
+    for members, result in zip(groups.values(), representative_results):
+        for index in members:
+            results[index] = dict(result)
+
+    report = {
+        'filenames': len(filenames),
+        'groups': len(groups),
+        'compression_ratio': len(filenames) / len(groups) if groups else 1.0
+    }
+
+    return results, report
@@ -0,0 +1,218 @@
+import asyncio
+import re
+from typing import List, Dict, Optional, Sequence
+
+from work_4 import create_llm, build_system_prompt, build_chain
+from async_classify import AsyncClassifier, RateLimiter, estimate_tokens
+from retry import RetryPolicy
+
+# Cheapest model first; the last model answers whatever is left
+DEFAULT_CASCADE = ("gpt-3.5-turbo", "gpt-4-32k-0613")
+
+
+class ModelCascade:
+    """
+    Classifies filenames with a cheap model first and escalates uncertain answers.
+
+    An answer of a lower tier is kept only if it is a valid label other than the default one
+    and, when `agreement_samples` > 1, if extra samples drawn at a higher temperature agree
+    with it. Everything else goes to the next tier; the last tier's answers are final.
+    """
+
+    def __init__(
+        self,
+        labels_dict: Dict[str, str],
+        default_label: str = "Others",
+        models: Sequence[str] = DEFAULT_CASCADE,
+        agreement_samples: int = 2,
+        sample_temperature: float = 0.7,
+        escalate_default: bool = True,
+        max_concurrency: int = 16,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        cache=None,
+        metrics=None
+    ):
+        """
+        Args:
+            labels_dict (Dict[str, str]): Dictionary with labels as keys and descriptions as values.
+            default_label (str, optional): Default label for unmatched filenames. Defaults to "Others".
+            models (Sequence[str], optional): Model names from cheapest to most capable.
+                Defaults to ("gpt-3.5-turbo", "gpt-4-32k-0613").
+            agreement_samples (int, optional): Answers a lower tier must agree on, including
+                the deterministic one; 1 disables the check. Defaults to 2.
+            sample_temperature (float, optional): Temperature of the extra samples. Defaults to 0.7.
+            escalate_default (bool, optional): Escalate default-label answers, which also cover
+                labels outside of the list. Defaults to True.
+            max_concurrency (int, optional): Maximum number of requests in flight per tier. Defaults to 16.
+            requests_per_minute (float, optional): Requests-per-minute limit of every model. Defaults to None.
+            tokens_per_minute (float, optional): Tokens-per-minute limit of every model. Defaults to None.
+            cache (ResponseCache, optional): Persistent cache of the deterministic answers. Defaults to None.
+            metrics (Metrics, optional): Instrumentation receiving every request and the tier counters.
+        """
+        if not models:
+            raise ValueError("The cascade needs at least one model")
+        self.labels_dict = dict(labels_dict)
+        self.labels = list(labels_dict.keys())
+        self.default_label = default_label
+        self.models = list(models)
+        self.agreement_samples = agreement_samples
+        self.sample_temperature = sample_temperature
+        self.escalate_default = escalate_default
+        self.max_concurrency = max_concurrency
+        self.cache = cache
+        self.metrics = metrics
+
+        # Same prompt for every tier, so cached prefixes and answers stay comparable
+        self.system_prompt = build_system_prompt(self.labels_dict, default_label)
+        self.rate_limiters = {
+            model: RateLimiter(requests_per_minute, tokens_per_minute) for model in self.models
+        }
+        self.counters = {model: 0 for model in self.models}
+        self.escalations = {model: 0 for model in self.models[:-1]}
+
+    def _engine(self, model_name: str, temperature: float = 0, cached: bool = True) -> AsyncClassifier:
+        # Build the engine of one tier; samples drawn at a temperature are never cached
+        llm = create_llm(model_name, temperature=temperature, max_retries=0)
+        return AsyncClassifier(
+            build_chain(llm, self.system_prompt),
+            self.labels,
+            default_label=self.default_label,
+            max_concurrency=self.max_concurrency,
+            rate_limiter=self.rate_limiters[model_name],
+            prompt_tokens=estimate_tokens(self.system_prompt),
+            cache_scope=self.cache.scope(model_name, self.system_prompt) if cached and self.cache is not None else None,
+            metrics=self.metrics,
+            retry_policy=RetryPolicy()
+        )
+
+    def is_confident(self, result: Dict[str, str], samples: List[Dict[str, str]]) -> bool:
+        """
+        Tells whether a lower-tier answer can be kept.
+
+        Args:
+            result (Dict[str, str]): Deterministic answer of the tier.
+            samples (List[Dict[str, str]]): Extra answers drawn at a higher temperature.
+
+        Returns:
+            bool: True if the answer is valid, not the default label, and agreed on.
+        """
+        if result['label'] == "Error" or result['label'] not in self.labels:
+            return False
+        if self.escalate_default and result['label'] == self.default_label:
+            return False
+        return all(sample['label'] == result['label'] for sample in samples)
+
+    async def aclassify(self, filenames: List[str]) -> List[Dict[str, str]]:
+        """
+        Classifies filenames through the cascade.
+
+        Args:
+            filenames (List[str]): List of filenames to classify.
+
+        Returns:
+            List[Dict[str, str]]: List of dictionaries containing 'label', 'explanation' and
+                'model', the model of the tier that answered.
+        """
+        results: List[Optional[Dict[str, str]]] = [None] * len(filenames)
+        remaining = list(range(len(filenames)))
+
+        for tier, model_name in enumerate(self.models):
+            if not remaining:
+                break
+            last = tier == len(self.models) - 1
+            names = [filenames[index] for index in remaining]
+
+            # Deterministic answer, plus the agreement samples below the last tier
+            runs = [self._engine(model_name).classify(names)]
+            if not last:
+                runs += [
+                    self._engine(model_name, self.sample_temperature, cached=False).classify(names, progress=False)
+                    for _ in range(self.agreement_samples - 1)
+                ]
+            answers, *samples = await asyncio.gather(*runs)
+
+            escalated = []
+            for position, index in enumerate(remaining):
+                result = answers[position]
+                if last or self.is_confident(result, [sample[position] for sample in samples]):
+                    results[index] = {**result, 'model': model_name}
+                else:
+                    escalated.append(index)
+
+            answered = len(remaining) - len(escalated)
+            self.counters[model_name] += answered
+            if not last:
+                self.escalations[model_name] += len(escalated)
+            if self.metrics is not None:
+                # Keep the counter name valid in the Prometheus export
+                self.metrics.increment("tier_" + re.sub(r"\W", "_", model_name), answered)
+                if not last:
+                    self.metrics.increment('escalations', len(escalated))
+            remaining = escalated
+
+        return results
+
+    def classify(self, filenames: List[str]) -> List[Dict[str, str]]:
+        """
+        Synchronous version of aclassify.
+        """
+        return asyncio.run(self.aclassify(filenames))
+
+    def stats(self) -> Dict[str, object]:
+        """
+        Returns the answers per tier and the escalation rate of every lower tier.
+
+        Returns:
+            Dict[str, object]: Dictionary with 'answered' and 'escalation_rate' per model.
+        """
+        rates = {}
+        for model_name, escalated in self.escalations.items():
+            seen = escalated + self.counters[model_name]
+            rates[model_name] = escalated / seen if seen else 0.0
+        return {
+            'answered': dict(self.counters),
+            'escalation_rate': rates
+        }
+
+
+def classify_filenames_cascade(
+    filenames: List[str],
+    labels_dict: Dict[str, str],
+    default_label: str = "Others",
+    **kwargs
+) -> List[Dict[str, str]]:
+    """
+    Drop-in replacement for work_4.classify_filenames using a model cascade.
+
+    Args:
+        filenames (List[str]): List of filenames to classify.
+        labels_dict (Dict[str, str]): Dictionary with labels as keys and descriptions as values.
+        default_label (str, optional): Default label for unmatched filenames. Defaults to "Others".
+        **kwargs: Options of ModelCascade.
+
+    Returns:
+        List[Dict[str, str]]: List of dictionaries containing 'label', 'explanation' and 'model'.
+    """
+    return ModelCascade(labels_dict, default_label, **kwargs).classify(filenames)
+
+
+if __name__ == "__main__":
+    import json
+    from taxonomy import load_bins
+
+    filenames = [
+        "payroll_march.xlsx",
+        "financial_statement_Q3.pdf",
+        "employee_handbook.docx",
+        "system_error_log.txt",
+        "patient_medical_report_2023.xlsx",
+        "insurance_policy_updates.pdf",
+        "random_notes_about_events.txt",
+        "unknown_document.xyz"
+    ]
+
+    cascade = ModelCascade(load_bins())
+    for filename, result in zip(filenames, cascade.classify(filenames)):
+        print(f"{filename}: {result['label']} ({result['model']})")
+    print(json.dumps(cascade.stats(), indent=2))
@@ -0,0 +1,350 @@
+import asyncio
+import functools
+import re
+import zlib
+from typing import List, Dict, Optional, Tuple
+
+from work_4 import create_llm, build_system_prompt, build_chain
+from async_classify import AsyncClassifier, RateLimiter, estimate_tokens
+from retry import RetryPolicy
+from taxonomy_index import index_for_labels
+
+# Words of a label: capitalized words, acronyms and digits ('AdminHR' -> 'Admin', 'HR')
+LABEL_WORD_PATTERN = re.compile(r"[A-Z]+(?![a-z])|[A-Z][a-z]*|[a-z]+|\d+")
+
+# Explanation of a compact answer that is not one of the codes
+UNRECOGNIZED_CODE = "Unrecognized code"
+
+# A code answer is a handful of tokens; cap the completion so the model cannot ramble
+CODE_MAX_TOKENS = 8
+
+
+def assign_codes(labels: List[str]) -> Dict[str, str]:
+    """
+    Gives every label a short code made of the initials of its words.
+
+    'Financial' becomes 'F', 'LegalCompliance' 'LC' and 'AdminHR' 'AH'. Colliding codes are
+    lengthened with the next letters of the label, then numbered.
+
+    Args:
+        labels (List[str]): List of predefined labels.
+
+    Returns:
+        Dict[str, str]: Dictionary with codes as keys and labels as values, in label order.
+    """
+    codes: Dict[str, str] = {}
+    for label in labels:
+        words = LABEL_WORD_PATTERN.findall(label) or [label]
+        code = "".join(word[0] for word in words).upper()
+
+        # Lengthen the code with the rest of the label until it is unique
+        letters = [c.upper() for c in label if c.isalnum()][len(code):]
+        while code in codes and letters:
+            code += letters.pop(0)
+        base, number = code, 2
+        while code in codes:
+            code = f"{base}{number}"
+            number += 1
+
+        codes[code] = label
+    return codes
+
+
+def build_compact_system_prompt(
+    labels_dict: Dict[str, str],
+    codes: Dict[str, str],
+    default_label: str = "Others"
+) -> str:
+    """
+    Renders the system prompt asking for the code of the label only.
+
+    Args:
+        labels_dict (Dict[str, str]): Dictionary with labels as keys and descriptions as values.
+        codes (Dict[str, str]): Dictionary with codes as keys and labels as values.
+        default_label (str, optional): Default label for unmatched filenames. Defaults to "Others".
+
+    Returns:
+        str: The rendered system prompt.
+    """
+    # Prepare the codes, labels and descriptions for the prompt
+    descriptions = [f"{code}: {label} - {labels_dict[label]}" for code, label in codes.items()]
+    codes_with_descriptions = "\n".join(descriptions)
+    default_code = next((code for code, label in codes.items() if label == default_label), default_label)
+
+    # Define the system prompt with instructions for the model
+    return f"""
+You are an expert classifier working with a Medical Insurance company.
+
+Instructions:
+- I will provide a FILENAME and a LIST of predefined categories with their CODES and DESCRIPTIONS.
+- Assign the FILENAME to the most appropriate category from the LIST.
+- Use the DESCRIPTIONS to make the best decision.
+- If the FILENAME does not clearly fit any category, assign it to the default code '{default_code}'.
+- Only choose '{default_code}' if the FILENAME does not fit any other category.
+
+Constraints:
+- Answer with the CODE of the category only, for example '{next(iter(codes))}'.
+- Do not include any explanation or additional text.
+- Do not create new codes.
+
+LIST of CODES, LABELS and DESCRIPTIONS:
+{codes_with_descriptions}
+"""
+
+
+def parse_code(
+    response: str,
+    labels: List[str],
+    default_label: str = "Others",
+    codes: Optional[Dict[str, str]] = None
+) -> Dict[str, str]:
+    """
+    Decodes a code answer back to its label.
+
+    The answer may also be a label name, resolved through the taxonomy index. Anything else
+    is assigned to default_label and explained as an unrecognized code, so that it can be
+    told apart from a real default answer.
+
+    Args:
+        response (str): Raw text returned by the model.
+        labels (List[str]): List of predefined labels.
+        default_label (str, optional): Label used for unrecognized answers. Defaults to "Others".
+        codes (Dict[str, str], optional): Dictionary with codes as keys and labels as values.
+
+    Returns:
+        Dict[str, str]: Dictionary containing 'label' and an empty 'explanation'.
+    """
+    answer = response.strip().strip("'\"`.").strip()
+    codes = codes or {}
+
+    if answer.upper() in codes:
+        return {'label': codes[answer.upper()], 'explanation': ""}
+    resolved = index_for_labels(labels).resolve(answer)
+    if resolved is not None:
+        return {'label': resolved, 'explanation': ""}
+
+    return {
+        'label': default_label,
+        'explanation': f"{UNRECOGNIZED_CODE}: {answer[:50]}"
+    }
+
+
+def needs_explanation(
+    filename: str,
+    result: Dict[str, str],
+    default_label: str = "Others",
+    explain_fraction: float = 0.0,
+    explain_uncertain: bool = True
+) -> bool:
+    """
+    Tells whether a compact result should be re-asked in the full JSON mode.
+
+    The sample is drawn from a hash of the filename, so the same filenames are explained on
+    every run and cached explanations stay valid.
+
+    Args:
+        filename (str): Classified filename.
+        result (Dict[str, str]): Compact result.
+        default_label (str, optional): Default label for unmatched filenames. Defaults to "Others".
+        explain_fraction (float, optional): Fraction of filenames explained at random. Defaults to 0.0.
+        explain_uncertain (bool, optional): Explain default, unrecognized and failed answers. Defaults to True.
+
+    Returns:
+        bool: True if the filename should be explained.
+    """
+    if explain_uncertain and (result['label'] in (default_label, "Error") or result['explanation']):
+        return True
+    return zlib.crc32(filename.encode("utf-8")) % 10000 < explain_fraction * 10000
+
+
+async def classify_filenames_compact_async(
+    filenames: List[str],
+    labels_dict: Dict[str, str],
+    default_label: str = "Others",
+    explain_fraction: float = 0.0,
+    explain_uncertain: bool = True,
+    max_concurrency: int = 16,
+    requests_per_minute: Optional[float] = None,
+    tokens_per_minute: Optional[float] = None,
+    cache=None,
+    metrics=None,
+    explain_metrics=None
+) -> Tuple[List[Dict[str, str]], Dict[str, int]]:
+    """
+    Classifies filenames with code-only answers, and explains only a subset in the full JSON mode.
+
+    Args:
+        filenames (List[str]): List of filenames to classify.
+        labels_dict (Dict[str, str]): Dictionary with labels as keys and descriptions as values.
+        default_label (str, optional): Default label for unmatched filenames. Defaults to "Others".
+        explain_fraction (float, optional): Fraction of filenames explained at random. Defaults to 0.0.
+        explain_uncertain (bool, optional): Explain default, unrecognized and failed answers. Defaults to True.
+        max_concurrency (int, optional): Maximum number of requests in flight. Defaults to 16.
+        requests_per_minute (float, optional): Requests-per-minute limit. Defaults to None.
+        tokens_per_minute (float, optional): Tokens-per-minute limit. Defaults to None.
+        cache (ResponseCache, optional): Persistent cache of previous results. Defaults to None.
+        metrics (Metrics, optional): Instrumentation receiving the code requests. Defaults to None.
+        explain_metrics (Metrics, optional): Instrumentation receiving the explanation requests.
+            Defaults to metrics.
+
+    Returns:
+        Tuple[List[Dict[str, str]], Dict[str, int]]: The results, and the number of 'explained'
+            filenames and of 'disagreements' between both modes.
+    """
+    labels = list(labels_dict.keys())
+    codes = assign_codes(labels)
+    rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+
+    # Code pass: short prompt answers, capped completion
+    compact_prompt = build_compact_system_prompt(labels_dict, codes, default_label)
+    compact_llm = create_llm(max_tokens=CODE_MAX_TOKENS, max_retries=0)
+    compact = AsyncClassifier(
+        build_chain(compact_llm, compact_prompt),
+        labels,
+        default_label=default_label,
+        max_concurrency=max_concurrency,
+        rate_limiter=rate_limiter,
+        prompt_tokens=estimate_tokens(compact_prompt),
+        completion_tokens=CODE_MAX_TOKENS,
+        cache_scope=cache.scope(compact_llm.model_name, compact_prompt) if cache is not None else None,
+        parse_fn=functools.partial(parse_code, codes=codes),
+        metrics=metrics,
+        retry_policy=RetryPolicy()
+    )
+    results = await compact.classify(filenames)
+
+    # Explanation pass: the full JSON prompt, for the selected filenames only
+    selected = [
+        index for index, filename in enumerate(filenames)
+        if needs_explanation(filename, results[index], default_label, explain_fraction, explain_uncertain)
+    ]
+    disagreements = 0
+    if selected:
+        full_prompt = build_system_prompt(labels_dict, default_label)
+        full_llm = create_llm(max_retries=0)
+        full = AsyncClassifier(
+            build_chain(full_llm, full_prompt),
+            labels,
+            default_label=default_label,
+            max_concurrency=max_concurrency,
+            rate_limiter=rate_limiter,
+            prompt_tokens=estimate_tokens(full_prompt),
+            cache_scope=cache.scope(full_llm.model_name, full_prompt) if cache is not None else None,
+            metrics=explain_metrics if explain_metrics is not None else metrics,
+            retry_policy=RetryPolicy()
+        )
+        explained = await full.classify([filenames[index] for index in selected])
+        for index, result in zip(selected, explained):
+            if result['label'] == "Error":
+                continue
+            # The full answer is the better informed one, keep it
+            disagreements += result['label'] != results[index]['label']
+            results[index] = result
+
+    return results, {'explained': len(selected), 'disagreements': disagreements}
+
+
+def classify_filenames_compact(
+    filenames: List[str],
+    labels_dict: Dict[str, str],
+    default_label: str = "Others",
+    **kwargs
+) -> List[Dict[str, str]]:
+    """
+    Drop-in synchronous replacement for work_4.classify_filenames using code-only answers.
+
+    Filenames that are not explained get an empty 'explanation'.
+
+    Args:
+        filenames (List[str]): List of filenames to classify.
+        labels_dict (Dict[str, str]): Dictionary with labels as keys and descriptions as values.
+        default_label (str, optional): Default label for unmatched filenames. Defaults to "Others".
+        **kwargs: Options of classify_filenames_compact_async.
+
+    Returns:
+        List[Dict[str, str]]: List of dictionaries containing 'label' and 'explanation' for each filename.
+    """
+    return asyncio.run(classify_filenames_compact_async(filenames, labels_dict, default_label, **kwargs))[0]
+
+
+def compare_output_modes(
+    filenames: List[str],
+    labels_dict: Dict[str, str],
+    default_label: str = "Others",
+    **kwargs
+) -> Dict[str, Dict[str, float]]:
+    """
+    Classifies the same filenames in the full JSON mode and in the compact mode and reports the savings.
+
+    Args:
+        filenames (List[str]): List of filenames to classify.
+        labels_dict (Dict[str, str]): Dictionary with labels as keys and descriptions as values.
+        default_label (str, optional): Default label for unmatched filenames. Defaults to "Others".
+        **kwargs: Options of classify_filenames_compact_async.
+
+    Returns:
+        Dict[str, Dict[str, float]]: Per-mode mean request latency, completion tokens per file and
+            requests, and the relative 'savings' of the compact mode.
+    """
+    from async_classify import classify_filenames_async
+    from metrics import Metrics
+
+    full_metrics, code_metrics, explain_metrics = Metrics(), Metrics(), Metrics()
+    max_concurrency = kwargs.get('max_concurrency', 16)
+    asyncio.run(classify_filenames_async(
+        filenames, labels_dict, default_label, max_concurrency=max_concurrency, metrics=full_metrics
+    ))
+    _, counts = asyncio.run(classify_filenames_compact_async(
+        filenames, labels_dict, default_label,
+        metrics=code_metrics, explain_metrics=explain_metrics, **kwargs
+    ))
+
+    def summarize(*snapshots) -> Dict[str, float]:
+        requests = sum(s['histograms']['request_seconds']['count'] for s in snapshots)
+        seconds = sum(s['histograms']['request_seconds']['sum'] for s in snapshots)
+        completion = sum(s['histograms']['completion_tokens']['sum'] for s in snapshots)
+        return {
+            'requests': requests,
+            'mean_request_seconds': seconds / requests if requests else 0.0,
+            'request_seconds_per_file': seconds / len(filenames) if filenames else 0.0,
+            'completion_tokens_per_file': completion / len(filenames) if filenames else 0.0
+        }
+
+    full = summarize(full_metrics.snapshot())
+    code_only = summarize(code_metrics.snapshot())
+    compact = summarize(code_metrics.snapshot(), explain_metrics.snapshot())
+
+    def saving(key: str) -> float:
+        return 1.0 - compact[key] / full[key] if full[key] else 0.0
+
+    return {
+        'full': full,
+        'code_only': code_only,
+        'compact': {**compact, **counts},
+        'savings': {
+            'request_seconds': saving('request_seconds_per_file'),
+            'completion_tokens': saving('completion_tokens_per_file')
+        }
+    }
+
+
+if __name__ == "__main__":
+    import json
+    from taxonomy import load_bins
+
+    filenames = [
+        "financial_statement_Q3.pdf",
+        "employee_handbook.docx",
+        "system_error_log.txt",
+        "patient_medical_report_2023.xlsx",
+        "insurance_policy_updates.pdf",
+        "legal_compliance_audit.doc",
+        "random_notes_about_events.txt",
+        "customer_service_feedback.csv",
+        "company_brand_guidelines.pptx",
+        "unknown_document.xyz"
+    ]
+
+    # Compare the compact mode, explaining one filename in ten, with the full JSON mode
+    report = compare_output_modes(filenames, load_bins(), explain_fraction=0.1)
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,293 @@
+import argparse
+import json
+import os
+import sqlite3
+import time
+from typing import Callable, Iterable, Iterator, List, Dict, Optional, Tuple
+
+
+def iter_files(root: str, include_hidden: bool = False, follow_symlinks: bool = False) -> Iterator[os.DirEntry]:
+    """
+    Walks a directory tree with os.scandir, yielding files as they are found.
+
+    Only the directories still to visit are kept in memory, never the whole listing.
+    Directories that cannot be read are skipped.
+
+    Args:
+        root (str): Directory to walk.
+        include_hidden (bool, optional): Include entries whose name starts with '.'. Defaults to False.
+        follow_symlinks (bool, optional): Follow symbolic links to files and directories. Defaults to False.
+
+    Yields:
+        os.DirEntry: Entry of every regular file.
+    """
+    pending = [root]
+    while pending:
+        directory = pending.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if not include_hidden and entry.name.startswith("."):
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=follow_symlinks):
+                            pending.append(entry.path)
+                        elif entry.is_file(follow_symlinks=follow_symlinks):
+                            yield entry
+                    except OSError:
+                        continue
+        except OSError as e:
+            print(f"Error reading directory {directory}: {e}")
+
+
+class FileIndex:
+    """
+    Persistent SQLite index of the files already classified.
+
+    Every file is stored with its inode, modification time and size, so a later crawl can tell
+    new and modified files from unchanged ones without reading them, and recognize a moved file
+    by its inode. Files whose classification failed are stored labelled "Error" but count as
+    pending: lookups ignore them, so the next crawl classifies them again.
+    """
+
+    def __init__(self, path: str = "file_index.sqlite"):
+        """
+        Args:
+            path (str, optional): Path of the SQLite database. Defaults to "file_index.sqlite".
+        """
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, inode INTEGER, mtime_ns INTEGER, size INTEGER, "
+            "label TEXT, explanation TEXT, crawl INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS files_inode ON files (inode)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS files_crawl ON files (crawl)")
+
+    def last_crawl(self) -> int:
+        """
+        Returns the number of the last crawl recorded, 0 if none.
+        """
+        return self._conn.execute("SELECT COALESCE(MAX(crawl), 0) FROM files").fetchone()[0]
+
+    def lookup(self, path: str) -> Optional[Tuple[int, int, int]]:
+        """
+        Returns the (inode, mtime_ns, size) recorded for a path, or None if the path is not
+        indexed or its classification failed.
+        """
+        return self._conn.execute(
+            "SELECT inode, mtime_ns, size FROM files WHERE path = ? AND label != 'Error'", (path,)
+        ).fetchone()
+
+    def find_moved(self, inode: int, mtime_ns: int, size: int, name: str) -> Optional[Dict[str, str]]:
+        """
+        Returns the result of an indexed file with the same inode, timestamps, size and name, if any.
+        """
+        for path, label, explanation in self._conn.execute(
+            "SELECT path, label, explanation FROM files "
+            "WHERE inode = ? AND mtime_ns = ? AND size = ? AND label != 'Error'",
+            (inode, mtime_ns, size)
+        ):
+            if os.path.basename(path) == name:
+                return {'label': label, 'explanation': explanation}
+        return None
+
+    def touch(self, paths: List[str], crawl: int) -> None:
+        """
+        Marks unchanged files as seen by a crawl.
+        """
+        self._conn.execute("BEGIN")
+        self._conn.executemany("UPDATE files SET crawl = ? WHERE path = ?", [(crawl, path) for path in paths])
+        self._conn.execute("COMMIT")
+
+    def record(self, rows: List[Tuple[str, int, int, int, Dict[str, str]]], crawl: int) -> None:
+        """
+        Stores classified files as (path, inode, mtime_ns, size, result) rows.
+        """
+        self._conn.execute("BEGIN")
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO files (path, inode, mtime_ns, size, label, explanation, crawl) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (path, inode, mtime_ns, size, result['label'], result['explanation'], crawl)
+                for path, inode, mtime_ns, size, result in rows
+            ]
+        )
+        self._conn.execute("COMMIT")
+
+    def remove_unseen(self, crawl: int, roots: Iterable[str]) -> int:
+        """
+        Removes the files under the crawled roots that the crawl did not see.
+
+        Returns:
+            int: Number of files removed.
+        """
+        removed = 0
+        self._conn.execute("BEGIN")
+        for root in roots:
+            prefix = os.path.join(root, "")
+            removed += self._conn.execute(
+                "DELETE FROM files WHERE crawl < ? AND substr(path, 1, ?) = ?",
+                (crawl, len(prefix), prefix)
+            ).rowcount
+        self._conn.execute("COMMIT")
+        return removed
+
+    def results(self) -> Iterator[Tuple[str, str, str]]:
+        """
+        Yields (path, label, explanation) of every indexed file.
+        """
+        yield from self._conn.execute("SELECT path, label, explanation FROM files ORDER BY path")
+
+    def close(self) -> None:
+        """
+        Closes the database connection.
+        """
+        self._conn.close()
+
+
+def crawl_and_classify(
+    roots: List[str],
+    index: FileIndex,
+    classify_fn: Callable[[List[str]], List[Dict[str, str]]],
+    chunk_size: int = 1000,
+    include_hidden: bool = False
+) -> Dict[str, int]:
+    """
+    Crawls directory trees and classifies only the files that are new or modified.
+
+    Files are streamed from os.scandir and classified by their name in chunks of
+    `chunk_size`, so the listing is never held in memory. A file whose inode, modification
+    time and size are unchanged keeps its label; a moved file keeps the label of its previous
+    path. Files that disappeared are removed from the index. Files labelled "Error", e.g.
+    after a rate limit, are recorded as such and classified again by the next crawl.
+
+    Args:
+        roots (List[str]): Directories to crawl.
+        index (FileIndex): Persistent index of the files already classified.
+        classify_fn (Callable): Function classifying a list of filenames.
+        chunk_size (int, optional): Number of files per classification call. Defaults to 1000.
+        include_hidden (bool, optional): Include hidden files and directories. Defaults to False.
+
+    Returns:
+        Dict[str, int]: Number of files 'seen', 'classified', 'failed', 'moved', 'unchanged' and
+            'removed', and the 'seconds' the crawl took.
+    """
+    started = time.perf_counter()
+    roots = [os.path.abspath(root) for root in roots]
+    crawl = index.last_crawl() + 1
+    counts = {'seen': 0, 'classified': 0, 'failed': 0, 'moved': 0, 'unchanged': 0, 'removed': 0}
+
+    pending: List[Tuple[str, int, int, int, str]] = []
+    moved: List[Tuple[str, int, int, int, Dict[str, str]]] = []
+    unchanged: List[str] = []
+
+    def flush() -> None:
+        # Classify the pending names and record everything gathered so far
+        if pending:
+            results = classify_fn([name for *_, name in pending])
+            index.record([row[:4] + (result,) for row, result in zip(pending, results)], crawl)
+            counts['classified'] += len(pending)
+            counts['failed'] += sum(1 for result in results if result['label'] == "Error")
+            pending.clear()
+        if moved:
+            index.record(moved, crawl)
+            counts['moved'] += len(moved)
+            moved.clear()
+        if unchanged:
+            index.touch(unchanged, crawl)
+            counts['unchanged'] += len(unchanged)
+            unchanged.clear()
+
+    for root in roots:
+        for entry in iter_files(root, include_hidden):
+            try:
+                stat = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            counts['seen'] += 1
+            key = (entry.inode(), stat.st_mtime_ns, stat.st_size)
+
+            if index.lookup(entry.path) == key:
+                unchanged.append(entry.path)
+            else:
+                previous = index.find_moved(*key, entry.name)
+                if previous is not None:
+                    moved.append((entry.path, *key, previous))
+                else:
+                    pending.append((entry.path, *key, entry.name))
+
+            if len(pending) >= chunk_size or len(unchanged) >= 10 * chunk_size:
+                flush()
+
+    flush()
+    counts['removed'] = index.remove_unseen(crawl, roots)
+    counts['seconds'] = round(time.perf_counter() - started, 3)
+    return counts
+
+
+def watch(
+    roots: List[str],
+    index: FileIndex,
+    classify_fn: Callable[[List[str]], List[Dict[str, str]]],
+    interval: float = 60.0,
+    chunk_size: int = 1000,
+    max_crawls: Optional[int] = None
+) -> None:
+    """
+    Crawls the roots every `interval` seconds, classifying only new and modified files.
+
+    Args:
+        roots (List[str]): Directories to crawl.
+        index (FileIndex): Persistent index of the files already classified.
+        classify_fn (Callable): Function classifying a list of filenames.
+        interval (float, optional): Seconds between the start of two crawls. Defaults to 60.0.
+        chunk_size (int, optional): Number of files per classification call. Defaults to 1000.
+        max_crawls (int, optional): Stop after this many crawls; run forever if None. Defaults to None.
+    """
+    crawls = 0
+    while max_crawls is None or crawls < max_crawls:
+        started = time.monotonic()
+        print(json.dumps(crawl_and_classify(roots, index, classify_fn, chunk_size)), flush=True)
+        crawls += 1
+        if max_crawls is None or crawls < max_crawls:
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+
+if __name__ == "__main__":
+    import csv
+    import sys
+    from taxonomy import load_bins
+
+    parser = argparse.ArgumentParser(description="Classify the files of directory trees, skipping files already classified.")
+    parser.add_argument("roots", nargs="+", help="Directories to crawl")
+    parser.add_argument("--index", default="file_index.sqlite", help="Persistent file index")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Files per classification call")
+    parser.add_argument("--watch", action="store_true", help="Keep polling for new files")
+    parser.add_argument("--interval", type=float, default=60.0, help="Seconds between crawls in watch mode")
+    parser.add_argument("--export", default=None, help="Write every indexed result to this CSV file ('-' for stdout)")
+    args = parser.parse_args()
+
+    from filename_classifier import FilenameClassifier
+
+    classifier = FilenameClassifier(load_bins())
+    file_index = FileIndex(args.index)
+    try:
+        if args.watch:
+            watch(args.roots, file_index, classifier.classify, args.interval, args.chunk_size)
+        else:
+            print(json.dumps(crawl_and_classify(args.roots, file_index, classifier.classify, args.chunk_size)))
+
+        if args.export:
+            output = sys.stdout if args.export == "-" else open(args.export, "w", newline="", encoding="utf-8")
+            writer = csv.writer(output)
+            writer.writerow(["path", "LLM_label", "Explanation"])
+            writer.writerows(file_index.results())
+            if output is not sys.stdout:
+                output.close()
+    finally:
+        file_index.close()
+        classifier.close()
@@ -0,0 +1,131 @@
+import asyncio
+from typing import List, Dict
+
+
+def build_refinement_prompt(label: str, old_description: str, filenames: List[str]) -> str:
+    """
+    Renders the prompt that rewrites a label description from several new filenames.
+
+    Args:
+        label (str): The label to update.
+        old_description (str): The current description of the label.
+        filenames (List[str]): Filenames assigned to the label since its last update.
+
+    Returns:
+        str: The rendered prompt.
+    """
+    examples = "\n".join(f"- {filename}" for filename in filenames)
+
+    return f"""
+You are an assistant helping to update the description of a category.
+
+Current LABEL: {label}
+Current DESCRIPTION: {old_description}
+
+The following FILENAMES have been assigned to this LABEL:
+{examples}
+
+Instructions:
+- Update the DESCRIPTION to include relevant information implied by the FILENAMES.
+- Make the DESCRIPTION concise and informative.
+- Do not mention the FILENAMES directly.
+- Ensure the DESCRIPTION accurately reflects all types of files assigned to this LABEL.
+
+Constraints:
+- Your response should be only the updated DESCRIPTION.
+"""
+
+
+class DescriptionRefiner:
+    """
+    Accumulates the filenames assigned to each label and rewrites descriptions in batches.
+
+    Instead of one extra LLM call per classified filename, each label's description is
+    rewritten with a single call once `refine_every` new filenames have been recorded for
+    it, or for every label with pending filenames on the final refresh.
+
+    Versioning rule: descriptions only change inside refresh(). Callers take a snapshot of
+    labels_dict when they build a prompt and keep it for a whole chunk; every refresh that
+    rewrites at least one description increments `version`, and the next chunk picks up the
+    new descriptions.
+    """
+
+    def __init__(self, llm, labels_dict: Dict[str, str], refine_every: int = 20, max_examples: int = 50):
+        """
+        Args:
+            llm: The language model instance.
+            labels_dict (Dict[str, str]): Dictionary with labels as keys and descriptions as values;
+                updated in place.
+            refine_every (int, optional): Pending filenames that trigger a rewrite of a label. Defaults to 20.
+            max_examples (int, optional): Maximum filenames shown in one rewrite prompt. Defaults to 50.
+        """
+        self.llm = llm
+        self.labels_dict = labels_dict
+        self.refine_every = refine_every
+        self.max_examples = max_examples
+        self.version = 0
+        self.calls = 0
+        self.pending: Dict[str, List[str]] = {}
+
+    def snapshot(self) -> Dict[str, str]:
+        """
+        Returns a copy of the current descriptions, to build the prompts of the next chunk.
+
+        Returns:
+            Dict[str, str]: Dictionary with labels as keys and descriptions as values.
+        """
+        return dict(self.labels_dict)
+
+    def record(self, label: str, filename: str) -> None:
+        """
+        Records that a filename was assigned to a label.
+
+        Args:
+            label (str): The assigned label.
+            filename (str): The classified filename.
+        """
+        if label in self.labels_dict:
+            self.pending.setdefault(label, []).append(filename)
+
+    async def _refine(self, label: str) -> None:
+        filenames = self.pending.pop(label)[-self.max_examples:]
+        prompt = build_refinement_prompt(label, self.labels_dict[label], filenames)
+        self.calls += 1
+        try:
+            self.labels_dict[label] = (await self.llm.apredict(prompt)).strip()
+        except Exception as e:
+            # Keep the previous description if the rewrite fails
+            print(f"Error updating description of label {label}: {e}")
+
+    async def arefresh(self, final: bool = False) -> bool:
+        """
+        Rewrites the descriptions of the labels that are due, one call per label, concurrently.
+
+        Args:
+            final (bool, optional): Rewrite every label with pending filenames. Defaults to False.
+
+        Returns:
+            bool: True if at least one description changed.
+        """
+        due = [
+            label for label, filenames in self.pending.items()
+            if final or len(filenames) >= self.refine_every
+        ]
+        if not due:
+            return False
+
+        await asyncio.gather(*(self._refine(label) for label in due))
+        self.version += 1
+        return True
+
+    def refresh(self, final: bool = False) -> bool:
+        """
+        Synchronous version of arefresh.
+
+        Args:
+            final (bool, optional): Rewrite every label with pending filenames. Defaults to False.
+
+        Returns:
+            bool: True if at least one description changed.
+        """
+        return asyncio.run(self.arefresh(final))
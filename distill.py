@@ -0,0 +1,501 @@
+import csv
+import json
+import os
+import sqlite3
+import zlib
+from typing import Callable, Iterator, List, Dict, Optional, Tuple
+
+import numpy as np
+
+from canonicalize import DIGITS_PATTERN
+
+# Character n-grams hashed into a fixed number of features
+NGRAM_RANGE = (2, 4)
+N_FEATURES = 2 ** 18
+
+# Bounds of the n-gram hash memo and of the held-out examples kept for evaluation
+MAX_MEMO_ENTRIES = 1000000
+MAX_HOLDOUT = 20000
+
+# Filenames scored at once
+PREDICT_BATCH_SIZE = 4096
+
+# Temperatures tried when calibrating the confidence
+TEMPERATURES = np.geomspace(0.25, 500.0, 80)
+
+
+def filename_ngrams(filename: str, ngram_range: Tuple[int, int] = NGRAM_RANGE) -> List[str]:
+    """
+    Returns the character n-grams of a lowercased filename, with digits collapsed to '0'.
+
+    Args:
+        filename (str): Filename to featurize.
+        ngram_range (Tuple[int, int], optional): Smallest and largest n. Defaults to (2, 4).
+
+    Returns:
+        List[str]: The n-grams, padded with spaces so that the start and end of the name count.
+    """
+    text = f" {DIGITS_PATTERN.sub('0', filename.lower())} "
+    return [
+        text[i:i + n]
+        for n in range(ngram_range[0], ngram_range[1] + 1)
+        for i in range(len(text) - n + 1)
+    ]
+
+
+class NgramHasher:
+    """
+    Maps filenames to sparse rows of hashed character n-gram counts (CSR indices and indptr).
+    """
+
+    def __init__(self, n_features: int = N_FEATURES, ngram_range: Tuple[int, int] = NGRAM_RANGE):
+        """
+        Args:
+            n_features (int, optional): Number of hashed features, a power of two. Defaults to 2**18.
+            ngram_range (Tuple[int, int], optional): Smallest and largest n. Defaults to (2, 4).
+        """
+        self.n_features = n_features
+        self.ngram_range = ngram_range
+        self._memo: Dict[str, int] = {}
+
+    def _hash(self, gram: str) -> int:
+        index = self._memo.get(gram)
+        if index is None:
+            index = zlib.crc32(gram.encode("utf-8")) % self.n_features
+            if len(self._memo) < MAX_MEMO_ENTRIES:
+                self._memo[gram] = index
+        return index
+
+    def transform(self, filenames: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Hashes filenames into sparse rows.
+
+        Args:
+            filenames (List[str]): Filenames to featurize.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Feature indices of all rows, and the offsets of every
+                row in them (length len(filenames) + 1). Every row has at least one feature.
+        """
+        indices: List[int] = []
+        indptr = np.zeros(len(filenames) + 1, dtype=np.int64)
+        for row, filename in enumerate(filenames):
+            indices.extend(self._hash(gram) for gram in filename_ngrams(filename, self.ngram_range))
+            indptr[row + 1] = len(indices)
+        return np.asarray(indices, dtype=np.int64), indptr
+
+
+class DistilledClassifier:
+    """
+    Multinomial naive Bayes over hashed character n-grams, trained on labels of the LLM.
+
+    Training only adds counts, so new labels can be folded in at any time. A deterministic
+    share of the examples (by filename hash) is held out to measure the agreement with the LLM
+    and to calibrate the confidence by temperature scaling of the posteriors.
+    """
+
+    def __init__(
+        self,
+        n_features: int = N_FEATURES,
+        ngram_range: Tuple[int, int] = NGRAM_RANGE,
+        alpha: float = 0.1,
+        holdout_percent: int = 10
+    ):
+        """
+        Args:
+            n_features (int, optional): Number of hashed features. Defaults to 2**18.
+            ngram_range (Tuple[int, int], optional): Smallest and largest n. Defaults to (2, 4).
+            alpha (float, optional): Additive smoothing of the n-gram counts. Defaults to 0.1.
+            holdout_percent (int, optional): Percentage of filenames held out. Defaults to 10.
+        """
+        self.hasher = NgramHasher(n_features, ngram_range)
+        self.alpha = alpha
+        self.holdout_percent = holdout_percent
+        self.labels: List[str] = []
+        self.class_index: Dict[str, int] = {}
+        self.feature_counts = np.zeros((0, n_features), dtype=np.float32)
+        self.class_counts = np.zeros(0, dtype=np.float64)
+        self.temperature = 1.0
+        self.holdout: Dict[str, str] = {}
+        self._weights: Optional[np.ndarray] = None
+        self._prior: Optional[np.ndarray] = None
+
+    @property
+    def trained(self) -> bool:
+        """
+        True once the model has seen at least two labels.
+        """
+        return len(self.labels) > 1
+
+    def is_holdout(self, filename: str) -> bool:
+        """
+        Tells whether a filename belongs to the held-out share.
+        """
+        return zlib.crc32(filename.encode("utf-8")) % 100 < self.holdout_percent
+
+    def _class_ids(self, labels: List[str]) -> np.ndarray:
+        # Add rows for labels seen for the first time
+        for label in labels:
+            if label not in self.class_index:
+                self.class_index[label] = len(self.labels)
+                self.labels.append(label)
+        missing = len(self.labels) - len(self.class_counts)
+        if missing:
+            self._weights = None
+            self.feature_counts = np.vstack([
+                self.feature_counts, np.zeros((missing, self.hasher.n_features), dtype=np.float32)
+            ])
+            self.class_counts = np.concatenate([self.class_counts, np.zeros(missing)])
+        return np.fromiter((self.class_index[label] for label in labels), dtype=np.int64, count=len(labels))
+
+    def partial_fit(self, filenames: List[str], labels: List[str]) -> int:
+        """
+        Adds labeled filenames to the model; 'Error' results are ignored.
+
+        Args:
+            filenames (List[str]): Filenames labeled by the LLM.
+            labels (List[str]): Their labels.
+
+        Returns:
+            int: Number of examples used for training (held-out ones excluded).
+        """
+        train_names, train_labels = [], []
+        for filename, label in zip(filenames, labels):
+            if label == "Error":
+                continue
+            if self.is_holdout(filename):
+                if filename in self.holdout or len(self.holdout) < MAX_HOLDOUT:
+                    self.holdout[filename] = label
+            else:
+                train_names.append(filename)
+                train_labels.append(label)
+
+        # Register held-out labels too, so that they can be predicted and scored
+        self._class_ids(list(dict.fromkeys(self.holdout.values())))
+        if not train_names:
+            return 0
+
+        class_ids = self._class_ids(train_labels)
+        indices, indptr = self.hasher.transform(train_names)
+        rows = np.repeat(class_ids, np.diff(indptr))
+        np.add.at(self.feature_counts, (rows, indices), 1.0)
+        np.add.at(self.class_counts, class_ids, 1.0)
+        self._weights = None
+        return len(train_names)
+
+    def _scores(self, filenames: List[str]) -> np.ndarray:
+        # Log joint likelihood of every class, shape (classes, filenames)
+        if self._weights is None:
+            smoothed = self.feature_counts + self.alpha
+            self._weights = np.log(smoothed / smoothed.sum(axis=1, keepdims=True)).astype(np.float32)
+            self._prior = np.log((self.class_counts + 1.0) / (self.class_counts.sum() + len(self.labels)))
+        # Gather the weights in slices so that the dense (classes, n-grams) block stays small
+        scores = np.empty((len(self.labels), len(filenames)), dtype=np.float64)
+        for start in range(0, len(filenames), PREDICT_BATCH_SIZE):
+            indices, indptr = self.hasher.transform(filenames[start:start + PREDICT_BATCH_SIZE])
+            scores[:, start:start + len(indptr) - 1] = np.add.reduceat(self._weights[:, indices], indptr[:-1], axis=1)
+        return scores + self._prior[:, None]
+
+    def _posteriors(self, scores: np.ndarray, temperature: float) -> np.ndarray:
+        scaled = scores / temperature
+        scaled -= scaled.max(axis=0, keepdims=True)
+        exp = np.exp(scaled)
+        return exp / exp.sum(axis=0, keepdims=True)
+
+    def predict_proba(self, filenames: List[str]) -> Tuple[List[str], np.ndarray]:
+        """
+        Predicts a label and a calibrated confidence for every filename.
+
+        Args:
+            filenames (List[str]): Filenames to classify.
+
+        Returns:
+            Tuple[List[str], np.ndarray]: The labels, and their confidence between 0 and 1.
+        """
+        if not filenames or not self.trained:
+            return [self.labels[0] if self.labels else ""] * len(filenames), np.zeros(len(filenames))
+        posteriors = self._posteriors(self._scores(filenames), self.temperature)
+        best = posteriors.argmax(axis=0)
+        return [self.labels[i] for i in best], posteriors[best, np.arange(len(filenames))]
+
+    def calibrate(self) -> float:
+        """
+        Picks the temperature minimizing the negative log-likelihood of the held-out labels.
+
+        Returns:
+            float: The temperature.
+        """
+        if not self.holdout or not self.trained:
+            return self.temperature
+        names = list(self.holdout)
+        truth = np.fromiter((self.class_index[self.holdout[name]] for name in names), dtype=np.int64, count=len(names))
+        scores = self._scores(names)
+        columns = np.arange(len(names))
+
+        losses = [
+            -np.log(self._posteriors(scores, t)[truth, columns] + 1e-12).mean() for t in TEMPERATURES
+        ]
+        self.temperature = float(TEMPERATURES[int(np.argmin(losses))])
+        return self.temperature
+
+    def threshold_for(self, target_agreement: float = 0.97) -> float:
+        """
+        Returns the lowest confidence threshold at which held-out predictions above it still
+        agree with the LLM at the target rate, which maximizes the share answered locally.
+
+        Args:
+            target_agreement (float, optional): Required agreement with the LLM. Defaults to 0.97.
+
+        Returns:
+            float: The threshold; above 1 if no threshold reaches the target.
+        """
+        if not self.holdout or not self.trained:
+            return 1.01
+        names = list(self.holdout)
+        predicted, confidence = self.predict_proba(names)
+        order = np.argsort(-confidence)
+        correct = np.fromiter(
+            (predicted[i] == self.holdout[names[i]] for i in order), dtype=np.float64, count=len(names)
+        )
+        agreement = np.cumsum(correct) / np.arange(1, len(names) + 1)
+        reached = np.nonzero(agreement >= target_agreement)[0]
+        return float(confidence[order][reached[-1]]) if len(reached) else 1.01
+
+    def evaluate(self, threshold: Optional[float] = None) -> Dict[str, float]:
+        """
+        Measures the agreement with the LLM on the held-out filenames.
+
+        Args:
+            threshold (float, optional): Confidence threshold of the router. Defaults to None.
+
+        Returns:
+            Dict[str, float]: 'holdout' size, overall 'agreement', 'expected_calibration_error',
+                and with a threshold the 'coverage' above it and the 'agreement_above_threshold'.
+        """
+        if not self.holdout or not self.trained:
+            return {'holdout': len(self.holdout), 'agreement': 0.0}
+        names = list(self.holdout)
+        predicted, confidence = self.predict_proba(names)
+        correct = np.fromiter(
+            (label == self.holdout[name] for name, label in zip(names, predicted)), dtype=np.float64, count=len(names)
+        )
+
+        # Gap between confidence and accuracy, averaged over ten confidence bins
+        bins = np.minimum((confidence * 10).astype(np.int64), 9)
+        calibration_error = sum(
+            abs(correct[bins == b].mean() - confidence[bins == b].mean()) * (bins == b).mean()
+            for b in range(10) if (bins == b).any()
+        )
+
+        report = {
+            'holdout': len(names),
+            'agreement': float(correct.mean()),
+            'expected_calibration_error': float(calibration_error),
+            'temperature': self.temperature
+        }
+        if threshold is not None:
+            above = confidence >= threshold
+            report['coverage'] = float(above.mean())
+            report['agreement_above_threshold'] = float(correct[above].mean()) if above.any() else 0.0
+        return report
+
+    def save(self, path: str) -> None:
+        """
+        Saves the model to a .npz file.
+        """
+        np.savez_compressed(
+            path,
+            feature_counts=self.feature_counts,
+            class_counts=self.class_counts,
+            meta=np.array(json.dumps({
+                'labels': self.labels,
+                'n_features': self.hasher.n_features,
+                'ngram_range': list(self.hasher.ngram_range),
+                'alpha': self.alpha,
+                'holdout_percent': self.holdout_percent,
+                'temperature': self.temperature,
+                'holdout': self.holdout
+            }))
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "DistilledClassifier":
+        """
+        Loads a model saved with save().
+        """
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            model = cls(meta['n_features'], tuple(meta['ngram_range']), meta['alpha'], meta['holdout_percent'])
+            model.feature_counts = data['feature_counts']
+            model.class_counts = data['class_counts']
+        model.labels = meta['labels']
+        model.class_index = {label: i for i, label in enumerate(model.labels)}
+        model.temperature = meta['temperature']
+        model.holdout = meta['holdout']
+        return model
+
+
+def iter_training_pairs(path: str) -> Iterator[Tuple[str, str]]:
+    """
+    Reads (filename, label) pairs labeled by the LLM.
+
+    Args:
+        path (str): Output CSV of stream_pipeline.py, or SQLite file index of crawler.py.
+
+    Yields:
+        Tuple[str, str]: Filename and label.
+    """
+    if path.endswith(".sqlite"):
+        connection = sqlite3.connect(path)
+        try:
+            for file_path, label in connection.execute("SELECT path, label FROM files"):
+                yield os.path.basename(file_path), label
+        finally:
+            connection.close()
+    else:
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                yield row["file names"], row["LLM_label"]
+
+
+class DistilledRouter:
+    """
+    Answers confident filenames with the distilled model and sends the rest to the LLM.
+
+    The LLM answers are folded back into the model as they arrive; the calibration and the
+    threshold are refreshed every `recalibrate_every` new examples.
+    """
+
+    def __init__(
+        self,
+        model: DistilledClassifier,
+        classify_fn: Callable[..., List[Dict[str, str]]] = None,
+        target_agreement: float = 0.97,
+        threshold: Optional[float] = None,
+        recalibrate_every: int = 1000,
+        metrics=None
+    ):
+        """
+        Args:
+            model (DistilledClassifier): The local model.
+            classify_fn (Callable, optional): Function with the signature of work_4.classify_filenames
+                used for uncertain filenames. Defaults to async_classify.classify_filenames_concurrent.
+            target_agreement (float, optional): Held-out agreement the threshold is tuned for. Defaults to 0.97.
+            threshold (float, optional): Fixed confidence threshold instead of a tuned one. Defaults to None.
+            recalibrate_every (int, optional): New LLM labels between recalibrations. Defaults to 1000.
+            metrics (Metrics, optional): Instrumentation receiving the 'tier_local' and 'tier_llm' counters.
+        """
+        if classify_fn is None:
+            from async_classify import classify_filenames_concurrent as classify_fn
+        self.model = model
+        self.classify_fn = classify_fn
+        self.target_agreement = target_agreement
+        self.fixed_threshold = threshold
+        self.recalibrate_every = recalibrate_every
+        self.metrics = metrics
+        self.counters = {'local': 0, 'llm': 0}
+        self._since_calibration = 0
+        self.recalibrate()
+
+    def recalibrate(self) -> None:
+        """
+        Refits the temperature and the threshold on the held-out filenames.
+        """
+        self.model.calibrate()
+        self.threshold = (
+            self.fixed_threshold if self.fixed_threshold is not None
+            else self.model.threshold_for(self.target_agreement)
+        )
+        self._since_calibration = 0
+
+    def classify(
+        self,
+        filenames: List[str],
+        labels_dict: Dict[str, str],
+        default_label: str = "Others"
+    ) -> List[Dict[str, str]]:
+        """
+        Classifies filenames, calling the LLM only below the confidence threshold.
+
+        Args:
+            filenames (List[str]): List of filenames to classify.
+            labels_dict (Dict[str, str]): Dictionary with labels as keys and descriptions as values.
+            default_label (str, optional): Default label for unmatched filenames. Defaults to "Others".
+
+        Returns:
+            List[Dict[str, str]]: List of dictionaries containing 'label' and 'explanation' for each filename.
+        """
+        predicted, confidence = self.model.predict_proba(filenames)
+        results: List[Optional[Dict[str, str]]] = [None] * len(filenames)
+        remaining = []
+        for index, (label, score) in enumerate(zip(predicted, confidence)):
+            if label in labels_dict and score >= self.threshold:
+                results[index] = {
+                    'label': label,
+                    'explanation': f"Distilled model, confidence {score:.2f}."
+                }
+            else:
+                remaining.append(index)
+
+        self.counters['local'] += len(filenames) - len(remaining)
+        self.counters['llm'] += len(remaining)
+        if self.metrics is not None:
+            self.metrics.increment('tier_local', len(filenames) - len(remaining))
+            self.metrics.increment('tier_llm', len(remaining))
+
+        if remaining:
+            names = [filenames[i] for i in remaining]
+            llm_results = self.classify_fn(names, labels_dict, default_label)
+            for index, result in zip(remaining, llm_results):
+                results[index] = result
+
+            # Learn from the new LLM labels
+            self._since_calibration += self.model.partial_fit(names, [result['label'] for result in llm_results])
+            if self._since_calibration >= self.recalibrate_every:
+                self.recalibrate()
+
+        return results
+
+    def stats(self) -> Dict[str, object]:
+        """
+        Returns the per-tier counters, the local fraction and the held-out evaluation.
+        """
+        total = self.counters['local'] + self.counters['llm']
+        return {
+            **self.counters,
+            'local_fraction': self.counters['local'] / total if total else 0.0,
+            'threshold': self.threshold,
+            'evaluation': self.model.evaluate(self.threshold)
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Train the distilled classifier on labels of the LLM.")
+    parser.add_argument("sources", nargs="+", help="Output CSV files of stream_pipeline.py or crawler.py indexes")
+    parser.add_argument("--model", default="distilled_model.npz", help="Model file to write")
+    parser.add_argument("--target-agreement", type=float, default=0.97)
+    args = parser.parse_args()
+
+    # Refit from scratch on every run, so training twice on the same sources gives the same model;
+    # a filename present in several sources is counted once, with its last label
+    pairs: Dict[str, str] = {}
+    for source in args.sources:
+        pairs.update(iter_training_pairs(source))
+    model = DistilledClassifier()
+    model.partial_fit(list(pairs), list(pairs.values()))
+    model.calibrate()
+    model.save(args.model)
+
+    threshold = model.threshold_for(args.target_agreement)
+    report = model.evaluate(threshold)
+
+    # Measure the in-process prediction throughput on the held-out filenames
+    names = list(model.holdout) or ["sample.pdf"]
+    started = time.perf_counter()
+    model.predict_proba(names)
+    report['threshold'] = threshold
+    report['files_per_sec'] = len(names) / (time.perf_counter() - started)
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,212 @@
+import asyncio
+import logging
+import os
+import subprocess
+import sys
+import threading
+from typing import List, Dict, Optional
+
+from work_4 import create_llm, build_system_prompt, build_chain
+from async_classify import AsyncClassifier, RateLimiter, estimate_tokens
+from retry import AdaptiveConcurrency, RetryPolicy
+
+# Modules that must not be imported when this module is imported
+HEAVY_MODULES = ("langchain", "pandas", "tqdm", "openai", "numpy")
+
+
+class FilenameClassifier:
+    """
+    Long-lived classifier that builds the model, prompt and chain once.
+
+    The system prompt is rendered in the constructor, while the ChatOpenAI client and the
+    chain are created on first use, so constructing the object is cheap. The same client,
+    and therefore its HTTP connection pool, serves every later call. Asynchronous work runs
+    on an event loop owned by the object, which keeps pooled async connections valid
+    between calls.
+    """
+
+    def __init__(
+        self,
+        labels_dict: Dict[str, str],
+        default_label: str = "Others",
+        model_name: str = "gpt-4-32k-0613",
+        max_concurrency: int = 16,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        cache=None,
+        metrics=None,
+        max_attempts: int = 6,
+        adaptive_concurrency: bool = False,
+        rate_limiter: Optional[RateLimiter] = None,
+        stable_prompt: bool = False,
+        **llm_kwargs
+    ):
+        """
+        Args:
+            labels_dict (Dict[str, str]): Dictionary with labels as keys and descriptions as values.
+            default_label (str, optional): Default label for unmatched filenames. Defaults to "Others".
+            model_name (str, optional): Name of the OpenAI model. Defaults to "gpt-4-32k-0613".
+            max_concurrency (int, optional): Maximum number of requests in flight. Defaults to 16.
+            requests_per_minute (float, optional): Requests-per-minute limit. Defaults to None.
+            tokens_per_minute (float, optional): Tokens-per-minute limit. Defaults to None.
+            cache (ResponseCache, optional): Persistent cache of previous results. Defaults to None.
+            metrics (Metrics, optional): Instrumentation receiving every request. Defaults to None.
+            max_attempts (int, optional): Attempts per filename with jittered backoff on retryable errors. Defaults to 6.
+            adaptive_concurrency (bool, optional): Adapt the requests in flight (AIMD) up to max_concurrency.
+                Defaults to False.
+            rate_limiter (RateLimiter, optional): Limiter shared with other classifiers, e.g. across
+                processes; replaces requests_per_minute and tokens_per_minute. Defaults to None.
+            stable_prompt (bool, optional): Use the prefix-stable prompt of prompt_layout, which
+                prefix-caching backends can reuse across runs. Defaults to False.
+            **llm_kwargs: Additional keyword arguments passed to ChatOpenAI, e.g. a shared `http_client`.
+        """
+        self.labels_dict = dict(labels_dict)
+        self.labels = list(labels_dict.keys())
+        self.default_label = default_label
+        self.model_name = model_name
+        self.max_concurrency = max_concurrency
+        self.rate_limiter = rate_limiter or RateLimiter(requests_per_minute, tokens_per_minute)
+        self.cache = cache
+        self.metrics = metrics
+        self.max_attempts = max_attempts
+        self.adaptive_concurrency = adaptive_concurrency
+        self.llm_kwargs = llm_kwargs
+        if max_attempts > 1:
+            # The engine retries, so the client must not retry on its own as well
+            self.llm_kwargs.setdefault("max_retries", 0)
+
+        # Render the prompt once; it only depends on the labels
+        if stable_prompt:
+            from prompt_layout import build_stable_system_prompt
+            self.system_prompt = build_stable_system_prompt(self.labels_dict, default_label)
+        else:
+            self.system_prompt = build_system_prompt(self.labels_dict, default_label)
+        self.prompt_tokens = estimate_tokens(self.system_prompt)
+        self.cache_scope = cache.scope(model_name, self.system_prompt) if cache is not None else None
+
+        self._llm = None
+        self._chain = None
+        self._engine = None
+        self._loop = None
+        self._lock = threading.Lock()
+
+    @property
+    def llm(self):
+        """
+        The ChatOpenAI client, created on first use.
+        """
+        if self._llm is None:
+            # Set the logging level to WARNING to suppress verbose output
+            logging.getLogger("langchain").setLevel(logging.WARNING)
+            logging.getLogger("openai").setLevel(logging.WARNING)
+            self._llm = create_llm(self.model_name, **self.llm_kwargs)
+        return self._llm
+
+    @property
+    def chain(self):
+        """
+        The LLMChain, created on first use.
+        """
+        if self._chain is None:
+            self._chain = build_chain(self.llm, self.system_prompt)
+        return self._chain
+
+    @property
+    def engine(self) -> AsyncClassifier:
+        """
+        The asynchronous engine sharing this object's chain, limiter and cache.
+        """
+        if self._engine is None:
+            self._engine = AsyncClassifier(
+                self.chain,
+                self.labels,
+                default_label=self.default_label,
+                max_concurrency=self.max_concurrency,
+                rate_limiter=self.rate_limiter,
+                prompt_tokens=self.prompt_tokens,
+                cache_scope=self.cache_scope,
+                metrics=self.metrics,
+                retry_policy=RetryPolicy(self.max_attempts) if self.max_attempts > 1 else None,
+                concurrency=AdaptiveConcurrency(
+                    initial=max(1, self.max_concurrency // 4), max_limit=self.max_concurrency
+                ) if self.adaptive_concurrency else None
+            )
+        return self._engine
+
+    def classify_one(self, filename: str) -> Dict[str, str]:
+        """
+        Classifies a single filename, blocking until the answer arrives.
+
+        Args:
+            filename (str): Filename to classify.
+
+        Returns:
+            Dict[str, str]: Dictionary containing 'label' and 'explanation'.
+        """
+        return self._run(self.engine.classify_one(filename))
+
+    def classify(self, filenames: List[str], progress: bool = True) -> List[Dict[str, str]]:
+        """
+        Classifies filenames concurrently.
+
+        Args:
+            filenames (List[str]): List of filenames to classify.
+            progress (bool, optional): Show a progress bar. Defaults to True.
+
+        Returns:
+            List[Dict[str, str]]: List of dictionaries containing 'label' and 'explanation' for each filename.
+        """
+        return self._run(self.engine.classify(filenames, progress=progress))
+
+    def _run(self, coroutine):
+        # One caller at a time drives the private event loop
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+            return self._loop.run_until_complete(coroutine)
+
+    def close(self) -> None:
+        """
+        Closes the private event loop.
+        """
+        with self._lock:
+            if self._loop is not None:
+                self._loop.close()
+                self._loop = None
+
+
+def measure_cold_import(module: str = "filename_classifier") -> Dict[str, object]:
+    """
+    Measures the import time of a module in a fresh interpreter.
+
+    Args:
+        module (str, optional): Module to import. Defaults to "filename_classifier".
+
+    Returns:
+        Dict[str, object]: Dictionary with 'seconds' and 'heavy_modules', the heavy modules
+            that the import pulled in.
+    """
+    code = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        f"import {module}\n"
+        "elapsed = time.perf_counter() - start\n"
+        f"heavy = [m for m in {HEAVY_MODULES!r} if m in sys.modules]\n"
+        "print(elapsed, ','.join(heavy))\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    ).stdout.split()
+
+    return {
+        'seconds': float(output[0]),
+        'heavy_modules': output[1].split(",") if len(output) > 1 else []
+    }
+
+
+if __name__ == "__main__":
+    measurement = measure_cold_import()
+    print(f"Cold import of filename_classifier: {measurement['seconds']:.3f}s, "
+          f"heavy modules: {', '.join(measurement['heavy_modules']) or 'none'}")
@@ -0,0 +1,260 @@
+import asyncio
+from typing import List, Dict, Optional
+
+from work_4 import create_llm, build_system_prompt, build_chain
+from async_classify import AsyncClassifier, RateLimiter, estimate_tokens
+from batch_classify import MODEL_CONTEXT_WINDOWS, BatchClassifier, build_batch_system_prompt
+from retry import RetryPolicy
+from taxonomy import DEFAULT_TAXONOMY_PATH, load_taxonomy
+from taxonomy_index import TYPO_PATTERN
+
+
+def build_sub_labels(taxonomy: Dict[str, Dict], bin_key: str) -> Dict[str, str]:
+    """
+    Returns the fine labels of one bin with their descriptions.
+
+    Fine labels without a description in the document are described by their own name.
+    Labels documented as typos, e.g. 'comnliance', are left out.
+
+    Args:
+        taxonomy (Dict[str, Dict]): Parsed taxonomy.
+        bin_key (str): Key of the bin.
+
+    Returns:
+        Dict[str, str]: Dictionary with fine labels as keys and descriptions as values, empty
+            for bins without fine labels.
+    """
+    entry = taxonomy.get(bin_key)
+    if entry is None:
+        return {}
+    return {
+        label: description or label
+        for label, description in entry['labels'].items()
+        if not TYPO_PATTERN.search(description)
+    }
+
+
+class HierarchicalClassifier:
+    """
+    Two-stage classifier over the bin -> fine label taxonomy.
+
+    Stage one picks a bin with the short `bins` prompt, one filename per request. Stage two
+    picks a fine label among the labels of that bin only, with the filenames of the same bin
+    batched together. Every bin has its own fixed stage-two prompt, so prompts stay small and
+    identical from one request to the next.
+    """
+
+    def __init__(
+        self,
+        labels_dict: Dict[str, str],
+        default_label: str = "Others",
+        taxonomy: Optional[Dict[str, Dict]] = None,
+        model_name: str = "gpt-4-32k-0613",
+        max_batch_size: int = 50,
+        max_concurrency: int = 8,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        cache=None,
+        metrics=None
+    ):
+        """
+        Args:
+            labels_dict (Dict[str, str]): Bins dictionary with bin keys as keys and descriptions as values.
+            default_label (str, optional): Default bin for unmatched filenames. Defaults to "Others".
+            taxonomy (Dict[str, Dict], optional): Parsed taxonomy. Defaults to docs/categorization.md.
+            model_name (str, optional): Name of the OpenAI model. Defaults to "gpt-4-32k-0613".
+            max_batch_size (int, optional): Upper bound of filenames per stage-two batch. Defaults to 50.
+            max_concurrency (int, optional): Maximum number of requests in flight per stage. Defaults to 8.
+            requests_per_minute (float, optional): Requests-per-minute limit shared by both stages. Defaults to None.
+            tokens_per_minute (float, optional): Tokens-per-minute limit shared by both stages. Defaults to None.
+            cache (ResponseCache, optional): Persistent cache of the stage-one results. Defaults to None.
+            metrics (Metrics, optional): Instrumentation receiving the stage-one requests. Defaults to None.
+        """
+        self.labels_dict = dict(labels_dict)
+        self.default_label = default_label
+        self.taxonomy = taxonomy if taxonomy is not None else load_taxonomy(DEFAULT_TAXONOMY_PATH)
+        self.model_name = model_name
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.cache = cache
+        self.metrics = metrics
+        self.stage_two_requests = 0
+
+        # Render the stage-two prompt of every bin once
+        self.sub_labels = {
+            bin_key: build_sub_labels(self.taxonomy, bin_key) for bin_key in self.labels_dict
+        }
+        # The bin key is the stage-two default, so it is listed among the labels it may answer
+        self.stage_two_labels = {
+            bin_key: {**sub_labels, bin_key: sub_labels.get(bin_key, f"{bin_key} files matching none of the labels above")}
+            for bin_key, sub_labels in self.sub_labels.items()
+            if sub_labels
+        }
+        self.stage_two_prompts = {
+            bin_key: build_batch_system_prompt(labels, default_label=bin_key)
+            for bin_key, labels in self.stage_two_labels.items()
+        }
+        self._llm = None
+
+    @property
+    def llm(self):
+        """
+        The ChatOpenAI client shared by both stages, created on first use.
+        """
+        if self._llm is None:
+            self._llm = create_llm(self.model_name, max_retries=0)
+        return self._llm
+
+    async def classify_bins(self, filenames: List[str], progress: bool = True) -> List[Dict[str, str]]:
+        """
+        Stage one: assigns every filename to a bin.
+
+        Args:
+            filenames (List[str]): List of filenames to classify.
+            progress (bool, optional): Show a progress bar. Defaults to True.
+
+        Returns:
+            List[Dict[str, str]]: List of dictionaries containing 'label' (the bin) and 'explanation'.
+        """
+        system_prompt = build_system_prompt(self.labels_dict, self.default_label)
+        engine = AsyncClassifier(
+            build_chain(self.llm, system_prompt),
+            list(self.labels_dict.keys()),
+            default_label=self.default_label,
+            max_concurrency=self.max_concurrency,
+            rate_limiter=self.rate_limiter,
+            prompt_tokens=estimate_tokens(system_prompt),
+            cache_scope=self.cache.scope(self.model_name, system_prompt) if self.cache is not None else None,
+            metrics=self.metrics,
+            retry_policy=RetryPolicy()
+        )
+        return await engine.classify(filenames, progress)
+
+    async def classify_fine(
+        self,
+        bin_key: str,
+        filenames: List[str],
+        max_concurrency: int
+    ) -> List[Optional[Dict[str, str]]]:
+        """
+        Stage two: assigns filenames of one bin to a fine label of that bin, in batches.
+
+        Args:
+            bin_key (str): Bin of the filenames.
+            filenames (List[str]): Filenames assigned to the bin.
+            max_concurrency (int): Maximum number of batches in flight for this bin.
+
+        Returns:
+            List[Optional[Dict[str, str]]]: List of dictionaries containing 'label' (the fine
+                label, or the bin key if none fits) and 'explanation', or None for filenames whose
+                request failed; "Error" is a fine label of the taxonomy, not a failure.
+        """
+        system_prompt = self.stage_two_prompts[bin_key]
+        batcher = BatchClassifier(
+            build_chain(self.llm, system_prompt, human_template="FILENAMES:\n{filenames}"),
+            list(self.stage_two_labels[bin_key]),
+            default_label=bin_key,
+            prompt_tokens=estimate_tokens(system_prompt),
+            context_window=MODEL_CONTEXT_WINDOWS.get(self.model_name, 8192),
+            max_batch_size=self.max_batch_size,
+            max_concurrency=max_concurrency,
+            rate_limiter=self.rate_limiter
+        )
+        results = await batcher.classify(filenames, progress=False)
+        self.stage_two_requests += batcher.requests
+        failed = {failure['filename'] for failure in batcher.failures}
+        return [None if filename in failed else result for filename, result in zip(filenames, results)]
+
+    async def aclassify(self, filenames: List[str], progress: bool = True) -> List[Dict[str, str]]:
+        """
+        Classifies filenames into a bin and a fine label.
+
+        Args:
+            filenames (List[str]): List of filenames to classify.
+            progress (bool, optional): Show the progress bar of stage one. Defaults to True.
+
+        Returns:
+            List[Dict[str, str]]: List of dictionaries containing 'label' (the bin), 'fine_label'
+                and 'explanation' for each filename.
+        """
+        results = [dict(result) for result in await self.classify_bins(filenames, progress)]
+
+        # Group the filenames by bin; bins without fine labels keep the bin as fine label
+        groups: Dict[str, List[int]] = {}
+        for index, result in enumerate(results):
+            result['fine_label'] = result['label']
+            if result['label'] in self.stage_two_prompts:
+                groups.setdefault(result['label'], []).append(index)
+
+        # Share the concurrency budget between the bins classified at the same time
+        per_bin = max(1, self.max_concurrency // max(1, len(groups)))
+        bin_results = await asyncio.gather(*(
+            self.classify_fine(bin_key, [filenames[index] for index in indexes], per_bin)
+            for bin_key, indexes in groups.items()
+        ))
+
+        for (bin_key, indexes), fine_results in zip(groups.items(), bin_results):
+            for index, fine in zip(indexes, fine_results):
+                # A failed request keeps the bin as fine label
+                if fine is None:
+                    continue
+                results[index]['fine_label'] = fine['label']
+                if fine['explanation']:
+                    results[index]['explanation'] = fine['explanation']
+
+        return results
+
+    def classify(self, filenames: List[str], progress: bool = True) -> List[Dict[str, str]]:
+        """
+        Synchronous version of aclassify.
+        """
+        return asyncio.run(self.aclassify(filenames, progress))
+
+
+def classify_filenames_hierarchical(
+    filenames: List[str],
+    labels_dict: Dict[str, str],
+    default_label: str = "Others",
+    **kwargs
+) -> List[Dict[str, str]]:
+    """
+    Drop-in replacement for work_4.classify_filenames adding a 'fine_label' to every result.
+
+    Args:
+        filenames (List[str]): List of filenames to classify.
+        labels_dict (Dict[str, str]): Bins dictionary with bin keys as keys and descriptions as values.
+        default_label (str, optional): Default bin for unmatched filenames. Defaults to "Others".
+        **kwargs: Options of HierarchicalClassifier.
+
+    Returns:
+        List[Dict[str, str]]: List of dictionaries containing 'label', 'fine_label' and 'explanation'.
+    """
+    return HierarchicalClassifier(labels_dict, default_label, **kwargs).classify(filenames)
+
+
+if __name__ == "__main__":
+    from taxonomy import load_bins
+
+    filenames = [
+        "financial_statement_Q3.pdf",
+        "employee_handbook.docx",
+        "system_error_log.txt",
+        "patient_medical_report_2023.xlsx",
+        "insurance_policy_updates.pdf",
+        "legal_compliance_audit.doc",
+        "random_notes_about_events.txt",
+        "customer_service_feedback.csv",
+        "company_brand_guidelines.pptx",
+        "unknown_document.xyz"
+    ]
+
+    classifier = HierarchicalClassifier(load_bins())
+    for filename, result in zip(filenames, classifier.classify(filenames)):
+        print(f"{filename}: {result['label']} / {result['fine_label']}")
+
+    # Compare the per-call prompt sizes with a single prompt listing every fine label
+    flat = {label: d for bin_key in classifier.stage_two_prompts for label, d in classifier.sub_labels[bin_key].items()}
+    print(f"Flat prompt: ~{estimate_tokens(build_system_prompt(flat))} tokens")
+    for bin_key, prompt in classifier.stage_two_prompts.items():
+        print(f"Stage two prompt of {bin_key}: ~{estimate_tokens(prompt)} tokens")
@@ -0,0 +1,310 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+from typing import Callable, List, Dict, Optional, Set, Tuple
+
+from rule_classifier import tokenize
+from stream_pipeline import OUTPUT_COLUMNS, finish_swap, load_checkpoint, save_checkpoint
+
+
+def taxonomy_version(labels_dict: Dict[str, str]) -> str:
+    """
+    Hashes the labels and descriptions that go into the prompt, in prompt order.
+
+    Args:
+        labels_dict (Dict[str, str]): Dictionary with labels as keys and descriptions as values.
+
+    Returns:
+        str: A short hexadecimal version tag.
+    """
+    payload = json.dumps(list(labels_dict.items()), ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def diff_taxonomy(old: Dict[str, str], new: Dict[str, str]) -> Dict[str, List[str]]:
+    """
+    Lists the labels added, removed, or whose description changed between two versions.
+
+    Args:
+        old (Dict[str, str]): Previous labels and descriptions.
+        new (Dict[str, str]): Current labels and descriptions.
+
+    Returns:
+        Dict[str, List[str]]: Dictionary with 'added', 'removed' and 'changed' labels.
+    """
+    return {
+        'added': [label for label in new if label not in old],
+        'removed': [label for label in old if label not in new],
+        'changed': [label for label in new if label in old and old[label] != new[label]]
+    }
+
+
+def changed_tokens(old: Dict[str, str], new: Dict[str, str]) -> Set[str]:
+    """
+    Returns the tokens that appeared in or disappeared from the added and changed labels.
+
+    A filename containing one of them may now fit, or no longer fit, one of these labels.
+
+    Args:
+        old (Dict[str, str]): Previous labels and descriptions.
+        new (Dict[str, str]): Current labels and descriptions.
+
+    Returns:
+        Set[str]: Normalized tokens, as produced by rule_classifier.tokenize.
+    """
+    diff = diff_taxonomy(old, new)
+    tokens: Set[str] = set()
+    for label in diff['added']:
+        tokens.update(tokenize(label), tokenize(new[label]))
+    for label in diff['changed']:
+        tokens.update(set(tokenize(old[label])) ^ set(tokenize(new[label])))
+    return tokens
+
+
+def affected_rows(
+    filenames: List[str],
+    labels: List[str],
+    old: Dict[str, str],
+    new: Dict[str, str]
+) -> List[int]:
+    """
+    Finds the rows whose classification may change with the new taxonomy.
+
+    A row is affected if its label was removed or re-described, or if its filename shares a
+    token with what changed in an added or re-described label, which makes that label a
+    plausible competitor.
+
+    Args:
+        filenames (List[str]): Classified filenames.
+        labels (List[str]): Their current labels.
+        old (Dict[str, str]): Labels and descriptions the rows were classified with.
+        new (Dict[str, str]): Current labels and descriptions.
+
+    Returns:
+        List[int]: Indexes of the rows to reclassify.
+    """
+    diff = diff_taxonomy(old, new)
+    stale = set(diff['removed']) | set(diff['changed'])
+    tokens = changed_tokens(old, new)
+
+    return [
+        index for index, (filename, label) in enumerate(zip(filenames, labels))
+        if label in stale or label == "Error" or not tokens.isdisjoint(tokenize(filename))
+    ]
+
+
+def reclassify_incremental(
+    filenames: List[str],
+    results: List[Dict[str, str]],
+    old_labels_dict: Dict[str, str],
+    labels_dict: Dict[str, str],
+    default_label: str = "Others",
+    classify_fn: Optional[Callable[..., List[Dict[str, str]]]] = None
+) -> Tuple[List[Dict[str, str]], Dict[str, object]]:
+    """
+    Reclassifies only the rows affected by a taxonomy change and carries the others over.
+
+    Args:
+        filenames (List[str]): Classified filenames.
+        results (List[Dict[str, str]]): Their results under old_labels_dict.
+        old_labels_dict (Dict[str, str]): Labels and descriptions the results were produced with.
+        labels_dict (Dict[str, str]): Current labels and descriptions.
+        default_label (str, optional): Default label for unmatched filenames. Defaults to "Others".
+        classify_fn (Callable, optional): Function with the signature of work_4.classify_filenames.
+            Defaults to async_classify.classify_filenames_concurrent.
+
+    Returns:
+        Tuple[List[Dict[str, str]], Dict[str, object]]: The results tagged with 'taxonomy_version',
+            and a report of the rows reclassified and skipped.
+    """
+    if classify_fn is None:
+        from async_classify import classify_filenames_concurrent as classify_fn
+
+    version = taxonomy_version(labels_dict)
+    indexes = affected_rows(filenames, [result['label'] for result in results], old_labels_dict, labels_dict)
+
+    updated = [{**result, 'taxonomy_version': version} for result in results]
+    if indexes:
+        fresh = classify_fn([filenames[index] for index in indexes], labels_dict, default_label)
+        for index, result in zip(indexes, fresh):
+            updated[index] = {**result, 'taxonomy_version': version}
+
+    report = {
+        'old_version': taxonomy_version(old_labels_dict),
+        'new_version': version,
+        **diff_taxonomy(old_labels_dict, labels_dict),
+        'rows': len(filenames),
+        'reclassified': len(indexes),
+        'skipped': len(filenames) - len(indexes),
+        'skipped_fraction': (len(filenames) - len(indexes)) / len(filenames) if filenames else 0.0
+    }
+    return updated, report
+
+
+def snapshot_path(output_path: str) -> str:
+    """
+    Returns the path of the taxonomy snapshots kept next to an output file.
+    """
+    return output_path + ".taxonomy.json"
+
+
+def load_snapshots(output_path: str) -> Dict[str, Dict[str, str]]:
+    """
+    Loads the labels and descriptions of every taxonomy version used for an output file.
+
+    Args:
+        output_path (str): Path of the output CSV file.
+
+    Returns:
+        Dict[str, Dict[str, str]]: Mapping of version tag to labels and descriptions.
+    """
+    path = snapshot_path(output_path)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_snapshot(output_path: str, labels_dict: Dict[str, str]) -> str:
+    """
+    Records the labels and descriptions of a taxonomy version next to an output file.
+
+    Args:
+        output_path (str): Path of the output CSV file.
+        labels_dict (Dict[str, str]): Dictionary with labels as keys and descriptions as values.
+
+    Returns:
+        str: The version tag.
+    """
+    version = taxonomy_version(labels_dict)
+    snapshots = load_snapshots(output_path)
+    if version not in snapshots:
+        snapshots[version] = dict(labels_dict)
+        # Same atomic write as the checkpoints
+        save_checkpoint(snapshot_path(output_path), snapshots)
+    return version
+
+
+def reclassify_file(
+    output_path: str,
+    labels_dict: Dict[str, str],
+    default_label: str = "Others",
+    chunksize: int = 10000,
+    classify_fn: Optional[Callable[..., List[Dict[str, str]]]] = None,
+    checkpoint_path: Optional[str] = None
+) -> Dict[str, object]:
+    """
+    Brings an output file of stream_pipeline up to date with the current taxonomy.
+
+    Rows are read chunk by chunk; rows tagged with the current version are kept, rows of an
+    older version are reclassified only if the change affects them, and rows without a known
+    version are reclassified. The file is rewritten atomically, and the checkpoint of
+    stream_pipeline, if any, is updated to its new size so a resumed run appends after it.
+
+    Args:
+        output_path (str): Path of the output CSV file.
+        labels_dict (Dict[str, str]): Current labels and descriptions.
+        default_label (str, optional): Default label for unmatched filenames. Defaults to "Others".
+        chunksize (int, optional): Number of rows per chunk. Defaults to 10000.
+        classify_fn (Callable, optional): Function with the signature of work_4.classify_filenames.
+            Defaults to async_classify.classify_filenames_concurrent.
+        checkpoint_path (str, optional): Checkpoint of stream_pipeline. Defaults to output_path + ".checkpoint".
+
+    Returns:
+        Dict[str, object]: Number of 'rows', 'reclassified' and 'skipped' rows, 'skipped_fraction'
+            and the 'changes' per previous version (None for unknown versions).
+    """
+    import pandas as pd
+
+    if classify_fn is None:
+        from async_classify import classify_filenames_concurrent as classify_fn
+
+    if checkpoint_path is None:
+        checkpoint_path = output_path + ".checkpoint"
+    checkpoint = load_checkpoint(checkpoint_path) if os.path.exists(checkpoint_path) else None
+    if checkpoint is not None and checkpoint.get('swap'):
+        checkpoint = finish_swap(checkpoint_path, checkpoint)
+
+    # Rows written after the last checkpoint would be written again by a resumed run
+    if checkpoint is not None and os.path.getsize(output_path) > checkpoint['output_bytes']:
+        with open(output_path, "r+b") as f:
+            f.truncate(checkpoint['output_bytes'])
+
+    version = save_snapshot(output_path, labels_dict)
+    snapshots = load_snapshots(output_path)
+    version_column = OUTPUT_COLUMNS[-1]
+
+    totals = {'rows': 0, 'reclassified': 0, 'skipped': 0, 'changes': {}}
+    temporary = output_path + ".tmp"
+    with open(temporary, "w", newline="", encoding="utf-8") as output:
+        writer = csv.writer(output)
+        writer.writerow(OUTPUT_COLUMNS)
+
+        reader = pd.read_csv(output_path, dtype=str, keep_default_na=False, chunksize=chunksize)
+        for chunk in reader:
+            if version_column not in chunk.columns:
+                chunk[version_column] = ""
+            rows = list(zip(*(chunk[name] for name in OUTPUT_COLUMNS)))
+            updated = list(rows)
+
+            # Group the rows by the version they were classified with
+            groups: Dict[str, List[int]] = {}
+            for index, row in enumerate(rows):
+                if row[3] != version:
+                    groups.setdefault(row[3], []).append(index)
+
+            for old_version, indexes in groups.items():
+                filenames = [rows[index][0] for index in indexes]
+                results = [{'label': rows[index][1], 'explanation': rows[index][2]} for index in indexes]
+
+                old_labels_dict = snapshots.get(old_version)
+                if old_labels_dict is not None:
+                    fresh, report = reclassify_incremental(
+                        filenames, results, old_labels_dict, labels_dict, default_label, classify_fn
+                    )
+                    reclassified = report['reclassified']
+                    totals['changes'][old_version] = diff_taxonomy(old_labels_dict, labels_dict)
+                else:
+                    # An unknown version cannot be diffed, so every such row is reclassified
+                    fresh = classify_fn(filenames, labels_dict, default_label)
+                    reclassified = len(filenames)
+                    totals['changes'][old_version or "unknown"] = None
+
+                for index, result in zip(indexes, fresh):
+                    updated[index] = (rows[index][0], result['label'], result['explanation'], version)
+                totals['reclassified'] += reclassified
+
+            totals['rows'] += len(rows)
+            writer.writerows(updated)
+
+        output.flush()
+        os.fsync(output.fileno())
+
+    # Labels and explanations changed length, so the byte offset of a resumed run moves too;
+    # it is recorded with the pending swap before the file is replaced
+    if checkpoint is not None:
+        checkpoint['output_bytes'] = os.path.getsize(temporary)
+        checkpoint['swap'] = [output_path]
+        save_checkpoint(checkpoint_path, checkpoint)
+        finish_swap(checkpoint_path, checkpoint)
+    else:
+        os.replace(temporary, output_path)
+
+    totals['skipped'] = totals['rows'] - totals['reclassified']
+    totals['skipped_fraction'] = totals['skipped'] / totals['rows'] if totals['rows'] else 0.0
+    return totals
+
+
+if __name__ == "__main__":
+    from taxonomy import load_bins
+
+    parser = argparse.ArgumentParser(description="Reclassify the rows of an output file affected by a taxonomy change.")
+    parser.add_argument("output", help="Output .csv file written by stream_pipeline.py")
+    parser.add_argument("--chunksize", type=int, default=10000, help="Rows per chunk")
+    parser.add_argument("--checkpoint", default=None, help="Checkpoint file of stream_pipeline (default: OUTPUT.checkpoint)")
+    args = parser.parse_args()
+
+    report = reclassify_file(args.output, load_bins(), chunksize=args.chunksize, checkpoint_path=args.checkpoint)
+    print(json.dumps(report, indent=2))
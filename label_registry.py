@@ -0,0 +1,140 @@
+import difflib
+import heapq
+import math
+import re
+from typing import Iterable, List, Dict, Optional
+
+from rule_classifier import tokenize, normalize_token
+
+PUNCTUATION_PATTERN = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_label(label: str) -> str:
+    """
+    Builds the lookup key of a label: lowercase, no punctuation or separators, singular words.
+
+    For example 'HR Policies', 'hr_policies' and 'HR-policy.' share the key 'hr policy'.
+
+    Args:
+        label (str): Label to normalize.
+
+    Returns:
+        str: The lookup key.
+    """
+    words = PUNCTUATION_PATTERN.sub(" ", label.lower()).split()
+    return " ".join(normalize_token(word) for word in words)
+
+
+class LabelRegistry:
+    """
+    Registry of the labels discovered in open-set classification.
+
+    Lookups go through a dictionary of normalized keys, and unknown labels that are close
+    to a known one (typos like 'comnliance', plural or case variants) are merged into the
+    existing canonical label instead of being added. The prompt only receives the top-k
+    labels most relevant to a filename, so its size stays flat as the registry grows.
+    """
+
+    def __init__(self, labels: Optional[Iterable[str]] = None, similarity: float = 0.85):
+        """
+        Args:
+            labels (Iterable[str], optional): Initial labels. Defaults to None.
+            similarity (float, optional): Minimum similarity ratio to merge a label into an
+                existing one. Defaults to 0.85.
+        """
+        self.similarity = similarity
+        self.canonical: Dict[str, str] = {}
+        self.counts: Dict[str, int] = {}
+        self._token_index: Dict[str, List[str]] = {}
+        for label in labels or []:
+            self.add(label, count=False)
+
+    def __contains__(self, label: str) -> bool:
+        return normalize_label(label) in self.canonical
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    @property
+    def labels(self) -> List[str]:
+        """
+        The canonical labels in insertion order.
+        """
+        return list(self.counts)
+
+    def resolve(self, label: str) -> Optional[str]:
+        """
+        Finds the canonical label of a label, merging near-duplicates.
+
+        Args:
+            label (str): Label returned by the model.
+
+        Returns:
+            Optional[str]: The canonical label, or None if the label is new.
+        """
+        key = normalize_label(label)
+        canonical = self.canonical.get(key)
+        if canonical is not None:
+            return canonical
+
+        # Only unknown labels pay for the fuzzy search
+        matches = difflib.get_close_matches(key, self.canonical.keys(), n=1, cutoff=self.similarity)
+        if matches:
+            canonical = self.canonical[matches[0]]
+            # Remember the variant so the next lookup is a dictionary hit
+            self.canonical[key] = canonical
+            return canonical
+
+        return None
+
+    def add(self, label: str, count: bool = True) -> str:
+        """
+        Registers a label and returns its canonical form.
+
+        Args:
+            label (str): Label returned by the model.
+            count (bool, optional): Count this as an assignment. Defaults to True.
+
+        Returns:
+            str: The canonical label, which is `label` itself if it is new.
+        """
+        label = label.strip()
+        canonical = self.resolve(label)
+        if canonical is None:
+            canonical = label
+            self.canonical[normalize_label(label)] = canonical
+            self.counts[canonical] = 0
+            for token in set(tokenize(label)):
+                self._token_index.setdefault(token, []).append(canonical)
+
+        if count:
+            self.counts[canonical] += 1
+        return canonical
+
+    def prompt_labels(self, filename: str, k: int = 20) -> List[str]:
+        """
+        Selects the labels to show in the prompt for a filename.
+
+        Labels sharing words with the filename come first, then the most frequently
+        assigned labels fill the remaining slots.
+
+        Args:
+            filename (str): Filename being classified.
+            k (int, optional): Maximum number of labels. Defaults to 20.
+
+        Returns:
+            List[str]: At most k canonical labels.
+        """
+        if len(self.counts) <= k:
+            return self.labels
+
+        scores: Dict[str, float] = {}
+        for token in set(tokenize(filename)):
+            for label in self._token_index.get(token, ()):
+                scores[label] = scores.get(label, 0.0) + 1.0
+
+        # Break ties between matching labels, and rank the rest, by popularity
+        def rank(label: str) -> float:
+            return scores.get(label, 0.0) * 1000 + math.log1p(self.counts[label])
+
+        return heapq.nlargest(k, self.counts, key=rank)
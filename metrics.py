@@ -0,0 +1,243 @@
+import bisect
+import json
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+# Bucket upper bounds of the histograms
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram keeping only counts, a sum and a total, like a Prometheus histogram.
+    """
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        """
+        Adds a value to the histogram.
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, fraction: float) -> float:
+        """
+        Estimates a quantile as the upper bound of the bucket that contains it.
+        """
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def snapshot(self) -> Dict[str, object]:
+        """
+        Returns the histogram as a dictionary.
+        """
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else 0.0,
+            'p50': self.quantile(0.50),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'buckets': dict(zip([str(b) for b in self.buckets] + ["+Inf"], self.counts))
+        }
+
+
+class Metrics:
+    """
+    Per-request instrumentation of the classification calls.
+
+    Recording a request costs a lock, a few bisects and, when a trace file is configured,
+    one JSON line, so the hooks can stay enabled in production.
+    """
+
+    def __init__(self, trace_path: Optional[str] = None):
+        """
+        Args:
+            trace_path (str, optional): File receiving one JSON line per request. Defaults to None.
+        """
+        self._lock = threading.Lock()
+        self._trace = open(trace_path, "a", buffering=1, encoding="utf-8") if trace_path else None
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Clears every counter and histogram.
+        """
+        with self._lock:
+            self.counters: Dict[str, int] = {}
+            self.histograms: Dict[str, Histogram] = {
+                'request_seconds': Histogram(LATENCY_BUCKETS),
+                'prompt_tokens': Histogram(TOKEN_BUCKETS),
+                'completion_tokens': Histogram(TOKEN_BUCKETS),
+            }
+
+    def increment(self, name: str, value: int = 1) -> None:
+        """
+        Increments a counter, e.g. 'cache_hits', 'parse_failures' or 'tier_local'.
+
+        Args:
+            name (str): Counter name.
+            value (int, optional): Increment. Defaults to 1.
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float, buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        """
+        Adds a value to a histogram, creating it with the given buckets if needed.
+
+        Args:
+            name (str): Histogram name.
+            value (float): Observed value.
+            buckets (Sequence[float], optional): Buckets of a new histogram. Defaults to LATENCY_BUCKETS.
+        """
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(buckets)
+            histogram.observe(value)
+
+    def record_request(
+        self,
+        filename: str,
+        seconds: float,
+        outcome: str = "ok",
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        retries: int = 0,
+        **fields
+    ) -> None:
+        """
+        Records one call to the model.
+
+        Args:
+            filename (str): Filename of the request.
+            seconds (float): Wall time of the request.
+            outcome (str, optional): 'ok', 'parse_failure' or 'error'. Defaults to "ok".
+            prompt_tokens (int, optional): Prompt tokens of the request. Defaults to 0.
+            completion_tokens (int, optional): Completion tokens of the request. Defaults to 0.
+            retries (int, optional): Retries before the final attempt. Defaults to 0.
+            **fields: Extra fields written to the trace log only.
+        """
+        with self._lock:
+            self.counters['requests'] = self.counters.get('requests', 0) + 1
+            key = f"requests_{outcome}"
+            self.counters[key] = self.counters.get(key, 0) + 1
+            if retries:
+                self.counters['retries'] = self.counters.get('retries', 0) + retries
+            self.histograms['request_seconds'].observe(seconds)
+            if prompt_tokens:
+                self.histograms['prompt_tokens'].observe(prompt_tokens)
+            if completion_tokens:
+                self.histograms['completion_tokens'].observe(completion_tokens)
+
+        if self._trace is not None:
+            self._trace.write(json.dumps({
+                'time': time.time(),
+                'filename': filename,
+                'seconds': round(seconds, 6),
+                'outcome': outcome,
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'retries': retries,
+                **fields
+            }) + "\n")
+
+    def snapshot(self) -> Dict[str, object]:
+        """
+        Returns every counter and histogram as a dictionary.
+        """
+        with self._lock:
+            return {
+                'counters': dict(self.counters),
+                'histograms': {name: h.snapshot() for name, h in self.histograms.items()}
+            }
+
+    def to_json(self) -> str:
+        """
+        Returns the snapshot as a JSON string.
+        """
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self, prefix: str = "filename_classifier") -> str:
+        """
+        Returns the metrics in the Prometheus text exposition format.
+
+        Args:
+            prefix (str, optional): Prefix of every metric name. Defaults to "filename_classifier".
+
+        Returns:
+            str: The exposition text.
+        """
+        lines: List[str] = []
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE {prefix}_{name}_total counter")
+                lines.append(f"{prefix}_{name}_total {value}")
+
+            for name, histogram in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {prefix}_{name} histogram")
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{prefix}_{name}_bucket{{le="{bound}"}} {cumulative}')
+                lines.append(f'{prefix}_{name}_bucket{{le="+Inf"}} {histogram.count}')
+                lines.append(f"{prefix}_{name}_sum {histogram.sum}")
+                lines.append(f"{prefix}_{name}_count {histogram.count}")
+
+        return "\n".join(lines) + "\n"
+
+    def close(self) -> None:
+        """
+        Closes the trace file.
+        """
+        if self._trace is not None:
+            self._trace.close()
+            self._trace = None
+
+
+_usage_handler_class = None
+
+
+def usage_handler():
+    """
+    Creates a langchain callback handler that captures the token usage of one call.
+
+    The handler class is defined on first use so that importing this module does not
+    import langchain.
+
+    Returns:
+        BaseCallbackHandler: Handler with 'prompt_tokens' and 'completion_tokens' attributes.
+    """
+    global _usage_handler_class
+    if _usage_handler_class is None:
+        from langchain.callbacks.base import BaseCallbackHandler
+
+        class UsageHandler(BaseCallbackHandler):
+            def __init__(self):
+                self.prompt_tokens = 0
+                self.completion_tokens = 0
+
+            def on_llm_end(self, response, **kwargs):
+                usage = (response.llm_output or {}).get("token_usage") or {}
+                self.prompt_tokens += usage.get("prompt_tokens", 0)
+                self.completion_tokens += usage.get("completion_tokens", 0)
+
+        _usage_handler_class = UsageHandler
+
+    return _usage_handler_class()
@@ -0,0 +1,118 @@
+from typing import Callable, List, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+
+def classify_series(
+    series: "pd.Series",
+    labels_dict: Dict[str, str],
+    default_label: str = "Others",
+    classify_fn: Optional[Callable[..., List[Dict[str, str]]]] = None
+) -> "pd.DataFrame":
+    """
+    Classifies the unique values of a Series and maps the results back to every row.
+
+    pd.factorize turns the values into integer codes and their uniques, so only the uniques
+    are sent to the model. Labels come back as a Categorical over the known labels, and
+    explanations as a Categorical too, storing every distinct explanation once. Missing
+    values get missing labels and explanations.
+
+    Args:
+        series (pd.Series): Filenames to classify.
+        labels_dict (Dict[str, str]): Dictionary with labels as keys and descriptions as values.
+        default_label (str, optional): Default label for unmatched filenames. Defaults to "Others".
+        classify_fn (Callable, optional): Function with the signature of work_4.classify_filenames.
+            Defaults to async_classify.classify_filenames_concurrent.
+
+    Returns:
+        pd.DataFrame: Columns 'LLM_label' and 'Explanation', with the index of the Series.
+    """
+    if classify_fn is None:
+        from async_classify import classify_filenames_concurrent as classify_fn
+
+    # Integer code per row, -1 for missing values; only the uniques are classified
+    codes, uniques = pd.factorize(series)
+    results = classify_fn([str(value) for value in uniques], labels_dict, default_label) if len(uniques) else []
+
+    # Categories cover every label, so later results can be concatenated without recoding
+    categories = list(dict.fromkeys(
+        [*labels_dict, default_label, "Error", *(result['label'] for result in results)]
+    ))
+    position = {label: code for code, label in enumerate(categories)}
+    label_codes = np.fromiter((position[result['label']] for result in results), dtype=np.int32, count=len(results))
+
+    # Distinct explanations are stored once, rows hold a code into them
+    explanation_codes, explanations = pd.factorize(pd.Series([result['explanation'] for result in results], dtype=object))
+
+    def expand(unique_codes: np.ndarray) -> np.ndarray:
+        # Map the per-unique codes back to every row, keeping -1 for missing values
+        if not len(unique_codes):
+            return np.full(len(codes), -1, dtype=np.int32)
+        return np.where(codes >= 0, unique_codes[np.maximum(codes, 0)], -1)
+
+    return pd.DataFrame(
+        {
+            'LLM_label': pd.Categorical.from_codes(expand(label_codes), categories=categories),
+            'Explanation': pd.Categorical.from_codes(
+                expand(np.asarray(explanation_codes, dtype=np.int32)), categories=pd.Index(explanations, dtype=object)
+            )
+        },
+        index=series.index
+    )
+
+
+@pd.api.extensions.register_series_accessor("llm")
+class LLMSeriesAccessor:
+    """
+    `series.llm.classify(bins)` classifies a Series of filenames, calling the model once per unique value.
+    """
+
+    def __init__(self, series: "pd.Series"):
+        self._series = series
+
+    def classify(
+        self,
+        labels_dict: Dict[str, str],
+        default_label: str = "Others",
+        classify_fn: Optional[Callable[..., List[Dict[str, str]]]] = None
+    ) -> "pd.DataFrame":
+        """
+        Classifies the filenames of the Series; see classify_series.
+
+        Returns:
+            pd.DataFrame: Columns 'LLM_label' and 'Explanation' as Categoricals.
+        """
+        return classify_series(self._series, labels_dict, default_label, classify_fn)
+
+
+@pd.api.extensions.register_dataframe_accessor("llm")
+class LLMDataFrameAccessor:
+    """
+    `df.llm.classify(bins)` adds 'LLM_label' and 'Explanation' columns for a filename column.
+    """
+
+    def __init__(self, frame: "pd.DataFrame"):
+        self._frame = frame
+
+    def classify(
+        self,
+        labels_dict: Dict[str, str],
+        column: str = "file names",
+        default_label: str = "Others",
+        classify_fn: Optional[Callable[..., List[Dict[str, str]]]] = None
+    ) -> "pd.DataFrame":
+        """
+        Classifies a filename column; see classify_series.
+
+        Args:
+            labels_dict (Dict[str, str]): Dictionary with labels as keys and descriptions as values.
+            column (str, optional): Column holding the filenames. Defaults to "file names".
+            default_label (str, optional): Default label for unmatched filenames. Defaults to "Others".
+            classify_fn (Callable, optional): Function with the signature of work_4.classify_filenames.
+
+        Returns:
+            pd.DataFrame: A copy of the DataFrame with the 'LLM_label' and 'Explanation' columns.
+        """
+        results = classify_series(self._frame[column], labels_dict, default_label, classify_fn)
+        return self._frame.assign(LLM_label=results['LLM_label'], Explanation=results['Explanation'])
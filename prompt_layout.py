@@ -0,0 +1,219 @@
+import functools
+import hashlib
+import re
+import statistics
+import unicodedata
+from typing import List, Dict, Optional, Tuple
+
+from async_classify import estimate_tokens
+from batch_classify import MODEL_CONTEXT_WINDOWS
+
+# Separators of the items listed in a description
+TOPIC_SEPARATOR_PATTERN = re.compile(r",|;|\band\b")
+
+# Instructions of work_4.build_system_prompt without any per-run variable: the default label
+# is named in the tail of the prompt instead of inside the instructions
+STABLE_INSTRUCTIONS = """You are an expert classifier working with a Medical Insurance company.
+
+Instructions:
+- I will provide a FILENAME and a LIST of predefined categories with their DESCRIPTIONS.
+- Assign the FILENAME to the most appropriate LABEL from the LIST.
+- Use the DESCRIPTIONS to make the best decision.
+- If the FILENAME does not clearly fit any LABEL, assign it to the DEFAULT LABEL named at the end.
+- Only choose the DEFAULT LABEL if the FILENAME does not fit any other category.
+
+Constraints:
+- Provide your response in JSON format with two keys: "label" and "explanation".
+- "label" should be one of the predefined LABELS.
+- "explanation" should be a brief justification for your choice.
+- Do not include any additional text outside the JSON format.
+- Do not create new labels.
+
+LIST of LABELS and DESCRIPTIONS:
+"""
+
+
+def canonical_text(text: str) -> str:
+    """
+    Normalizes a label or description: NFC Unicode form and single spaces.
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def prompt_sections(labels_dict: Dict[str, str], default_label: str = "Others") -> List[Tuple[str, str]]:
+    """
+    Returns the sections of the prefix-stable system prompt, in prompt order.
+
+    The 'instructions' and 'labels' sections depend only on the set of labels and
+    descriptions: labels are sorted case-insensitively and their text normalized, so dict
+    order, stray whitespace or Unicode forms do not change a byte. Everything that varies
+    per run goes to the 'per_run' section at the end.
+
+    Args:
+        labels_dict (Dict[str, str]): Dictionary with labels as keys and descriptions as values.
+        default_label (str, optional): Default label for unmatched filenames. Defaults to "Others".
+
+    Returns:
+        List[Tuple[str, str]]: (name, text) of the 'instructions', 'labels' and 'per_run' sections.
+    """
+    entries = sorted(
+        ((canonical_text(label), canonical_text(description)) for label, description in labels_dict.items()),
+        key=lambda entry: (entry[0].casefold(), entry[0])
+    )
+    labels_block = "".join(f"{label}: {description}\n" for label, description in entries)
+
+    # No "name: " line here, so the tail is never mistaken for a label
+    per_run = f"\nIf the FILENAME fits no other LABEL, the DEFAULT LABEL is '{canonical_text(default_label)}'.\n"
+    return [('instructions', STABLE_INSTRUCTIONS), ('labels', labels_block), ('per_run', per_run)]
+
+
+def build_stable_system_prompt(labels_dict: Dict[str, str], default_label: str = "Others") -> str:
+    """
+    Renders the system prompt with a byte-stable prefix; see prompt_sections.
+
+    Drop-in replacement for work_4.build_system_prompt, answered with the same JSON format.
+
+    Args:
+        labels_dict (Dict[str, str]): Dictionary with labels as keys and descriptions as values.
+        default_label (str, optional): Default label for unmatched filenames. Defaults to "Others".
+
+    Returns:
+        str: The rendered system prompt.
+    """
+    return "".join(text for _, text in prompt_sections(labels_dict, default_label))
+
+
+def prefix_hash(labels_dict: Dict[str, str]) -> str:
+    """
+    Hashes the stable prefix, i.e. what a prefix-caching backend can reuse between runs.
+    """
+    prefix = "".join(text for name, text in prompt_sections(labels_dict) if name != 'per_run')
+    return hashlib.sha256(prefix.encode("utf-8")).hexdigest()[:16]
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding(model_name: str):
+    # tiktoken ships with the OpenAI client; fall back to the estimate without it
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model_name: str = "gpt-4-32k-0613") -> int:
+    """
+    Counts the tokens of a text with the tokenizer of the model, or estimates them without tiktoken.
+
+    Args:
+        text (str): Text to measure.
+        model_name (str, optional): Name of the OpenAI model. Defaults to "gpt-4-32k-0613".
+
+    Returns:
+        int: Number of tokens.
+    """
+    encoding = _encoding(model_name)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text))
+
+
+def analyze_prompt_budget(
+    labels_dict: Dict[str, str],
+    default_label: str = "Others",
+    model_name: str = "gpt-4-32k-0613",
+    completion_tokens: int = 64,
+    filename_tokens: int = 32,
+    bloat_factor: float = 1.5,
+    max_topics: int = 15,
+    min_bloat_tokens: int = 40,
+    context_tokens: Optional[int] = None
+) -> Dict[str, object]:
+    """
+    Reports the token budget of the system prompt, section by section and label by label.
+
+    A description longer than `min_bloat_tokens` is flagged as bloated when it is at least
+    `bloat_factor` times the mean description, or lists `max_topics` items or more; catch-all
+    descriptions enumerating unrelated topics, such as AdminHR's, stand out this way. The total of a request,
+    prompt plus filename plus completion, is checked against the context window of the model.
+
+    Args:
+        labels_dict (Dict[str, str]): Dictionary with labels as keys and descriptions as values.
+        default_label (str, optional): Default label for unmatched filenames. Defaults to "Others".
+        model_name (str, optional): Name of the OpenAI model. Defaults to "gpt-4-32k-0613".
+        completion_tokens (int, optional): Tokens reserved for the completion. Defaults to 64.
+        filename_tokens (int, optional): Tokens reserved for the user message. Defaults to 32.
+        bloat_factor (float, optional): Ratio to the mean description that flags a label. Defaults to 1.5.
+        max_topics (int, optional): Number of listed items that flags a label. Defaults to 15.
+        min_bloat_tokens (int, optional): Descriptions shorter than this are never flagged. Defaults to 40.
+        context_tokens (int, optional): Context window; looked up in
+            batch_classify.MODEL_CONTEXT_WINDOWS if None.
+
+    Returns:
+        Dict[str, object]: Tokens per 'sections', 'stable_prefix_tokens', 'prompt_tokens',
+            'request_tokens', 'context_tokens', 'fits' and 'headroom', tokens per label in
+            'descriptions', and the 'bloated' labels with their tokens, ratio and listed topics.
+    """
+    sections = {name: count_tokens(text, model_name) for name, text in prompt_sections(labels_dict, default_label)}
+    prompt_tokens = count_tokens(build_stable_system_prompt(labels_dict, default_label), model_name)
+    request_tokens = prompt_tokens + filename_tokens + completion_tokens
+    if context_tokens is None:
+        context_tokens = MODEL_CONTEXT_WINDOWS.get(model_name)
+
+    descriptions = {
+        label: count_tokens(f"{label}: {canonical_text(description)}\n", model_name)
+        for label, description in labels_dict.items()
+    }
+    mean = statistics.mean(descriptions.values()) if descriptions else 0
+    bloated = []
+    for label, tokens in sorted(descriptions.items(), key=lambda item: -item[1]):
+        # Listed items hint at a catch-all that could be split or trimmed
+        topics = len([part for part in TOPIC_SEPARATOR_PATTERN.split(labels_dict[label]) if part.strip()])
+        if tokens > min_bloat_tokens and (tokens >= bloat_factor * mean or topics >= max_topics):
+            bloated.append({'label': label, 'tokens': tokens, 'ratio': round(tokens / mean, 2), 'topics': topics})
+
+    return {
+        'model': model_name,
+        'sections': sections,
+        'stable_prefix_tokens': sections['instructions'] + sections['labels'],
+        'prompt_tokens': prompt_tokens,
+        'request_tokens': request_tokens,
+        'context_tokens': context_tokens,
+        'fits': context_tokens is None or request_tokens <= context_tokens,
+        'headroom': context_tokens - request_tokens if context_tokens is not None else None,
+        'descriptions': descriptions,
+        'mean_description_tokens': round(mean, 1),
+        'bloated': bloated,
+        'prefix_hash': prefix_hash(labels_dict)
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    from taxonomy import load_bins
+
+    parser = argparse.ArgumentParser(description="Token budget of the system prompt built from the taxonomy.")
+    parser.add_argument("--model", default="gpt-4-32k-0613")
+    parser.add_argument("--default-label", default="Others")
+    parser.add_argument("--completion-tokens", type=int, default=64)
+    parser.add_argument("--bloat-factor", type=float, default=1.5)
+    parser.add_argument("--print-prompt", action="store_true", help="Print the prefix-stable prompt")
+    args = parser.parse_args()
+
+    bins = load_bins(default_label=args.default_label)
+    if args.print_prompt:
+        print(build_stable_system_prompt(bins, args.default_label))
+
+    report = analyze_prompt_budget(
+        bins, args.default_label, args.model, args.completion_tokens, bloat_factor=args.bloat_factor
+    )
+    print(json.dumps(report, indent=2))
+    for entry in report['bloated']:
+        print(f"Bloated description: {entry['label']} uses {entry['tokens']} tokens, "
+              f"{entry['ratio']}x the mean, listing {entry['topics']} topics")
+    if not report['fits']:
+        print(f"Prompt exceeds the {report['context_tokens']} token context of {args.model}")
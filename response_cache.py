@@ -0,0 +1,201 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+
+class ResponseCache:
+    """
+    Persistent SQLite cache of classification results.
+
+    Entries are keyed by a hash of the model name, the rendered system prompt and the
+    filename, so any change to labels_dict or the instructions naturally misses the cache.
+    The database runs in WAL mode, which lets several processes read and write the same
+    file; inside one process a lock serializes access to the shared connection.
+    """
+
+    def __init__(
+        self,
+        path: str = "classification_cache.sqlite",
+        max_entries: Optional[int] = None,
+        max_age_seconds: Optional[float] = None,
+        evict_every: int = 1000
+    ):
+        """
+        Args:
+            path (str, optional): Path of the SQLite database. Defaults to "classification_cache.sqlite".
+            max_entries (int, optional): Maximum number of entries kept, oldest evicted first. Defaults to None.
+            max_age_seconds (float, optional): Entries older than this are ignored and evicted. Defaults to None.
+            evict_every (int, optional): Number of writes between eviction passes. Defaults to 1000.
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self.evict_every = evict_every
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+
+        # Autocommit mode: every write is its own short transaction
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_created ON responses (created)")
+
+    @staticmethod
+    def make_key(model_name: str, system_prompt: str, filename: str) -> str:
+        """
+        Builds the cache key of a request.
+
+        Args:
+            model_name (str): Name of the model.
+            system_prompt (str): The rendered system prompt.
+            filename (str): The filename being classified.
+
+        Returns:
+            str: Hex digest identifying the request.
+        """
+        digest = hashlib.sha256()
+        for part in (model_name, system_prompt, filename):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, str]]:
+        """
+        Looks up a cached result.
+
+        Args:
+            key (str): Cache key built with make_key.
+
+        Returns:
+            Optional[Dict[str, str]]: The cached result, or None on a miss.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+
+            # Expired entries count as misses; they are removed by the next eviction pass
+            if row is None or (self.max_age_seconds is not None and time.time() - row[1] > self.max_age_seconds):
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            return json.loads(row[0])
+
+    def put(self, key: str, result: Dict[str, str]) -> None:
+        """
+        Stores a result in the cache.
+
+        Args:
+            key (str): Cache key built with make_key.
+            result (Dict[str, str]): Result to store.
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created) VALUES (?, ?, ?)",
+                (key, json.dumps(result), time.time())
+            )
+            self._writes += 1
+            if self._writes % self.evict_every == 0:
+                self._evict()
+
+    def evict(self) -> None:
+        """
+        Removes expired entries and the oldest entries above max_entries.
+        """
+        with self._lock:
+            self._evict()
+
+    def _evict(self) -> None:
+        if self.max_age_seconds is not None:
+            self._conn.execute(
+                "DELETE FROM responses WHERE created < ?", (time.time() - self.max_age_seconds,)
+            )
+        if self.max_entries is not None:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def scope(self, model_name: str, system_prompt: str) -> "CacheScope":
+        """
+        Returns a view of the cache bound to one model and system prompt.
+
+        Args:
+            model_name (str): Name of the model.
+            system_prompt (str): The rendered system prompt.
+
+        Returns:
+            CacheScope: Cache view keyed by filename only.
+        """
+        return CacheScope(self, model_name, system_prompt)
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Returns the hit/miss counters and the number of stored entries.
+
+        Returns:
+            Dict[str, float]: Dictionary with 'hits', 'misses', 'hit_rate' and 'entries'.
+        """
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': entries
+        }
+
+    def close(self) -> None:
+        """
+        Closes the database connection.
+        """
+        with self._lock:
+            self._conn.close()
+
+
+class CacheScope:
+    """
+    ResponseCache view for a fixed model and system prompt.
+
+    The model name and prompt are hashed once, and only the filename is hashed per lookup.
+    """
+
+    def __init__(self, cache: ResponseCache, model_name: str, system_prompt: str):
+        self.cache = cache
+        self._prefix = hashlib.sha256()
+        for part in (model_name, system_prompt):
+            self._prefix.update(part.encode("utf-8"))
+            self._prefix.update(b"\0")
+
+    def key(self, filename: str) -> str:
+        """
+        Builds the cache key of a filename; equal to ResponseCache.make_key.
+        """
+        digest = self._prefix.copy()
+        digest.update(filename.encode("utf-8"))
+        digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, filename: str) -> Optional[Dict[str, str]]:
+        """
+        Looks up the cached result of a filename.
+        """
+        return self.cache.get(self.key(filename))
+
+    def put(self, filename: str, result: Dict[str, str]) -> None:
+        """
+        Stores the result of a filename.
+        """
+        self.cache.put(self.key(filename), result)
@@ -0,0 +1,308 @@
+import json
+import os
+from array import array
+from collections.abc import Sequence
+from typing import Callable, Iterable, Iterator, List, Dict, Optional, Union
+
+import numpy as np
+
+# Files of a store saved with ResultStore.save
+CODES_FILE = "label_codes.npy"
+EXPLANATION_CODES_FILE = "explanation_codes.npy"
+TABLES_FILE = "tables.json"
+
+
+def label_table(labels_dict: Dict[str, str], default_label: str = "Others") -> List[str]:
+    """
+    Returns the labels a store can hold: the bins keys, the default label and "Error".
+    """
+    return list(dict.fromkeys([*labels_dict, default_label, "Error"]))
+
+
+class ResultStore(Sequence):
+    """
+    Classification results held as arrays instead of one dict per filename.
+
+    Each label is a uint8 code into the label table, or a uint16 code past 256 labels. Each
+    explanation is a uint32 code into a table that stores every distinct explanation once. A
+    million results take a few megabytes plus the distinct explanations.
+
+    The store is a Sequence of {'label', 'explanation'} dicts, built on access, so it can
+    replace the list returned by work_4.classify_filenames. Slicing, boolean masks and index
+    arrays return stores that share the tables, and filters compare codes, so neither builds
+    any dict. Keys other than 'label' and 'explanation' are not kept.
+    """
+
+    def __init__(self, labels: List[str], codes: np.ndarray, explanations: List[str], explanation_codes: np.ndarray):
+        """
+        Args:
+            labels (List[str]): Label table.
+            codes (np.ndarray): Label code of every result.
+            explanations (List[str]): Distinct explanations.
+            explanation_codes (np.ndarray): Explanation code of every result.
+        """
+        self.labels = labels
+        self.codes = codes
+        self.explanations = explanations
+        self.explanation_codes = explanation_codes
+        self._positions = None
+
+    @classmethod
+    def from_results(
+        cls,
+        results: Iterable[Dict[str, str]],
+        labels_dict: Dict[str, str],
+        default_label: str = "Others"
+    ) -> "ResultStore":
+        """
+        Builds a store from result dicts, e.g. the list returned by work_4.classify_filenames.
+        """
+        builder = ResultStoreBuilder(labels_dict, default_label)
+        builder.extend(results)
+        return builder.build()
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, key: Union[int, slice, np.ndarray, List[int]]):
+        if isinstance(key, (int, np.integer)):
+            return {
+                'label': self.labels[self.codes[key]],
+                'explanation': self.explanations[self.explanation_codes[key]]
+            }
+        # Slices give views of the arrays; masks and index arrays give copies of the codes only
+        return ResultStore(self.labels, self.codes[key], self.explanations, self.explanation_codes[key])
+
+    def __iter__(self) -> Iterator[Dict[str, str]]:
+        labels, explanations = self.labels, self.explanations
+        for code, explanation_code in zip(self.codes.tolist(), self.explanation_codes.tolist()):
+            yield {'label': labels[code], 'explanation': explanations[explanation_code]}
+
+    def to_dicts(self) -> Iterator[Dict[str, str]]:
+        """
+        Yields the results as {'label', 'explanation'} dicts, one at a time.
+        """
+        return iter(self)
+
+    def code_of(self, label: str) -> int:
+        """
+        Returns the code of a label.
+
+        Raises:
+            KeyError: If the label is not in the label table.
+        """
+        if self._positions is None:
+            self._positions = {label: code for code, label in enumerate(self.labels)}
+        return self._positions[label]
+
+    def mask(self, *labels: str) -> np.ndarray:
+        """
+        Returns the boolean mask of the results with one of the labels.
+        """
+        codes = [self.code_of(label) for label in labels if label in self.labels]
+        return np.isin(self.codes, np.asarray(codes, dtype=self.codes.dtype))
+
+    def where(self, *labels: str) -> "ResultStore":
+        """
+        Returns the results with one of the labels, e.g. store.where("Error").
+        """
+        return self[self.mask(*labels)]
+
+    def label_counts(self) -> Dict[str, int]:
+        """
+        Counts the results of every label, without building any dict per result.
+        """
+        counts = np.bincount(self.codes, minlength=len(self.labels))
+        return {label: int(count) for label, count in zip(self.labels, counts) if count}
+
+    def nbytes(self) -> int:
+        """
+        Returns the approximate memory used by the codes and the explanation table.
+        """
+        return (
+            self.codes.nbytes
+            + self.explanation_codes.nbytes
+            + sum(len(explanation.encode("utf-8")) for explanation in self.explanations)
+        )
+
+    def to_frame(self, filenames: Optional[List[str]] = None) -> "pd.DataFrame":
+        """
+        Returns the results as a DataFrame of Categoricals over the label and explanation tables.
+
+        Args:
+            filenames (List[str], optional): Filenames, added as the 'file names' column. Defaults to None.
+
+        Returns:
+            pd.DataFrame: Columns 'LLM_label' and 'Explanation', as in work_4.py.
+        """
+        import pandas as pd
+
+        frame = pd.DataFrame({
+            'LLM_label': pd.Categorical.from_codes(self.codes.astype(np.int32), categories=pd.Index(self.labels, dtype=object)),
+            'Explanation': pd.Categorical.from_codes(
+                self.explanation_codes.astype(np.int64), categories=pd.Index(self.explanations, dtype=object)
+            )
+        })
+        if filenames is not None:
+            frame.insert(0, "file names", filenames)
+        return frame
+
+    def to_arrow(self) -> "pa.Table":
+        """
+        Returns the results as an Arrow table of dictionary-encoded columns.
+
+        The index buffers wrap the code arrays without copying them.
+        """
+        import pyarrow as pa
+
+        return pa.table({
+            'LLM_label': pa.DictionaryArray.from_arrays(pa.array(self.codes), pa.array(self.labels, pa.string())),
+            'Explanation': pa.DictionaryArray.from_arrays(
+                pa.array(self.explanation_codes), pa.array(self.explanations, pa.string())
+            )
+        })
+
+    @classmethod
+    def from_arrow(cls, table: "pa.Table") -> "ResultStore":
+        """
+        Builds a store from an Arrow table written by to_arrow or to_parquet.
+        """
+        columns = []
+        for name in ("LLM_label", "Explanation"):
+            # Chunks may carry different dictionaries, so they are unified first
+            column = table.column(name).unify_dictionaries().combine_chunks()
+            columns.append((column.dictionary.to_pylist(), column.indices.to_numpy(zero_copy_only=False)))
+        (labels, codes), (explanations, explanation_codes) = columns
+        dtype = np.uint8 if len(labels) <= 256 else np.uint16
+        return cls(labels, codes.astype(dtype, copy=False), explanations, explanation_codes.astype(np.uint32, copy=False))
+
+    def to_parquet(self, path: str) -> None:
+        """
+        Writes the results to a Parquet file, keeping the dictionary encoding.
+        """
+        import pyarrow.parquet as pq
+
+        pq.write_table(self.to_arrow(), path)
+
+    @classmethod
+    def read_parquet(cls, path: str) -> "ResultStore":
+        """
+        Reads results written by to_parquet.
+        """
+        import pyarrow.parquet as pq
+
+        return cls.from_arrow(pq.read_table(path, read_dictionary=["LLM_label", "Explanation"]))
+
+    def save(self, directory: str) -> None:
+        """
+        Saves the codes as .npy files and the tables as JSON, for memory-mapped loading.
+        """
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, CODES_FILE), np.ascontiguousarray(self.codes))
+        np.save(os.path.join(directory, EXPLANATION_CODES_FILE), np.ascontiguousarray(self.explanation_codes))
+        with open(os.path.join(directory, TABLES_FILE), "w", encoding="utf-8") as f:
+            json.dump({'labels': self.labels, 'explanations': self.explanations}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "ResultStore":
+        """
+        Loads a store saved with save.
+
+        Args:
+            directory (str): Directory of the store.
+            mmap (bool, optional): Memory-map the codes instead of reading them. Defaults to True.
+
+        Returns:
+            ResultStore: The loaded store.
+        """
+        mode = "r" if mmap else None
+        with open(os.path.join(directory, TABLES_FILE), encoding="utf-8") as f:
+            tables = json.load(f)
+        return cls(
+            tables['labels'],
+            np.load(os.path.join(directory, CODES_FILE), mmap_mode=mode),
+            tables['explanations'],
+            np.load(os.path.join(directory, EXPLANATION_CODES_FILE), mmap_mode=mode)
+        )
+
+
+class ResultStoreBuilder:
+    """
+    Appends results to growing code arrays, interning labels and explanations.
+    """
+
+    def __init__(self, labels_dict: Dict[str, str], default_label: str = "Others"):
+        """
+        Args:
+            labels_dict (Dict[str, str]): Dictionary with labels as keys and descriptions as values.
+            default_label (str, optional): Default label for unmatched filenames. Defaults to "Others".
+        """
+        self.labels = label_table(labels_dict, default_label)
+        self._label_codes = {label: code for code, label in enumerate(self.labels)}
+        self.explanations: List[str] = []
+        self._explanation_codes: Dict[str, int] = {}
+        self._codes = array("H")
+        self._explanation_code_array = array("I")
+
+    def append(self, result: Dict[str, str]) -> None:
+        """
+        Adds one result; a label outside the table is added to it.
+        """
+        label = result['label']
+        code = self._label_codes.get(label)
+        if code is None:
+            code = self._label_codes[label] = len(self.labels)
+            self.labels.append(label)
+        self._codes.append(code)
+
+        explanation = result['explanation']
+        explanation_code = self._explanation_codes.get(explanation)
+        if explanation_code is None:
+            explanation_code = self._explanation_codes[explanation] = len(self.explanations)
+            self.explanations.append(explanation)
+        self._explanation_code_array.append(explanation_code)
+
+    def extend(self, results: Iterable[Dict[str, str]]) -> None:
+        """
+        Adds results.
+        """
+        for result in results:
+            self.append(result)
+
+    def build(self) -> ResultStore:
+        """
+        Returns the store; codes are stored as uint8 when the label table allows it.
+        """
+        codes = np.array(self._codes, dtype=np.uint8 if len(self.labels) <= 256 else np.uint16)
+        explanation_codes = np.array(self._explanation_code_array, dtype=np.uint32)
+        return ResultStore(list(self.labels), codes, list(self.explanations), explanation_codes)
+
+
+def classify_to_store(
+    filenames: List[str],
+    labels_dict: Dict[str, str],
+    default_label: str = "Others",
+    classify_fn: Optional[Callable[..., List[Dict[str, str]]]] = None,
+    chunk_size: int = 10000
+) -> ResultStore:
+    """
+    Classifies filenames chunk by chunk into a ResultStore, so result dicts never pile up.
+
+    Args:
+        filenames (List[str]): List of filenames to classify.
+        labels_dict (Dict[str, str]): Dictionary with labels as keys and descriptions as values.
+        default_label (str, optional): Default label for unmatched filenames. Defaults to "Others".
+        classify_fn (Callable, optional): Function with the signature of work_4.classify_filenames.
+            Defaults to async_classify.classify_filenames_concurrent.
+        chunk_size (int, optional): Number of filenames per classification call. Defaults to 10000.
+
+    Returns:
+        ResultStore: Results in the order of filenames.
+    """
+    if classify_fn is None:
+        from async_classify import classify_filenames_concurrent as classify_fn
+
+    builder = ResultStoreBuilder(labels_dict, default_label)
+    for start in range(0, len(filenames), chunk_size):
+        builder.extend(classify_fn(filenames[start:start + chunk_size], labels_dict, default_label))
+    return builder.build()
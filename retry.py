@@ -0,0 +1,178 @@
+import asyncio
+import json
+import random
+import time
+from typing import Optional
+
+# HTTP statuses worth retrying: timeouts, conflicts, rate limits and server errors
+RETRYABLE_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+# Client errors that will fail the same way on every attempt
+FATAL_ERROR_NAMES = {
+    "AuthenticationError", "PermissionDeniedError", "BadRequestError", "InvalidRequestError",
+    "NotFoundError", "UnprocessableEntityError",
+}
+
+# Transient errors raised by the openai client or the network stack
+RETRYABLE_ERROR_NAMES = {
+    "RateLimitError", "APITimeoutError", "Timeout", "APIConnectionError", "InternalServerError",
+    "ServiceUnavailableError", "APIError", "TryAgain", "ConnectError", "ReadTimeout",
+    "RemoteProtocolError",
+}
+
+
+def status_code(exc: BaseException) -> Optional[int]:
+    """
+    Returns the HTTP status attached to an openai (v0 or v1) or httpx exception, if any.
+    """
+    for attribute in ("status_code", "http_status"):
+        value = getattr(exc, attribute, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(exc, "response", None)
+    value = getattr(response, "status_code", None)
+    return value if isinstance(value, int) else None
+
+
+def is_rate_limit(exc: BaseException) -> bool:
+    """
+    Tells whether an exception is a rate limit (HTTP 429).
+    """
+    return status_code(exc) == 429 or type(exc).__name__ == "RateLimitError"
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """
+    Tells retryable errors (rate limits, timeouts, 5xx, malformed JSON) apart from fatal ones.
+
+    Args:
+        exc (BaseException): The raised exception.
+
+    Returns:
+        bool: True if the request may succeed when sent again.
+    """
+    names = {cls.__name__ for cls in type(exc).__mro__}
+    if names & FATAL_ERROR_NAMES:
+        return False
+
+    status = status_code(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUSES
+
+    # A malformed answer can come out right on another attempt
+    if isinstance(exc, (json.JSONDecodeError, asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+
+    return bool(names & RETRYABLE_ERROR_NAMES)
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """
+    Returns the delay requested by the server through a Retry-After header, if any.
+    """
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after") or headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """
+    Jittered exponential backoff: attempt n waits a random delay in [0, min(max_delay, base_delay * 2**n)].
+    """
+
+    def __init__(self, max_attempts: int = 6, base_delay: float = 1.0, max_delay: float = 60.0, seed: Optional[int] = None):
+        """
+        Args:
+            max_attempts (int, optional): Attempts per request, including the first one. Defaults to 6.
+            base_delay (float, optional): Delay scale in seconds. Defaults to 1.0.
+            max_delay (float, optional): Upper bound of a delay in seconds. Defaults to 60.0.
+            seed (int, optional): Seed of the jitter. Defaults to None.
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._random = random.Random(seed)
+
+    def delay(self, attempt: int, exc: Optional[BaseException] = None) -> float:
+        """
+        Returns the delay before the next attempt.
+
+        Args:
+            attempt (int): Number of the failed attempt, starting at 0.
+            exc (BaseException, optional): The error, to honor a Retry-After header. Defaults to None.
+
+        Returns:
+            float: Delay in seconds.
+        """
+        delay = self._random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        requested = retry_after(exc) if exc is not None else None
+        return max(delay, requested) if requested is not None else delay
+
+    def should_retry(self, attempt: int, exc: BaseException) -> bool:
+        """
+        Tells whether a failed attempt should be retried.
+        """
+        return attempt + 1 < self.max_attempts and is_retryable(exc)
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD concurrency limit: additive increase on success, multiplicative decrease on rate limits.
+
+    The limit grows by about one slot per window of successful requests and is cut by
+    `decrease_factor` on a 429, at most once per `cooldown` seconds so that one burst of
+    rejections counts as a single congestion signal.
+    """
+
+    def __init__(
+        self,
+        initial: int = 8,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        decrease_factor: float = 0.5,
+        cooldown: float = 1.0
+    ):
+        """
+        Args:
+            initial (int, optional): Initial number of requests in flight. Defaults to 8.
+            min_limit (int, optional): Lower bound of the limit. Defaults to 1.
+            max_limit (int, optional): Upper bound of the limit. Defaults to 64.
+            decrease_factor (float, optional): Factor applied on a rate limit. Defaults to 0.5.
+            cooldown (float, optional): Minimum seconds between two decreases. Defaults to 1.0.
+        """
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        return self
+
+    async def __aexit__(self, *exc_info):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self) -> None:
+        """
+        Additive increase: about +1 slot once `limit` requests have succeeded.
+        """
+        self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    def on_rate_limited(self) -> None:
+        """
+        Multiplicative decrease, ignored during the cooldown of the previous decrease.
+        """
+        now = time.monotonic()
+        if now - self._last_decrease >= self.cooldown:
+            self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+            self._last_decrease = now
@@ -0,0 +1,220 @@
+import re
+from typing import Callable, List, Dict, Optional, Tuple
+
+from canonicalize import SEPARATOR_PATTERN, DIGITS_PATTERN
+from taxonomy import DEFAULT_TAXONOMY_PATH, load_taxonomy
+
+# Words that carry no signal about the bin
+STOPWORDS = {
+    "a", "an", "and", "or", "of", "the", "to", "for", "in", "on", "with", "by", "as", "at",
+    "is", "are", "be", "this", "that", "other", "all", "any", "such", "related", "documents",
+    "document", "including", "include", "includes", "concerning", "pertaining", "within",
+    "internal", "various", "different", "particular", "process", "information", "files",
+    "also", "encompasses", "directly", "regarding", "doc", "docx", "pdf", "txt", "xlsx",
+    "csv", "pptx", "xls", "file",
+}
+
+# Weight of a token depending on where it appears in the taxonomy
+LABEL_WEIGHT = 3.0
+KEY_WEIGHT = 2.0
+DESCRIPTION_WEIGHT = 1.0
+
+WORD_PATTERN = re.compile(r"[a-z]+")
+
+
+def normalize_token(token: str) -> str:
+    """
+    Lowercases a token and reduces simple plurals ('policies' -> 'policy', 'records' -> 'record').
+
+    Args:
+        token (str): Token to normalize.
+
+    Returns:
+        str: The normalized token.
+    """
+    token = token.lower()
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits a filename or a description into normalized tokens without stopwords or digits.
+
+    Args:
+        text (str): Text to tokenize.
+
+    Returns:
+        List[str]: The normalized tokens.
+    """
+    tokens = []
+    for part in SEPARATOR_PATTERN.split(text):
+        for word in WORD_PATTERN.findall(DIGITS_PATTERN.sub(" ", part.lower())):
+            if word not in STOPWORDS and len(word) > 1:
+                tokens.append(normalize_token(word))
+    return tokens
+
+
+class KeywordClassifier:
+    """
+    Local classifier matching filename tokens against a keyword index of the taxonomy.
+
+    The index maps every token to a weight per bin. Tokens found in fine label names weigh
+    more than tokens of bin descriptions, and tokens shared by several bins are down-weighted,
+    so a filename is only classified with high confidence when its evidence points to one bin.
+    """
+
+    def __init__(
+        self,
+        taxonomy: Optional[Dict[str, Dict]] = None,
+        labels_dict: Optional[Dict[str, str]] = None,
+        min_evidence: float = 3.0
+    ):
+        """
+        Args:
+            taxonomy (Dict[str, Dict], optional): Parsed taxonomy. Defaults to docs/categorization.md.
+            labels_dict (Dict[str, str], optional): Bins dictionary; its keys and descriptions are indexed too.
+            min_evidence (float, optional): Score needed for full confidence. Defaults to 3.0.
+        """
+        if taxonomy is None:
+            taxonomy = load_taxonomy(DEFAULT_TAXONOMY_PATH)
+        self.min_evidence = min_evidence
+
+        raw: Dict[str, Dict[str, float]] = {}
+
+        def add(text: str, bin_key: str, weight: float) -> None:
+            for token in set(tokenize(text)):
+                weights = raw.setdefault(token, {})
+                weights[bin_key] = max(weights.get(bin_key, 0.0), weight)
+
+        for bin_key, entry in taxonomy.items():
+            add(bin_key, bin_key, KEY_WEIGHT)
+            add(entry['description'], bin_key, DESCRIPTION_WEIGHT)
+            for label in entry['labels']:
+                add(label, bin_key, LABEL_WEIGHT)
+        for bin_key, description in (labels_dict or {}).items():
+            add(bin_key, bin_key, KEY_WEIGHT)
+            add(description, bin_key, DESCRIPTION_WEIGHT)
+
+        # Spread the weight of ambiguous tokens over the bins that share them
+        self.index: Dict[str, Tuple[Tuple[str, float], ...]] = {
+            token: tuple((bin_key, weight / len(weights)) for bin_key, weight in weights.items())
+            for token, weights in raw.items()
+        }
+
+    def predict(self, filename: str) -> Tuple[Optional[str], float, List[str]]:
+        """
+        Classifies a filename locally.
+
+        Args:
+            filename (str): Filename to classify.
+
+        Returns:
+            Tuple[Optional[str], float, List[str]]: The best bin (None without evidence), a confidence
+                between 0 and 1, and the tokens that matched the best bin.
+        """
+        scores: Dict[str, float] = {}
+        matches: Dict[str, List[str]] = {}
+        for token in tokenize(filename):
+            for bin_key, weight in self.index.get(token, ()):
+                scores[bin_key] = scores.get(bin_key, 0.0) + weight
+                matches.setdefault(bin_key, []).append(token)
+
+        if not scores:
+            return None, 0.0, []
+
+        best = max(scores, key=scores.get)
+        top = scores[best]
+
+        # Share of the evidence pointing to the best bin, scaled down when the evidence is thin
+        confidence = (top / sum(scores.values())) * min(1.0, top / self.min_evidence)
+        return best, confidence, matches[best]
+
+
+class TieredClassifier:
+    """
+    Classifies obvious filenames with the KeywordClassifier and sends the rest to the LLM.
+    """
+
+    def __init__(
+        self,
+        keyword_classifier: KeywordClassifier,
+        classify_fn: Callable[..., List[Dict[str, str]]] = None,
+        threshold: float = 0.8,
+        metrics=None
+    ):
+        """
+        Args:
+            keyword_classifier (KeywordClassifier): The local classifier.
+            classify_fn (Callable, optional): Function with the signature of work_4.classify_filenames
+                used below the threshold. Defaults to work_4.classify_filenames.
+            threshold (float, optional): Minimum confidence to keep a local answer. Defaults to 0.8.
+            metrics (Metrics, optional): Instrumentation receiving the 'tier_local' and 'tier_llm' counters.
+        """
+        if classify_fn is None:
+            from work_4 import classify_filenames as classify_fn
+        self.keyword_classifier = keyword_classifier
+        self.classify_fn = classify_fn
+        self.threshold = threshold
+        self.metrics = metrics
+        self.counters = {'local': 0, 'llm': 0}
+
+    def classify(
+        self,
+        filenames: List[str],
+        labels_dict: Dict[str, str],
+        default_label: str = "Others"
+    ) -> List[Dict[str, str]]:
+        """
+        Classifies filenames, calling the LLM only for low-confidence ones.
+
+        Args:
+            filenames (List[str]): List of filenames to classify.
+            labels_dict (Dict[str, str]): Dictionary with labels as keys and descriptions as values.
+            default_label (str, optional): Default label for unmatched filenames. Defaults to "Others".
+
+        Returns:
+            List[Dict[str, str]]: List of dictionaries containing 'label' and 'explanation' for each filename.
+        """
+        results: List[Optional[Dict[str, str]]] = [None] * len(filenames)
+        remaining = []
+
+        for index, filename in enumerate(filenames):
+            label, confidence, matched = self.keyword_classifier.predict(filename)
+            if label in labels_dict and confidence >= self.threshold:
+                results[index] = {
+                    'label': label,
+                    'explanation': f"Matched keywords: {', '.join(dict.fromkeys(matched))}."
+                }
+            else:
+                remaining.append(index)
+
+        self.counters['local'] += len(filenames) - len(remaining)
+        self.counters['llm'] += len(remaining)
+        if self.metrics is not None:
+            self.metrics.increment('tier_local', len(filenames) - len(remaining))
+            self.metrics.increment('tier_llm', len(remaining))
+
+        # Send only the uncertain filenames to the LLM
+        if remaining:
+            llm_results = self.classify_fn([filenames[i] for i in remaining], labels_dict, default_label)
+            for index, result in zip(remaining, llm_results):
+                results[index] = result
+
+        return results
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Returns the per-tier counters and the fraction of filenames classified locally.
+
+        Returns:
+            Dict[str, float]: Dictionary with 'local', 'llm' and 'local_fraction'.
+        """
+        total = self.counters['local'] + self.counters['llm']
+        return {
+            **self.counters,
+            'local_fraction': self.counters['local'] / total if total else 0.0
+        }
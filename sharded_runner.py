@@ -0,0 +1,384 @@
+import argparse
+import asyncio
+import csv
+import multiprocessing
+import os
+import time
+import zlib
+from typing import List, Dict, Optional
+
+from async_classify import RateLimiter
+from stream_pipeline import OUTPUT_COLUMNS, iter_filename_chunks, load_checkpoint, save_checkpoint
+
+
+def shard_of(filename: str, shards: int) -> int:
+    """
+    Returns the shard of a filename.
+
+    crc32 is used rather than hash(), which is salted per process, so every run and every
+    worker agrees on the shard, and duplicates of a filename always land in the same shard.
+    """
+    return zlib.crc32(filename.encode("utf-8")) % shards
+
+
+class SharedTokenBucket:
+    """
+    Token bucket whose state lives in shared memory, so processes draw from the same budget.
+
+    The bucket is created by the parent process and handed to the workers when they start.
+    Taking units holds an interprocess lock only for the refill arithmetic; waiting happens
+    outside of it with asyncio.sleep.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None, context=multiprocessing):
+        """
+        Args:
+            rate_per_minute (float): Number of units added to the bucket every minute.
+            capacity (float, optional): Maximum burst size. Defaults to rate_per_minute.
+            context (optional): multiprocessing context creating the shared values. Defaults to multiprocessing.
+        """
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(capacity if capacity is not None else rate_per_minute)
+        self._lock = context.Lock()
+        self._available = context.RawValue("d", self.capacity)
+        self._updated = context.RawValue("d", time.monotonic())
+
+    def _take(self, amount: float) -> float:
+        # Take the units if available and return 0, or return the seconds to wait for them
+        with self._lock:
+            now = time.monotonic()
+            available = min(self.capacity, self._available.value + (now - self._updated.value) * self.rate)
+            self._updated.value = now
+            if available >= amount:
+                self._available.value = available - amount
+                return 0.0
+            self._available.value = available
+            return (amount - available) / self.rate
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        """
+        Waits until `amount` units are available and takes them from the bucket.
+
+        Args:
+            amount (float, optional): Number of units to take. Defaults to 1.0.
+        """
+        amount = min(float(amount), self.capacity)
+        while True:
+            wait = self._take(amount)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+
+class SharedRateLimiter(RateLimiter):
+    """
+    Requests-per-minute and tokens-per-minute limiter shared by every worker process.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        context=multiprocessing
+    ):
+        """
+        Args:
+            requests_per_minute (float, optional): Maximum requests per minute over all workers. Unlimited if None.
+            tokens_per_minute (float, optional): Maximum tokens per minute over all workers. Unlimited if None.
+            context (optional): multiprocessing context of the workers. Defaults to multiprocessing.
+        """
+        self.requests = SharedTokenBucket(requests_per_minute, context=context) if requests_per_minute else None
+        self.tokens = SharedTokenBucket(tokens_per_minute, context=context) if tokens_per_minute else None
+
+
+def shard_paths(work_dir: str, shard: int) -> Dict[str, str]:
+    """
+    Returns the 'input' and 'output' paths of a shard.
+    """
+    return {
+        'input': os.path.join(work_dir, f"shard_{shard:03d}.csv"),
+        'output': os.path.join(work_dir, f"shard_{shard:03d}.out.csv")
+    }
+
+
+def split_input(
+    input_path: str,
+    work_dir: str,
+    shards: int,
+    column: str = "file names",
+    chunksize: int = 10000
+) -> Dict[str, object]:
+    """
+    Splits an inventory into shard files, streaming it chunk by chunk.
+
+    The split is recorded in a manifest with the size and modification time of the input, so
+    later runs reuse the shard files and a changed input or shard count is refused.
+
+    Args:
+        input_path (str): Path of the input file (.csv or .parquet).
+        work_dir (str): Directory holding the shards.
+        shards (int): Number of shards.
+        column (str, optional): Column holding the filenames. Defaults to "file names".
+        chunksize (int, optional): Number of rows per chunk. Defaults to 10000.
+
+    Returns:
+        Dict[str, object]: The manifest, with the number of 'rows' of every shard.
+
+    Raises:
+        ValueError: If the work directory holds a split of another input or shard count.
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    manifest_path = os.path.join(work_dir, "manifest.json")
+    stat = os.stat(input_path)
+    expected = {
+        'input': os.path.abspath(input_path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'shards': shards,
+        'column': column
+    }
+
+    if os.path.exists(manifest_path):
+        manifest = load_checkpoint(manifest_path)
+        if any(manifest.get(key) != value for key, value in expected.items()):
+            raise ValueError(f"Work directory {work_dir} holds shards of another input or shard count")
+        return manifest
+
+    rows = [0] * shards
+    files = [open(shard_paths(work_dir, shard)['input'], "w", newline="", encoding="utf-8") for shard in range(shards)]
+    try:
+        writers = [csv.writer(f) for f in files]
+        for writer in writers:
+            writer.writerow([column])
+        for _, filenames in iter_filename_chunks(input_path, column, chunksize):
+            for filename in filenames:
+                shard = shard_of(filename, shards)
+                writers[shard].writerow([filename])
+                rows[shard] += 1
+        for f in files:
+            f.flush()
+            os.fsync(f.fileno())
+    finally:
+        for f in files:
+            f.close()
+
+    # The manifest is written last, so an interrupted split is redone
+    manifest = {**expected, 'rows': rows}
+    save_checkpoint(manifest_path, manifest)
+    return manifest
+
+
+def run_shard(
+    work_dir: str,
+    shard: int,
+    labels_dict: Dict[str, str],
+    default_label: str = "Others",
+    max_concurrency: int = 16,
+    rate_limiter: Optional[RateLimiter] = None,
+    chunksize: int = 10000
+) -> int:
+    """
+    Classifies one shard with stream_pipeline.classify_file, resuming from its checkpoint.
+
+    Args:
+        work_dir (str): Directory holding the shards.
+        shard (int): Shard to classify.
+        labels_dict (Dict[str, str]): Dictionary with labels as keys and descriptions as values.
+        default_label (str, optional): Default label for unmatched filenames. Defaults to "Others".
+        max_concurrency (int, optional): Requests in flight for this shard. Defaults to 16.
+        rate_limiter (RateLimiter, optional): Limiter shared with the other shards. Defaults to None.
+        chunksize (int, optional): Number of rows per chunk. Defaults to 10000.
+
+    Returns:
+        int: Number of rows of the shard classified.
+    """
+    from filename_classifier import FilenameClassifier
+    from stream_pipeline import classify_file
+
+    paths = shard_paths(work_dir, shard)
+    classifier = FilenameClassifier(
+        labels_dict, default_label, max_concurrency=max_concurrency, rate_limiter=rate_limiter
+    )
+    try:
+        return classify_file(
+            paths['input'],
+            paths['output'],
+            labels_dict,
+            default_label,
+            chunksize=chunksize,
+            classify_fn=lambda filenames: classifier.classify(filenames, progress=False)
+        )
+    finally:
+        classifier.close()
+
+
+def _shard_worker(*args) -> None:
+    # Entry point of a worker process; a failure is reported through the exit code
+    try:
+        run_shard(*args)
+    except Exception as e:
+        print(f"Error processing shard {args[1]}: {e}")
+        raise SystemExit(1)
+
+
+def run_shards(
+    work_dir: str,
+    shards: List[int],
+    labels_dict: Dict[str, str],
+    default_label: str = "Others",
+    max_concurrency: int = 16,
+    requests_per_minute: Optional[float] = None,
+    tokens_per_minute: Optional[float] = None,
+    chunksize: int = 10000
+) -> List[int]:
+    """
+    Runs one worker process per shard, all drawing from one shared rate limit.
+
+    Args:
+        work_dir (str): Directory holding the shards.
+        shards (List[int]): Shards to classify.
+        labels_dict (Dict[str, str]): Dictionary with labels as keys and descriptions as values.
+        default_label (str, optional): Default label for unmatched filenames. Defaults to "Others".
+        max_concurrency (int, optional): Requests in flight per worker. Defaults to 16.
+        requests_per_minute (float, optional): Requests-per-minute limit over all workers. Defaults to None.
+        tokens_per_minute (float, optional): Tokens-per-minute limit over all workers. Defaults to None.
+        chunksize (int, optional): Number of rows per chunk. Defaults to 10000.
+
+    Returns:
+        List[int]: Shards whose worker failed.
+    """
+    # Spawned workers start from a clean interpreter instead of a copy of this one
+    context = multiprocessing.get_context("spawn")
+    rate_limiter = SharedRateLimiter(requests_per_minute, tokens_per_minute, context)
+
+    processes = {
+        shard: context.Process(
+            target=_shard_worker,
+            args=(work_dir, shard, labels_dict, default_label, max_concurrency, rate_limiter, chunksize),
+            name=f"shard-{shard}"
+        )
+        for shard in shards
+    }
+    for process in processes.values():
+        process.start()
+    for process in processes.values():
+        process.join()
+    return [shard for shard, process in processes.items() if process.exitcode != 0]
+
+
+def merge_shards(
+    input_path: str,
+    work_dir: str,
+    output_path: str,
+    labels_dict: Optional[Dict[str, str]] = None,
+    chunksize: int = 10000
+) -> int:
+    """
+    Merges the shard outputs into one output file in the order of the input.
+
+    The input is streamed again and every row takes the next row of its shard, which holds
+    its rows in input order, so no shard is loaded in memory. The output is written atomically.
+
+    Args:
+        input_path (str): Path of the input file (.csv or .parquet).
+        work_dir (str): Directory holding the shards.
+        output_path (str): Path of the merged output CSV file.
+        labels_dict (Dict[str, str], optional): Taxonomy of the run, recorded next to the output
+            for incremental.reclassify_file. Defaults to None.
+        chunksize (int, optional): Number of rows per chunk. Defaults to 10000.
+
+    Returns:
+        int: Number of rows written.
+
+    Raises:
+        ValueError: If a shard is incomplete or does not match the input.
+    """
+    manifest = load_checkpoint(os.path.join(work_dir, "manifest.json"))
+    shards = manifest['shards']
+    for shard, rows in enumerate(manifest['rows']):
+        done = load_checkpoint(shard_paths(work_dir, shard)['output'] + ".checkpoint")['rows']
+        if done != rows:
+            raise ValueError(f"Shard {shard} has {done} of {rows} rows classified")
+
+    files = [open(shard_paths(work_dir, shard)['output'], newline="", encoding="utf-8") for shard in range(shards)]
+    temporary = output_path + ".tmp"
+    written = 0
+    try:
+        readers = [csv.reader(f) for f in files]
+        for reader in readers:
+            next(reader)
+        with open(temporary, "w", newline="", encoding="utf-8") as output:
+            writer = csv.writer(output)
+            writer.writerow(OUTPUT_COLUMNS)
+            for _, filenames in iter_filename_chunks(input_path, manifest['column'], chunksize):
+                for filename in filenames:
+                    shard = shard_of(filename, shards)
+                    row = next(readers[shard])
+                    if row[0] != filename:
+                        raise ValueError(f"Shard {shard} is out of step with the input at {filename!r}")
+                    writer.writerow(row)
+                written += len(filenames)
+            output.flush()
+            os.fsync(output.fileno())
+    finally:
+        for f in files:
+            f.close()
+    os.replace(temporary, output_path)
+
+    if labels_dict is not None:
+        from incremental import save_snapshot
+        save_snapshot(output_path, labels_dict)
+    return written
+
+
+def reset_shard(work_dir: str, shard: int) -> None:
+    """
+    Discards the output and checkpoint of a shard, so its next run starts over.
+    """
+    output = shard_paths(work_dir, shard)['output']
+    for path in (output, output + ".checkpoint"):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    import json
+    from taxonomy import load_bins
+
+    parser = argparse.ArgumentParser(description="Classify a large inventory with one worker process per shard.")
+    parser.add_argument("input", help="Input .csv or .parquet file")
+    parser.add_argument("output", help="Merged output .csv file")
+    parser.add_argument("--shards", type=int, default=os.cpu_count() or 4, help="Number of shards and worker processes")
+    parser.add_argument("--work-dir", default=None, help="Directory of the shards (default: OUTPUT.shards)")
+    parser.add_argument("--shard", type=int, action="append", default=None,
+                        help="Run only this shard; repeat for several. Other shards are left as they are")
+    parser.add_argument("--fresh", action="store_true", help="Discard previous results of the shards run")
+    parser.add_argument("--column", default="file names", help="Column holding the filenames")
+    parser.add_argument("--chunksize", type=int, default=10000, help="Rows per chunk")
+    parser.add_argument("--max-concurrency", type=int, default=16, help="Requests in flight per worker")
+    parser.add_argument("--rpm", type=float, default=None, help="Requests per minute over all workers")
+    parser.add_argument("--tpm", type=float, default=None, help="Tokens per minute over all workers")
+    args = parser.parse_args()
+
+    bins = load_bins()
+    work_dir = args.work_dir or args.output + ".shards"
+    manifest = split_input(args.input, work_dir, args.shards, args.column, args.chunksize)
+    selected = args.shard if args.shard is not None else list(range(args.shards))
+    if args.fresh:
+        for shard in selected:
+            reset_shard(work_dir, shard)
+
+    started = time.perf_counter()
+    failed = run_shards(work_dir, selected, bins, max_concurrency=args.max_concurrency,
+                        requests_per_minute=args.rpm, tokens_per_minute=args.tpm, chunksize=args.chunksize)
+    if failed:
+        print(f"Shards {failed} failed; rerun them with " + " ".join(f"--shard {shard}" for shard in failed))
+        raise SystemExit(1)
+
+    try:
+        rows = merge_shards(args.input, work_dir, args.output, bins, args.chunksize)
+    except ValueError as e:
+        # Running a subset of shards leaves the others to be completed before the merge
+        print(f"Not merged: {e}")
+        raise SystemExit(1)
+    print(json.dumps({'rows': rows, 'shards': manifest['rows'], 'seconds': round(time.perf_counter() - started, 3)}))
@@ -0,0 +1,310 @@
+import argparse
+import csv
+import json
+import os
+from typing import Callable, Iterator, List, Dict, Optional, Tuple
+
+# Columns written to the output file, matching the DataFrame built in work_4.py, plus the
+# version of the taxonomy each row was classified with
+OUTPUT_COLUMNS = ["file names", "LLM_label", "Explanation", "Taxonomy_version"]
+
+
+def iter_filename_chunks(
+    path: str,
+    column: str = "file names",
+    chunksize: int = 10000,
+    start: int = 0
+) -> Iterator[Tuple[int, List[str]]]:
+    """
+    Reads the filename column of a CSV or Parquet file in chunks.
+
+    Args:
+        path (str): Path of the input file (.csv or .parquet).
+        column (str, optional): Column holding the filenames. Defaults to "file names".
+        chunksize (int, optional): Number of rows per chunk. Defaults to 10000.
+        start (int, optional): Number of data rows to skip. Defaults to 0.
+
+    Yields:
+        Tuple[int, List[str]]: Row offset of the chunk and its filenames.
+    """
+    offset = start
+
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        # Parquet is read batch by batch; only the requested column is decoded
+        skip = start
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=[column]):
+            filenames = [str(value) for value in batch.column(0).to_pylist()]
+            if skip >= len(filenames):
+                skip -= len(filenames)
+                continue
+            filenames, skip = filenames[skip:], 0
+            yield offset, filenames
+            offset += len(filenames)
+    else:
+        import pandas as pd
+
+        reader = pd.read_csv(
+            path,
+            usecols=[column],
+            dtype={column: str},
+            keep_default_na=False,
+            chunksize=chunksize,
+            skiprows=range(1, start + 1)
+        )
+        for chunk in reader:
+            filenames = chunk[column].tolist()
+            yield offset, filenames
+            offset += len(filenames)
+
+
+def load_checkpoint(path: str) -> Dict[str, int]:
+    """
+    Loads a checkpoint, or an empty one if the file does not exist.
+
+    Args:
+        path (str): Path of the checkpoint file.
+
+    Returns:
+        Dict[str, int]: Dictionary with 'rows' done, 'output_bytes' written and, for outputs
+            of classify_file, 'failures_bytes' of the failures file.
+    """
+    if not os.path.exists(path):
+        return {'rows': 0, 'output_bytes': 0}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_checkpoint(path: str, checkpoint: Dict[str, int]) -> None:
+    """
+    Writes a checkpoint atomically, so a crash never leaves a half-written file.
+
+    Args:
+        path (str): Path of the checkpoint file.
+        checkpoint (Dict[str, int]): Checkpoint to write.
+    """
+    temporary = path + ".tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+def finish_swap(checkpoint_path: str, checkpoint: Dict[str, object]) -> Dict[str, object]:
+    """
+    Moves the rewritten files of a pending swap into place, then clears the swap from the checkpoint.
+
+    A rewrite records the sizes of the new files and the paths to swap in the checkpoint
+    before replacing anything, so after a crash at any point the swap is finished here and
+    the checkpoint sizes match the files again. A path whose '.tmp' file is gone was
+    already replaced.
+
+    Args:
+        checkpoint_path (str): Path of the checkpoint file.
+        checkpoint (Dict[str, object]): Checkpoint holding the paths in 'swap'.
+
+    Returns:
+        Dict[str, object]: The checkpoint without the swap.
+    """
+    for path in checkpoint.get('swap', []):
+        if os.path.exists(path + ".tmp"):
+            os.replace(path + ".tmp", path)
+    checkpoint = {key: value for key, value in checkpoint.items() if key != 'swap'}
+    save_checkpoint(checkpoint_path, checkpoint)
+    return checkpoint
+
+
+def retry_failures(
+    output_path: str,
+    failures_path: str,
+    classify_fn: Callable[[List[str]], List[Dict[str, str]]],
+    version: str = "",
+    chunksize: int = 10000
+) -> int:
+    """
+    Classifies again the rows listed in a failures file and writes the rewritten files.
+
+    The output keeps its rows in input order: rows classified this time get their new result
+    and the current version, rows failing again stay "Error" and are listed in the new
+    failures file. Both are written next to the originals as '.tmp' files, for the caller to
+    record in its checkpoint and swap in with finish_swap.
+
+    Args:
+        output_path (str): Path of the output CSV file.
+        failures_path (str): Path of the failures file, one JSON line per failed row.
+        classify_fn (Callable): Function classifying a list of filenames.
+        version (str, optional): Taxonomy version of the rows classified again. Defaults to "".
+        chunksize (int, optional): Number of filenames per classify_fn call. Defaults to 10000.
+
+    Returns:
+        int: Number of rows still failing.
+    """
+    failures = {}
+    with open(failures_path, encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            failures[record['row']] = record['filename']
+
+    rows = sorted(failures)
+    results = {}
+    for start in range(0, len(rows), chunksize):
+        batch = rows[start:start + chunksize]
+        results.update(zip(batch, classify_fn([failures[row] for row in batch])))
+
+    temporary = output_path + ".tmp"
+    failures_temporary = failures_path + ".tmp"
+    still_failing = 0
+    with open(output_path, newline="", encoding="utf-8") as source, \
+            open(temporary, "w", newline="", encoding="utf-8") as output, \
+            open(failures_temporary, "w", encoding="utf-8") as failed:
+        reader = csv.reader(source)
+        writer = csv.writer(output)
+        writer.writerow(next(reader))
+        for index, row in enumerate(reader):
+            result = results.get(index)
+            if result is not None:
+                row = [row[0], result['label'], result['explanation'], version]
+                if result['label'] == "Error":
+                    failed.write(json.dumps({'row': index, 'filename': row[0]}, ensure_ascii=False) + "\n")
+                    still_failing += 1
+            writer.writerow(row)
+        for f in (output, failed):
+            f.flush()
+            os.fsync(f.fileno())
+    return still_failing
+
+
+def classify_file(
+    input_path: str,
+    output_path: str,
+    labels_dict: Optional[Dict[str, str]] = None,
+    default_label: str = "Others",
+    column: str = "file names",
+    chunksize: int = 10000,
+    checkpoint_path: Optional[str] = None,
+    classify_fn: Optional[Callable[[List[str]], List[Dict[str, str]]]] = None
+) -> int:
+    """
+    Classifies an inventory chunk by chunk, appending results to a CSV file.
+
+    After every chunk the output is flushed and a checkpoint records the rows done and the
+    output size. A restarted run truncates the output to that size, dropping rows written
+    after the last checkpoint, and continues with the next chunk. Only one chunk is held in
+    memory at a time. Rows are tagged with the version of labels_dict (see incremental.py).
+
+    Rows labelled "Error", e.g. after a rate limit or a server error, are written in place
+    and listed in a failures file, output_path + ".failures"; a rerun classifies them again
+    before resuming, see retry_failures.
+
+    Args:
+        input_path (str): Path of the input file (.csv or .parquet).
+        output_path (str): Path of the output CSV file.
+        labels_dict (Dict[str, str], optional): Dictionary with labels as keys and descriptions as values.
+            Required when classify_fn is not given.
+        default_label (str, optional): Default label for unmatched filenames. Defaults to "Others".
+        column (str, optional): Column holding the filenames. Defaults to "file names".
+        chunksize (int, optional): Number of rows per chunk. Defaults to 10000.
+        checkpoint_path (str, optional): Path of the checkpoint file. Defaults to output_path + ".checkpoint".
+        classify_fn (Callable, optional): Function classifying a list of filenames.
+            Defaults to FilenameClassifier(labels_dict, default_label).classify.
+
+    Returns:
+        int: Total number of rows classified, including rows of previous runs.
+
+    Raises:
+        ValueError: If the output file exists without its checkpoint.
+    """
+    if classify_fn is None:
+        from filename_classifier import FilenameClassifier
+        classify_fn = FilenameClassifier(labels_dict, default_label).classify
+
+    if checkpoint_path is None:
+        checkpoint_path = output_path + ".checkpoint"
+    failures_path = output_path + ".failures"
+
+    # Without its checkpoint, nothing tells which rows of an output are complete
+    if os.path.exists(output_path) and os.path.getsize(output_path) > 0 and not os.path.exists(checkpoint_path):
+        raise ValueError(f"Output file {output_path} exists without its checkpoint {checkpoint_path}")
+    checkpoint = load_checkpoint(checkpoint_path)
+
+    # A crash during a rewrite left the new files next to the old ones; sizes refer to the new
+    if checkpoint.get('swap'):
+        checkpoint = finish_swap(checkpoint_path, checkpoint)
+
+    # Tag every row with the taxonomy version so that later edits reclassify only what they affect
+    version = ""
+    if labels_dict is not None:
+        from incremental import save_snapshot
+        version = save_snapshot(output_path, labels_dict)
+
+    # Drop output rows and failures written after the last checkpoint
+    for path, size in ((output_path, checkpoint['output_bytes']), (failures_path, checkpoint.get('failures_bytes', 0))):
+        if os.path.exists(path):
+            with open(path, "r+b") as f:
+                f.truncate(size)
+
+    # Failed rows of previous runs are retried first
+    if checkpoint.get('failures_bytes', 0) > 0:
+        still_failing = retry_failures(output_path, failures_path, classify_fn, version, chunksize)
+        checkpoint = {
+            'rows': checkpoint['rows'],
+            'output_bytes': os.path.getsize(output_path + ".tmp"),
+            'failures_bytes': os.path.getsize(failures_path + ".tmp"),
+            'swap': [output_path, failures_path]
+        }
+        save_checkpoint(checkpoint_path, checkpoint)
+        checkpoint = finish_swap(checkpoint_path, checkpoint)
+        print(f"Retried failed rows, {still_failing} still failing")
+
+    with open(output_path, "a", newline="", encoding="utf-8") as output, \
+            open(failures_path, "a", encoding="utf-8") as failures:
+        writer = csv.writer(output)
+        if checkpoint['output_bytes'] == 0:
+            writer.writerow(OUTPUT_COLUMNS)
+
+        for offset, filenames in iter_filename_chunks(input_path, column, chunksize, checkpoint['rows']):
+            results = classify_fn(filenames)
+            writer.writerows(
+                (filename, result['label'], result['explanation'], version)
+                for filename, result in zip(filenames, results)
+            )
+            for index, (filename, result) in enumerate(zip(filenames, results)):
+                if result['label'] == "Error":
+                    failures.write(json.dumps({'row': offset + index, 'filename': filename}, ensure_ascii=False) + "\n")
+
+            # Make the chunk durable before recording it in the checkpoint
+            for f in (output, failures):
+                f.flush()
+                os.fsync(f.fileno())
+            checkpoint = {
+                'rows': offset + len(filenames),
+                'output_bytes': os.fstat(output.fileno()).st_size,
+                'failures_bytes': os.fstat(failures.fileno()).st_size
+            }
+            save_checkpoint(checkpoint_path, checkpoint)
+            print(f"Classified {checkpoint['rows']} rows")
+
+    return checkpoint['rows']
+
+
+if __name__ == "__main__":
+    from taxonomy import load_bins
+
+    parser = argparse.ArgumentParser(description="Classify a CSV/Parquet filename inventory in chunks.")
+    parser.add_argument("input", help="Input .csv or .parquet file")
+    parser.add_argument("output", help="Output .csv file")
+    parser.add_argument("--column", default="file names", help="Column holding the filenames")
+    parser.add_argument("--chunksize", type=int, default=10000, help="Rows per chunk")
+    parser.add_argument("--checkpoint", default=None, help="Checkpoint file (default: OUTPUT.checkpoint)")
+    args = parser.parse_args()
+
+    classify_file(
+        args.input,
+        args.output,
+        load_bins(),
+        column=args.column,
+        chunksize=args.chunksize,
+        checkpoint_path=args.checkpoint
+    )
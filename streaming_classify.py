@@ -0,0 +1,393 @@
+import asyncio
+import json
+import time
+from typing import AsyncIterator, List, Dict, Optional, Tuple
+
+from async_classify import RateLimiter, estimate_tokens
+from retry import RetryPolicy
+from taxonomy_index import index_for_labels
+from work_4 import build_chain, build_system_prompt, create_llm
+
+
+class LabelStreamParser:
+    """
+    Incremental parser of a streamed `{"label": ..., "explanation": ...}` completion.
+
+    Text is fed as it arrives and scanned once, tracking strings, escapes and nesting, so a
+    "label" appearing inside the explanation or a nested object is never mistaken for the
+    top-level key. The label is known as soon as its closing quote arrives, whatever the
+    order of the keys.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.label: Optional[str] = None
+        self._position = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._expect_key = False
+        self._key: Optional[str] = None
+
+    def feed(self, piece: str) -> Optional[str]:
+        """
+        Adds streamed text and returns the raw label once its value is complete, None before.
+        """
+        self.text += piece
+        while self.label is None and self._position < len(self.text):
+            char = self.text[self._position]
+            self._position += 1
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._end_string(json.loads(self.text[self._string_start - 1:self._position]))
+            elif char == '"':
+                self._in_string = True
+                self._string_start = self._position
+            elif char in "{[":
+                self._depth += 1
+                self._expect_key = char == "{" and self._depth == 1
+            elif char in "}]":
+                self._depth -= 1
+            elif char == ":" and self._depth == 1:
+                self._expect_key = False
+            elif char == "," and self._depth == 1:
+                self._expect_key = True
+                self._key = None
+        return self.label
+
+    def _end_string(self, value: str) -> None:
+        # Only strings of the top-level object matter: a key, or the value following "label"
+        if self._depth != 1:
+            return
+        if self._expect_key:
+            self._key = value
+        elif self._key == "label":
+            self.label = value
+
+
+class StreamingClassifier:
+    """
+    Classifies filenames from streamed completions, returning as soon as the label is decoded.
+
+    When explanations are not wanted, the stream is closed right after the label, which stops
+    the generation and returns the result after a fraction of the completion time. Time-to-label
+    and time-to-completion are reported as separate histograms, 'time_to_label_seconds' and
+    'time_to_completion_seconds'; cancelled streams are counted as 'streams_cancelled'.
+
+    As in AsyncClassifier, the cache is checked before a stream is opened, and a request
+    failing before its first token is retried with the backoff of the retry policy. Once
+    tokens have arrived a failure is final. Only complete results, explanation included,
+    are stored in the cache.
+    """
+
+    def __init__(
+        self,
+        chain,
+        labels: List[str],
+        default_label: str = "Others",
+        explanations: bool = False,
+        max_concurrency: int = 16,
+        rate_limiter: Optional[RateLimiter] = None,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 64,
+        metrics=None,
+        cache_scope=None,
+        retry_policy: Optional[RetryPolicy] = None
+    ):
+        """
+        Args:
+            chain: LLMChain expecting a 'filename' input variable; its model must support streaming.
+            labels (List[str]): List of predefined labels.
+            default_label (str, optional): Default label for unmatched filenames. Defaults to "Others".
+            explanations (bool, optional): Read the stream to its end for the explanation. Defaults to False.
+            max_concurrency (int, optional): Maximum number of requests in flight. Defaults to 16.
+            rate_limiter (RateLimiter, optional): Limiter applied before every request. Defaults to None.
+            prompt_tokens (int, optional): Estimated tokens of the system prompt. Defaults to 0.
+            completion_tokens (int, optional): Estimated tokens of a completion. Defaults to 64.
+            metrics (Metrics, optional): Instrumentation receiving every request. Defaults to None.
+            cache_scope (CacheScope, optional): Response cache bound to the chain's model and prompt. Defaults to None.
+            retry_policy (RetryPolicy, optional): Backoff for retryable errors before the first token;
+                no retries if None.
+        """
+        self.chain = chain
+        self.labels = labels
+        self.default_label = default_label
+        self.explanations = explanations
+        self.max_concurrency = max_concurrency
+        self.rate_limiter = rate_limiter
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.metrics = metrics
+        self.cache_scope = cache_scope
+        self.retry_policy = retry_policy
+        self.index = index_for_labels(labels)
+
+    def _resolve(self, label: str) -> str:
+        # Same rule as work_4.parse_response: rescue near-misses, default_label otherwise
+        resolved = self.index.resolve(label.strip())
+        return resolved if resolved is not None else self.default_label
+
+    def _cached(self, filename: str) -> Optional[Dict[str, str]]:
+        # Reuse the stored result if this request was already answered
+        if self.cache_scope is None:
+            return None
+        cached = self.cache_scope.get(filename)
+        if self.metrics is not None:
+            self.metrics.increment('cache_hits' if cached is not None else 'cache_misses')
+        return cached
+
+    def _should_retry(self, attempt: int, error: Exception) -> bool:
+        if self.retry_policy is None or not self.retry_policy.should_retry(attempt, error):
+            return False
+        if self.metrics is not None:
+            self.metrics.increment('retries')
+        return True
+
+    def _record(self, filename: str, started: float, outcome: str, text: str, attempt: int) -> None:
+        if self.metrics is not None:
+            self.metrics.record_request(
+                filename,
+                time.perf_counter() - started,
+                outcome,
+                prompt_tokens=self.prompt_tokens + estimate_tokens(filename),
+                completion_tokens=estimate_tokens(text),
+                attempt=attempt
+            )
+
+    async def _open_stream(self, filename: str) -> Tuple[AsyncIterator, Optional[object], float, int]:
+        """
+        Opens the stream of a filename and waits for its first chunk, retrying failures with backoff.
+
+        Returns:
+            Tuple: The stream, its first chunk (None for an empty stream), the start time of
+                the successful attempt and the number of retries before it.
+        """
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire(self.prompt_tokens + estimate_tokens(filename) + self.completion_tokens)
+
+            started = time.perf_counter()
+            stream = self.chain.llm.astream(self.chain.prompt.format_messages(filename=filename))
+            try:
+                return stream, await stream.__anext__(), started, attempt
+            except StopAsyncIteration:
+                return stream, None, started, attempt
+            except Exception as e:
+                # Nothing was received yet, so the request can be sent again
+                await stream.aclose()
+                self._record(filename, started, "error", "", attempt)
+                if not self._should_retry(attempt, e):
+                    raise
+                await asyncio.sleep(self.retry_policy.delay(attempt, e))
+                attempt += 1
+
+    async def stream_one(self, filename: str) -> AsyncIterator[Dict[str, str]]:
+        """
+        Streams the classification of a filename.
+
+        Yields the result with an empty explanation as soon as the label is decoded, then, if
+        the stream is read further, the result with the explanation. Closing the generator after
+        the first result cancels the request. A cached result is yielded alone, without any request.
+
+        Args:
+            filename (str): Filename to classify.
+
+        Yields:
+            Dict[str, str]: Dictionary containing 'label' and 'explanation'.
+        """
+        cached = self._cached(filename)
+        if cached is not None:
+            yield cached
+            return
+
+        stream, chunk, started, attempt = await self._open_stream(filename)
+        parser = LabelStreamParser()
+        label = None
+        completed = False
+        outcome = "error"
+        try:
+            while chunk is not None:
+                if label is not None:
+                    parser.text += chunk.content
+                else:
+                    raw = parser.feed(chunk.content)
+                    if raw is not None:
+                        label = self._resolve(raw)
+                        outcome = "ok"
+                        if self.metrics is not None:
+                            self.metrics.observe('time_to_label_seconds', time.perf_counter() - started)
+                        yield {'label': label, 'explanation': ""}
+                try:
+                    chunk = await stream.__anext__()
+                except StopAsyncIteration:
+                    chunk = None
+
+            if self.metrics is not None:
+                self.metrics.observe('time_to_completion_seconds', time.perf_counter() - started)
+
+            if label is None:
+                # No label in the stream: the full response decides, as in work_4
+                outcome = "parse_failure"
+                result = json.loads(parser.text.strip())
+                label = self._resolve(result.get('label', ''))
+                outcome = "ok"
+                explanation = result.get('explanation', '')
+            else:
+                try:
+                    explanation = json.loads(parser.text.strip()).get('explanation', '')
+                except json.JSONDecodeError:
+                    explanation = ""
+            completed = True
+            result = {'label': label, 'explanation': explanation.strip()}
+            if self.cache_scope is not None:
+                self.cache_scope.put(filename, result)
+            yield result
+
+        except GeneratorExit:
+            # The caller only wanted the label: closing the stream stops the generation
+            if not completed and self.metrics is not None:
+                self.metrics.increment('streams_cancelled')
+            raise
+
+        finally:
+            await stream.aclose()
+            self._record(filename, started, outcome, parser.text, attempt)
+
+    async def classify_one(self, filename: str) -> Dict[str, str]:
+        """
+        Classifies a single filename, stopping the stream after the label unless explanations are wanted.
+
+        Args:
+            filename (str): Filename to classify.
+
+        Returns:
+            Dict[str, str]: Dictionary containing 'label' and 'explanation'.
+        """
+        stream = self.stream_one(filename)
+        result = None
+        try:
+            async for result in stream:
+                if not self.explanations:
+                    break
+        except Exception as e:
+            print(f"Error processing filename {filename}: {e}")
+            return {
+                'label': "Error",
+                'explanation': str(e)
+            }
+        finally:
+            await stream.aclose()
+        return result
+
+    async def classify(self, filenames: List[str], progress: bool = True) -> List[Dict[str, str]]:
+        """
+        Classifies filenames concurrently.
+
+        Args:
+            filenames (List[str]): List of filenames to classify.
+            progress (bool, optional): Show a progress bar. Defaults to True.
+
+        Returns:
+            List[Dict[str, str]]: Results in the order of filenames.
+        """
+        results: List[Optional[Dict[str, str]]] = [None] * len(filenames)
+        positions = iter(enumerate(filenames))
+        bar = None
+        if progress:
+            from tqdm import tqdm
+            bar = tqdm(total=len(filenames), desc="Classifying filenames")
+
+        async def worker():
+            # Every worker pulls the next filename, so at most max_concurrency streams are open
+            for index, filename in positions:
+                results[index] = await self.classify_one(filename)
+                if bar is not None:
+                    bar.update(1)
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(min(self.max_concurrency, len(filenames)))))
+        finally:
+            if bar is not None:
+                bar.close()
+        return results
+
+
+async def classify_filenames_streaming_async(
+    filenames: List[str],
+    labels_dict: Dict[str, str],
+    default_label: str = "Others",
+    explanations: bool = False,
+    max_concurrency: int = 16,
+    requests_per_minute: Optional[float] = None,
+    tokens_per_minute: Optional[float] = None,
+    metrics=None,
+    cache=None,
+    max_attempts: int = 6
+) -> List[Dict[str, str]]:
+    """
+    Classifies filenames with streamed completions; see StreamingClassifier.
+
+    Args:
+        filenames (List[str]): List of filenames to classify.
+        labels_dict (Dict[str, str]): Dictionary with labels as keys and descriptions as values.
+        default_label (str, optional): Default label for unmatched filenames. Defaults to "Others".
+        explanations (bool, optional): Wait for the explanations instead of stopping after the
+            label; explanations are empty otherwise. Defaults to False.
+        max_concurrency (int, optional): Maximum number of requests in flight. Defaults to 16.
+        requests_per_minute (float, optional): Requests-per-minute limit. Defaults to None.
+        tokens_per_minute (float, optional): Tokens-per-minute limit. Defaults to None.
+        metrics (Metrics, optional): Instrumentation receiving every request. Defaults to None.
+        cache (ResponseCache, optional): Persistent cache of previous results. Defaults to None.
+        max_attempts (int, optional): Attempts per filename with jittered backoff on errors before
+            the first token. Defaults to 6.
+
+    Returns:
+        List[Dict[str, str]]: List of dictionaries containing 'label' and 'explanation' for each filename.
+    """
+    # Retries are handled by the classifier, so the client must not retry on its own as well
+    system_prompt = build_system_prompt(labels_dict, default_label)
+    llm = create_llm(streaming=True, max_retries=0) if max_attempts > 1 else create_llm(streaming=True)
+    chain = build_chain(llm, system_prompt)
+
+    classifier = StreamingClassifier(
+        chain,
+        list(labels_dict.keys()),
+        default_label=default_label,
+        explanations=explanations,
+        max_concurrency=max_concurrency,
+        rate_limiter=RateLimiter(requests_per_minute, tokens_per_minute),
+        prompt_tokens=estimate_tokens(system_prompt),
+        metrics=metrics,
+        cache_scope=cache.scope(llm.model_name, system_prompt) if cache is not None else None,
+        retry_policy=RetryPolicy(max_attempts) if max_attempts > 1 else None
+    )
+    return await classifier.classify(filenames)
+
+
+def classify_filenames_streaming(
+    filenames: List[str],
+    labels_dict: Dict[str, str],
+    default_label: str = "Others",
+    **kwargs
+) -> List[Dict[str, str]]:
+    """
+    Drop-in synchronous replacement for work_4.classify_filenames using streamed completions.
+
+    Args:
+        filenames (List[str]): List of filenames to classify.
+        labels_dict (Dict[str, str]): Dictionary with labels as keys and descriptions as values.
+        default_label (str, optional): Default label for unmatched filenames. Defaults to "Others".
+        **kwargs: Options of classify_filenames_streaming_async.
+
+    Returns:
+        List[Dict[str, str]]: List of dictionaries containing 'label' and 'explanation' for each filename.
+    """
+    return asyncio.run(classify_filenames_streaming_async(filenames, labels_dict, default_label, **kwargs))
@@ -0,0 +1,565 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Dict, Optional, Tuple
+
+LABEL_LINE_PATTERN = re.compile(r"^(?P<label>[^:\n]+):\s")
+BATCH_LINE_PATTERN = re.compile(r"^\d+\.\s(?P<filename>.+)$")
+CODE_LINE_PATTERN = re.compile(r"^(?P<code>[^:\n]+):\s(?P<label>\S+)\s-\s")
+
+# Streamed responses: share of the latency before the first token, characters per chunk
+STREAM_FIRST_TOKEN_FRACTION = 0.2
+STREAM_CHUNK_CHARS = 4
+
+# Prefix caching: prompts are cached in blocks of this many characters, like the token blocks of real backends
+PREFIX_BLOCK_CHARS = 256
+MAX_CACHED_PREFIXES = 100000
+
+
+def estimate_tokens(text: str) -> int:
+    # Same rough estimate as async_classify, without importing the client side
+    return len(text) // 4 + 1
+
+
+def parse_labels(system_prompt: str, user_message: str) -> List[str]:
+    """
+    Extracts the allowed labels from the prompts sent by the classifiers.
+
+    Args:
+        system_prompt (str): Content of the system message.
+        user_message (str): Content of the last user message.
+
+    Returns:
+        List[str]: The labels, in prompt order.
+    """
+    labels = []
+    if "LIST of LABELS and DESCRIPTIONS:" in system_prompt:
+        listing = system_prompt.split("LIST of LABELS and DESCRIPTIONS:", 1)[1]
+        for line in listing.strip().splitlines():
+            match = LABEL_LINE_PATTERN.match(line)
+            if match:
+                labels.append(match.group("label").strip())
+
+    # work_1.py sends the labels in the human message instead
+    for line in user_message.splitlines():
+        if line.startswith("LIST:"):
+            labels.extend(label.strip() for label in line[len("LIST:"):].split(",") if label.strip())
+
+    return labels or ["Others"]
+
+
+def choose_label(filename: str, labels: List[str]) -> str:
+    """
+    Picks a deterministic label: the first label whose name appears in the filename,
+    otherwise one chosen by a stable hash of the filename.
+
+    Args:
+        filename (str): Filename to classify.
+        labels (List[str]): Allowed labels.
+
+    Returns:
+        str: The chosen label.
+    """
+    lowered = filename.lower()
+    for label in labels:
+        if label.lower() in lowered:
+            return label
+    return labels[zlib.crc32(filename.encode("utf-8")) % len(labels)]
+
+
+def build_completion(system_prompt: str, user_message: str) -> str:
+    """
+    Builds the completion text in the format the prompt asks for.
+
+    Args:
+        system_prompt (str): Content of the system message.
+        user_message (str): Content of the last user message.
+
+    Returns:
+        str: The completion text.
+    """
+    # Compact prompts list 'CODE: Label - description' and expect the code only
+    if "LIST of CODES, LABELS and DESCRIPTIONS:" in system_prompt:
+        listing = system_prompt.split("LIST of CODES, LABELS and DESCRIPTIONS:", 1)[1]
+        codes = {
+            match.group("label"): match.group("code")
+            for match in map(CODE_LINE_PATTERN.match, listing.strip().splitlines())
+            if match
+        }
+        filename = user_message.splitlines()[0].replace("FILENAME:", "", 1).strip()
+        return codes[choose_label(filename, list(codes))] if codes else "?"
+
+    labels = parse_labels(system_prompt, user_message)
+
+    # Batched prompts list numbered filenames and expect a JSON array
+    if user_message.startswith("FILENAMES:"):
+        filenames = [
+            match.group("filename")
+            for match in map(BATCH_LINE_PATTERN.match, user_message.splitlines()[1:])
+            if match
+        ]
+        return json.dumps([
+            {
+                'filename': filename,
+                'label': choose_label(filename, labels),
+                'explanation': "Deterministic stub answer."
+            }
+            for filename in filenames
+        ])
+
+    filename = user_message.splitlines()[0]
+    if filename.startswith("FILENAME:"):
+        filename = filename[len("FILENAME:"):].strip()
+    label = choose_label(filename, labels)
+
+    if '"explanation"' in system_prompt:
+        return json.dumps({'label': label, 'explanation': "Deterministic stub answer."})
+    return label
+
+
+class StubState:
+    """
+    Configuration and counters shared by the request handlers.
+    """
+
+    def __init__(
+        self,
+        latency_ms: float = 200.0,
+        latency_sigma: float = 0.5,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        seed: int = 0,
+        prefill_ms_per_1k: float = 0.0,
+        prefix_cache: bool = False
+    ):
+        """
+        Args:
+            latency_ms (float, optional): Median latency of a response. Defaults to 200.0.
+            latency_sigma (float, optional): Sigma of the log-normal latency distribution;
+                0 gives a constant latency. Defaults to 0.5.
+            error_rate (float, optional): Fraction of requests answered with HTTP 500. Defaults to 0.0.
+            rate_limit_rate (float, optional): Fraction of requests answered with HTTP 429. Defaults to 0.0.
+            seed (int, optional): Seed of the latency and error draws. Defaults to 0.
+            prefill_ms_per_1k (float, optional): Latency added per 1000 prompt tokens not served
+                from the prefix cache. Defaults to 0.0.
+            prefix_cache (bool, optional): Cache prompt prefixes, so a prompt sharing its beginning
+                with an earlier one only pays the prefill of the rest. Defaults to False.
+        """
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.prefill_ms_per_1k = prefill_ms_per_1k
+        self.prefix_cache = prefix_cache
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.files: Dict[str, bytes] = {}
+        self.batches: Dict[str, Dict] = {}
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Clears the counters.
+        """
+        with self._lock:
+            self.requests = 0
+            self.statuses: Dict[int, int] = {}
+            self.prompt_tokens = 0
+            self.completion_tokens = 0
+            self.latencies: List[float] = []
+            self.cancelled_streams = 0
+            self.cached_prompt_tokens = 0
+            self.prefixes = set()
+
+    def draw(self) -> Tuple[float, int]:
+        """
+        Draws the latency in seconds and the HTTP status of the next response.
+        """
+        with self._lock:
+            latency = self.latency_ms / 1000.0
+            if self.latency_sigma > 0:
+                latency *= self._random.lognormvariate(0.0, self.latency_sigma)
+            outcome = self._random.random()
+
+        if outcome < self.rate_limit_rate:
+            return latency / 10, 429
+        if outcome < self.rate_limit_rate + self.error_rate:
+            return latency, 500
+        return latency, 200
+
+    def record(self, status: int, prompt_tokens: int, completion_tokens: int, latency: float) -> None:
+        """
+        Updates the counters after a response.
+        """
+        with self._lock:
+            self.requests += 1
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.latencies.append(latency)
+
+    def add_file(self, content: bytes) -> str:
+        """
+        Stores an uploaded or generated file and returns its id.
+        """
+        with self._lock:
+            file_id = f"file-stub-{len(self.files) + 1}"
+            self.files[file_id] = content
+        return file_id
+
+    def run_batch(self, batch_id: str) -> None:
+        """
+        Answers every request of a batch, writing the output and error files like the Batch API.
+        """
+        batch = self.batches[batch_id]
+        outputs, errors = [], []
+        for line in self.files[batch['input_file_id']].decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            messages = request['body'].get("messages", [])
+            system_prompt = "\n".join(m.get("content", "") for m in messages if m.get("role") == "system")
+            user_messages = [m.get("content", "") for m in messages if m.get("role") == "user"]
+            prompt_tokens = sum(estimate_tokens(m.get("content", "")) for m in messages)
+
+            _, status = self.draw()
+            if status != 200:
+                self.record(status, prompt_tokens, 0, 0.0)
+                errors.append({
+                    'id': f"batch-req-{len(outputs) + len(errors)}",
+                    'custom_id': request['custom_id'],
+                    'response': {'status_code': status, 'body': {'error': {'message': "Stub failure"}}},
+                    'error': None
+                })
+                continue
+
+            content = build_completion(system_prompt, user_messages[-1] if user_messages else "")
+            completion_tokens = estimate_tokens(content)
+            self.record(status, prompt_tokens, completion_tokens, 0.0)
+            outputs.append({
+                'id': f"batch-req-{len(outputs) + len(errors)}",
+                'custom_id': request['custom_id'],
+                'response': {
+                    'status_code': 200,
+                    'body': {
+                        'object': "chat.completion",
+                        'model': request['body'].get("model", "stub"),
+                        'choices': [{'index': 0, 'message': {'role': "assistant", 'content': content}, 'finish_reason': "stop"}],
+                        'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens}
+                    }
+                },
+                'error': None
+            })
+
+        def to_jsonl(lines: List[Dict]) -> bytes:
+            return "".join(json.dumps(line) + "\n" for line in lines).encode("utf-8")
+
+        # Let pollers see the batch in progress for a moment
+        time.sleep(self.latency_ms / 1000.0)
+        batch['output_file_id'] = self.add_file(to_jsonl(outputs)) if outputs else None
+        batch['error_file_id'] = self.add_file(to_jsonl(errors)) if errors else None
+        batch['request_counts'] = {'total': len(outputs) + len(errors), 'completed': len(outputs), 'failed': len(errors)}
+        batch['status'] = "completed"
+
+    def list_batches(self, query: Dict[str, List[str]]) -> Dict[str, object]:
+        """
+        Returns a page of batches, newest first, like the list endpoint of the Batch API.
+        """
+        limit = int(query.get("limit", ["20"])[0])
+        with self._lock:
+            batches = list(reversed(list(self.batches.values())))
+        if "after" in query:
+            ids = [batch['id'] for batch in batches]
+            after = query['after'][0]
+            batches = batches[ids.index(after) + 1:] if after in ids else []
+        return {'object': "list", 'data': batches[:limit], 'has_more': len(batches) > limit}
+
+    def stats(self) -> Dict[str, object]:
+        """
+        Returns a snapshot of the counters.
+        """
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'statuses': dict(self.statuses),
+                'prompt_tokens': self.prompt_tokens,
+                'completion_tokens': self.completion_tokens,
+                'latencies': list(self.latencies),
+                'cancelled_streams': self.cancelled_streams,
+                'cached_prompt_tokens': self.cached_prompt_tokens
+            }
+
+    def prefill(self, prompt: str) -> Tuple[float, int]:
+        """
+        Returns the prefill latency in seconds of a prompt and its tokens served from the prefix cache.
+
+        The cached part is the longest run of leading blocks already seen in an earlier prompt,
+        so a prompt that differs early, e.g. in the first lines of the instructions, gets
+        almost nothing from the cache.
+        """
+        cached_chars = 0
+        if self.prefix_cache:
+            with self._lock:
+                if len(self.prefixes) > MAX_CACHED_PREFIXES:
+                    self.prefixes.clear()
+                hit = True
+                for end in range(PREFIX_BLOCK_CHARS, len(prompt) + 1, PREFIX_BLOCK_CHARS):
+                    key = hash(prompt[:end])
+                    if hit and key in self.prefixes:
+                        cached_chars = end
+                    else:
+                        hit = False
+                        self.prefixes.add(key)
+                self.cached_prompt_tokens += cached_chars // 4
+        uncached_tokens = estimate_tokens(prompt[cached_chars:])
+        return self.prefill_ms_per_1k * uncached_tokens / 1e6, cached_chars // 4
+
+    def cancel_stream(self) -> None:
+        """
+        Counts a streamed response the client closed before its end.
+        """
+        with self._lock:
+            self.cancelled_streams += 1
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Handler of the OpenAI-compatible chat completions, files and batches endpoints.
+    """
+
+    state: StubState = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        # Keep benchmark output readable
+        pass
+
+    def _send_json(self, status: int, body: Dict, headers: Optional[Dict[str, str]] = None) -> None:
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_stream(self, body: Dict, content: str, seconds: float) -> None:
+        """
+        Sends a completion as server-sent events, a few characters per chunk, spread over `seconds`.
+
+        The connection is closed at the end of the stream, so no chunked encoding is needed.
+        A client closing the connection early is counted as a cancelled stream.
+        """
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+        pieces = [content[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(content), STREAM_CHUNK_CHARS)]
+        deltas = [{'role': "assistant", 'content': ""}] + [{'content': piece} for piece in pieces] + [{}]
+        try:
+            for position, delta in enumerate(deltas):
+                chunk = {
+                    'id': f"chatcmpl-stub-{self.state.requests}",
+                    'object': "chat.completion.chunk",
+                    'created': int(time.time()),
+                    'model': body.get("model", "stub"),
+                    'choices': [{
+                        'index': 0,
+                        'delta': delta,
+                        'finish_reason': "stop" if position == len(deltas) - 1 else None
+                    }]
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                if delta.get("content"):
+                    time.sleep(seconds / len(pieces))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            self.state.cancel_stream()
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        path = url.path.rstrip("/")
+        if path == "/stats":
+            self._send_json(200, self.state.stats())
+        elif path.endswith("/batches"):
+            self._send_json(200, self.state.list_batches(urllib.parse.parse_qs(url.query)))
+        elif "/batches/" in path:
+            batch = self.state.batches.get(path.rsplit("/", 1)[1])
+            if batch is None:
+                self._send_json(404, {'error': {'message': "No such batch"}})
+            else:
+                self._send_json(200, batch)
+        elif "/files/" in path and path.endswith("/content"):
+            content = self.state.files.get(path.split("/files/", 1)[1][:-len("/content")])
+            if content is None:
+                self._send_json(404, {'error': {'message': "No such file"}})
+            else:
+                self.send_response(200)
+                self.send_header("Content-Type", "application/jsonl")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+        elif self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {'object': "list", 'data': []})
+        else:
+            self._send_json(404, {'error': {'message': "Not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length)
+
+        # File upload of the Batch API: a multipart form with the JSONL file
+        if self.path.rstrip("/").endswith("/files"):
+            boundary = self.headers.get("Content-Type", "").split("boundary=", 1)[-1].encode("utf-8")
+            content = b""
+            for part in raw.split(b"--" + boundary):
+                head, _, data = part.partition(b"\r\n\r\n")
+                if b'name="file"' in head:
+                    content = data[:-2] if data.endswith(b"\r\n") else data
+            file_id = self.state.add_file(content)
+            self._send_json(200, {'id': file_id, 'object': "file", 'bytes': len(content), 'purpose': "batch"})
+            return
+
+        body = json.loads(raw or b"{}")
+
+        if self.path.rstrip("/").endswith("/batches"):
+            batch_id = f"batch-stub-{len(self.state.batches) + 1}"
+            self.state.batches[batch_id] = {
+                'id': batch_id,
+                'object': "batch",
+                'endpoint': body.get("endpoint"),
+                'input_file_id': body.get("input_file_id"),
+                'completion_window': body.get("completion_window", "24h"),
+                'status': "in_progress",
+                'output_file_id': None,
+                'error_file_id': None,
+                'created_at': int(time.time())
+            }
+            threading.Thread(target=self.state.run_batch, args=(batch_id,), daemon=True).start()
+            self._send_json(200, self.state.batches[batch_id])
+            return
+
+        if self.path.rstrip("/") == "/reset":
+            self.state.reset()
+            self._send_json(200, {})
+            return
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {'error': {'message': "Not found"}})
+            return
+
+        started = time.perf_counter()
+        messages = body.get("messages", [])
+        system_prompt = "\n".join(m.get("content", "") for m in messages if m.get("role") == "system")
+        user_messages = [m.get("content", "") for m in messages if m.get("role") == "user"]
+        user_message = user_messages[-1] if user_messages else ""
+        prompt_tokens = sum(estimate_tokens(m.get("content", "")) for m in messages)
+
+        latency, status = self.state.draw()
+        cached_tokens = 0
+        if status == 200:
+            prefill, cached_tokens = self.state.prefill("".join(m.get("content", "") for m in messages))
+            latency += prefill
+        # A streamed response sends its first token after a fraction of the latency
+        time.sleep(latency * STREAM_FIRST_TOKEN_FRACTION if body.get("stream") and status == 200 else latency)
+
+        if status == 429:
+            self.state.record(status, prompt_tokens, 0, time.perf_counter() - started)
+            self._send_json(
+                429,
+                {'error': {'message': "Rate limit reached", 'type': "rate_limit_error", 'code': "rate_limit_exceeded"}},
+                {'Retry-After': "1"}
+            )
+            return
+        if status == 500:
+            self.state.record(status, prompt_tokens, 0, time.perf_counter() - started)
+            self._send_json(500, {'error': {'message': "Internal server error", 'type': "server_error"}})
+            return
+
+        content = build_completion(system_prompt, user_message)
+        completion_tokens = estimate_tokens(content)
+        if body.get("stream"):
+            self._send_stream(body, content, latency * (1 - STREAM_FIRST_TOKEN_FRACTION))
+            self.state.record(status, prompt_tokens, completion_tokens, time.perf_counter() - started)
+            return
+
+        self.state.record(status, prompt_tokens, completion_tokens, time.perf_counter() - started)
+        self._send_json(200, {
+            'id': f"chatcmpl-stub-{self.state.requests}",
+            'object': "chat.completion",
+            'created': int(time.time()),
+            'model': body.get("model", "stub"),
+            'choices': [{
+                'index': 0,
+                'message': {'role': "assistant", 'content': content},
+                'finish_reason': "stop"
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens,
+                'prompt_tokens_details': {'cached_tokens': cached_tokens}
+            }
+        })
+
+
+def start_stub_server(host: str = "127.0.0.1", port: int = 0, **config) -> Tuple[ThreadingHTTPServer, str]:
+    """
+    Starts the stub server in a background thread.
+
+    Args:
+        host (str, optional): Interface to bind. Defaults to "127.0.0.1".
+        port (int, optional): Port to bind, 0 for any free port. Defaults to 0.
+        **config: Options of StubState (latency_ms, latency_sigma, error_rate, rate_limit_rate, seed,
+            prefill_ms_per_1k, prefix_cache).
+
+    Returns:
+        Tuple[ThreadingHTTPServer, str]: The server, and the base URL to put in BASE_URL.
+    """
+    handler = type("ConfiguredStubHandler", (StubHandler,), {'state': StubState(**config)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub chat completions server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="Median response latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Sigma of the log-normal latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of HTTP 500 responses")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of HTTP 429 responses")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--prefill-ms-per-1k", type=float, default=0.0, help="Latency per 1000 uncached prompt tokens")
+    parser.add_argument("--prefix-cache", action="store_true", help="Serve repeated prompt prefixes from a cache")
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(
+        args.host,
+        args.port,
+        latency_ms=args.latency_ms,
+        latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        seed=args.seed,
+        prefill_ms_per_1k=args.prefill_ms_per_1k,
+        prefix_cache=args.prefix_cache
+    )
+    print(f"Stub server listening, set BASE_URL={base_url}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
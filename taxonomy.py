@@ -0,0 +1,101 @@
+import ast
+import os
+import re
+from typing import Dict
+
+# Location of the bin -> label taxonomy shipped with the repository
+DEFAULT_TAXONOMY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "docs", "categorization.md")
+
+BIN_HEADER_PATTERN = re.compile(r"^###\s+\*\*Bin\s+\d+:\s*(?P<title>.+?)\*\*\s*$")
+LABEL_PATTERN = re.compile(r"^-\s+\*\*(?P<label>.+?)\*\*:?\s*(?P<description>.*)$")
+BINS_BLOCK_PATTERN = re.compile(r"```python\s*bins\s*=\s*(?P<body>\{.*?\})\s*```", re.DOTALL)
+
+
+def parse_bins_block(text: str) -> Dict[str, str]:
+    """
+    Extracts the `bins` dictionary from the Python code block of the taxonomy document.
+
+    Args:
+        text (str): Content of the taxonomy document.
+
+    Returns:
+        Dict[str, str]: Dictionary with bin keys as keys and descriptions as values, empty if absent.
+    """
+    match = BINS_BLOCK_PATTERN.search(text)
+    if match is None:
+        return {}
+    return ast.literal_eval(match.group("body"))
+
+
+def load_taxonomy(path: str = DEFAULT_TAXONOMY_PATH) -> Dict[str, Dict]:
+    """
+    Parses the bin -> fine label taxonomy from docs/categorization.md.
+
+    Bins are keyed like the `bins` dictionary used in work_3.py/work_4.py (e.g. 'AdminHR'),
+    matched through their descriptions. Bins without a match keep their Markdown title.
+
+    Args:
+        path (str, optional): Path of the taxonomy document. Defaults to docs/categorization.md.
+
+    Returns:
+        Dict[str, Dict]: Mapping of bin key to a dictionary with 'title', 'description' and
+            'labels' (fine label -> description, empty when the document gives none).
+    """
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+
+    # Descriptions are identical in the Markdown sections and in the code block
+    keys_by_description = {description: key for key, description in parse_bins_block(text).items()}
+
+    taxonomy: Dict[str, Dict] = {}
+    current = None
+    expecting_description = False
+    for line in text.splitlines():
+        line = line.strip()
+
+        header = BIN_HEADER_PATTERN.match(line)
+        if header:
+            current = {'title': header.group("title").strip(), 'description': "", 'labels': {}}
+            taxonomy[current['title']] = current
+            continue
+
+        # Every bin section ends with a horizontal rule
+        if line == "---":
+            current = None
+            continue
+
+        if current is None or not line:
+            continue
+
+        if line == "**Description:**":
+            expecting_description = True
+        elif expecting_description:
+            current['description'] = line
+            expecting_description = False
+        else:
+            label = LABEL_PATTERN.match(line)
+            if label:
+                current['labels'][label.group("label").strip()] = label.group("description").strip()
+
+    # Re-key the bins with the keys of the `bins` dictionary
+    return {
+        keys_by_description.get(entry['description'], title): entry
+        for title, entry in taxonomy.items()
+    }
+
+
+def load_bins(path: str = DEFAULT_TAXONOMY_PATH, default_label: str = "Others") -> Dict[str, str]:
+    """
+    Loads the `bins` dictionary of the taxonomy document, with the default bin appended.
+
+    Args:
+        path (str, optional): Path of the taxonomy document. Defaults to docs/categorization.md.
+        default_label (str, optional): Key of the catch-all bin. Defaults to "Others".
+
+    Returns:
+        Dict[str, str]: Dictionary with bin keys as keys and descriptions as values.
+    """
+    with open(path, encoding="utf-8") as f:
+        bins = parse_bins_block(f.read())
+    bins[default_label] = "Documents that do not fit into any of the above categories."
+    return bins
@@ -0,0 +1,217 @@
+import functools
+import os
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from taxonomy import DEFAULT_TAXONOMY_PATH, load_taxonomy
+
+# Fine labels documented as typos, e.g. '**comnliance** (typo of compliance)'
+TYPO_PATTERN = re.compile(r"\(typo of (?P<target>[^)]+)\)", re.IGNORECASE)
+PREFIX_PATTERN = re.compile(r"^\s*(label|category|bin)\s*:\s*", re.IGNORECASE)
+NON_ALNUM_PATTERN = re.compile(r"[^a-z0-9]+")
+
+# Ways an answer of the model can be resolved, from the cheapest to the last resort
+RESCUE_PATHS = ("exact", "normalized", "alias", "fine_label", "fuzzy", "unresolved")
+
+# Bound of the memo of answers, in case a model returns free text
+MAX_MEMO_ENTRIES = 100000
+
+
+def normalize_key(text: str) -> str:
+    """
+    Reduces a label to a case-, space- and punctuation-insensitive key.
+
+    Args:
+        text (str): Label or answer of the model, e.g. 'Legal Compliance.'.
+
+    Returns:
+        str: The key, e.g. 'legalcompliance'.
+    """
+    return NON_ALNUM_PATTERN.sub("", PREFIX_PATTERN.sub("", text).lower())
+
+
+def trigrams(key: str) -> List[str]:
+    """
+    Returns the character trigrams of a key, padded so that short keys have some.
+    """
+    padded = f"  {key} "
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+
+class TaxonomyIndex:
+    """
+    Resolves answers of the model to one of the allowed labels.
+
+    The index is compiled once from the labels and the taxonomy document: normalized label
+    keys and bin titles, aliases and documented typos, fine labels mapped to their bin, and a
+    character-trigram index for fuzzy matching. Resolving is a dictionary lookup, except for
+    the first fuzzy match of an answer, and every answer is memoized.
+    """
+
+    def __init__(
+        self,
+        labels: Iterable[str],
+        taxonomy: Optional[Dict[str, Dict]] = None,
+        aliases: Optional[Dict[str, str]] = None,
+        fuzzy_threshold: float = 0.6
+    ):
+        """
+        Args:
+            labels (Iterable[str]): Allowed labels, e.g. the keys of `bins`.
+            taxonomy (Dict[str, Dict], optional): Parsed taxonomy providing bin titles and fine labels.
+                Defaults to None.
+            aliases (Dict[str, str], optional): Extra alias -> label (or fine label) entries. Defaults to None.
+            fuzzy_threshold (float, optional): Minimum trigram similarity of a fuzzy match. Defaults to 0.6.
+        """
+        self.labels = list(labels)
+        self.label_set = set(self.labels)
+        self.fuzzy_threshold = fuzzy_threshold
+
+        # Normalized key -> (label, rescue path); the first source of a key wins
+        self.keys: Dict[str, Tuple[str, str]] = {}
+        ambiguous = set()
+
+        def add(text: str, label: str, path: str) -> None:
+            key = normalize_key(text)
+            if not key:
+                return
+            if key in self.keys and self.keys[key][0] != label:
+                # A key shared by different labels cannot rescue anything
+                if self.keys[key][1] != "normalized":
+                    ambiguous.add(key)
+                return
+            self.keys.setdefault(key, (label, path))
+
+        for label in self.labels:
+            add(label, label, "normalized")
+
+        typos: List[Tuple[str, str]] = []
+        for bin_key, entry in (taxonomy or {}).items():
+            if bin_key not in self.label_set:
+                continue
+            add(entry['title'], bin_key, "alias")
+            for fine_label, description in entry['labels'].items():
+                typo = TYPO_PATTERN.search(description)
+                if typo:
+                    typos.append((fine_label, typo.group("target")))
+                else:
+                    add(fine_label, bin_key, "fine_label")
+
+        # Aliases and typos point to a label or to a fine label already indexed
+        for alias, target in [*typos, *(aliases or {}).items()]:
+            resolved = self.keys.get(normalize_key(target))
+            if target in self.label_set:
+                add(alias, target, "alias")
+            elif resolved is not None:
+                add(alias, resolved[0], "alias")
+
+        for key in ambiguous:
+            del self.keys[key]
+
+        # Trigram -> keys containing it, for the fuzzy path
+        self.trigram_index: Dict[str, List[str]] = {}
+        for key in self.keys:
+            for gram in set(trigrams(key)):
+                self.trigram_index.setdefault(gram, []).append(key)
+
+        self.counters = {path: 0 for path in RESCUE_PATHS}
+        self._memo: Dict[str, Tuple[Optional[str], str]] = {}
+
+    def _fuzzy(self, key: str) -> Optional[str]:
+        # Dice similarity over trigrams, counted only for keys sharing at least one trigram
+        grams = set(trigrams(key))
+        shared: Dict[str, int] = {}
+        for gram in grams:
+            for candidate in self.trigram_index.get(gram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+
+        best, best_score = None, self.fuzzy_threshold
+        for candidate, count in shared.items():
+            score = 2.0 * count / (len(grams) + len(set(trigrams(candidate))))
+            if score >= best_score:
+                best, best_score = candidate, score
+        return self.keys[best][0] if best is not None else None
+
+    def resolve_with_path(self, answer: str) -> Tuple[Optional[str], str]:
+        """
+        Resolves an answer and tells which path resolved it.
+
+        Args:
+            answer (str): Label returned by the model.
+
+        Returns:
+            Tuple[Optional[str], str]: The label (None if unresolved) and one of RESCUE_PATHS.
+        """
+        memo = self._memo.get(answer)
+        if memo is None:
+            if answer in self.label_set:
+                memo = (answer, "exact")
+            else:
+                key = normalize_key(answer)
+                if key in self.keys:
+                    memo = self.keys[key]
+                elif key.endswith("s") and key[:-1] in self.keys:
+                    memo = self.keys[key[:-1]]
+                else:
+                    label = self._fuzzy(key) if key else None
+                    memo = (label, "fuzzy" if label is not None else "unresolved")
+            if len(self._memo) < MAX_MEMO_ENTRIES:
+                self._memo[answer] = memo
+
+        self.counters[memo[1]] += 1
+        return memo
+
+    def resolve(self, answer: str) -> Optional[str]:
+        """
+        Resolves an answer of the model to an allowed label.
+
+        Args:
+            answer (str): Label returned by the model.
+
+        Returns:
+            Optional[str]: The label, or None if nothing matches.
+        """
+        return self.resolve_with_path(answer)[0]
+
+
+@functools.lru_cache(maxsize=None)
+def _default_taxonomy() -> Dict[str, Dict]:
+    # The taxonomy document is optional for callers using their own labels
+    if not os.path.exists(DEFAULT_TAXONOMY_PATH):
+        return {}
+    return load_taxonomy(DEFAULT_TAXONOMY_PATH)
+
+
+# Shared indexes, one per list of labels
+_INDEXES: Dict[Tuple[str, ...], TaxonomyIndex] = {}
+
+
+def index_for_labels(labels: Iterable[str]) -> TaxonomyIndex:
+    """
+    Returns the index of a list of labels, compiled on first use with docs/categorization.md.
+
+    Args:
+        labels (Iterable[str]): Allowed labels.
+
+    Returns:
+        TaxonomyIndex: The shared index of these labels.
+    """
+    key = tuple(labels)
+    index = _INDEXES.get(key)
+    if index is None:
+        index = _INDEXES[key] = TaxonomyIndex(key, _default_taxonomy())
+    return index
+
+
+def rescue_stats() -> Dict[str, int]:
+    """
+    Returns how often each rescue path fired, summed over every shared index.
+
+    Returns:
+        Dict[str, int]: Count per path of RESCUE_PATHS.
+    """
+    totals = {path: 0 for path in RESCUE_PATHS}
+    for index in _INDEXES.values():
+        for path, count in index.counters.items():
+            totals[path] += count
+    return totals
@@ -0,0 +1,69 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# BatchAPI reads its settings with python-dotenv, as work_4.create_llm does
+pytest.importorskip("dotenv")
+
+from batch_job import BatchAPI, BatchJob
+from stub_server import start_stub_server
+
+LABELS = {
+    'Claims': "Claim forms, reimbursements and settlements",
+    'Policy': "Policy documents, renewals and endorsements",
+}
+FILENAMES = [f"claim_form_{number}.pdf" for number in range(5)] + ["policy_renewal.docx", "policy_schedule.pdf"]
+
+
+class CrashingAPI(BatchAPI):
+    """
+    Creates the batch, then fails as a process killed before saving its id would.
+    """
+
+    def create_batch(self, input_file_id, endpoint="/v1/chat/completions"):
+        super().create_batch(input_file_id, endpoint)
+        raise RuntimeError("crashed after create_batch")
+
+
+@pytest.fixture
+def stub():
+    server, base_url = start_stub_server(latency_ms=5, latency_sigma=0.0)
+    yield server.RequestHandlerClass.state, base_url
+    server.shutdown()
+
+
+def test_requests_are_split_across_batches(stub, tmp_path):
+    state, base_url = stub
+    job = BatchJob(str(tmp_path), LABELS, api=BatchAPI(base_url, "test"), poll_seconds=0.01, max_batch_requests=3)
+
+    results = job.run(FILENAMES)
+
+    assert len(state.batches) == 3
+    assert len(results) == len(FILENAMES)
+    assert all(result['label'] != "Error" for result in results)
+    assert job.load_state(FILENAMES)['batches'] == []
+
+
+def test_upload_streams_the_file_unchanged(stub, tmp_path):
+    state, base_url = stub
+    path = tmp_path / "requests.jsonl"
+    path.write_bytes(b'{"custom_id": "0"}\n' * 1000)
+
+    file_id = BatchAPI(base_url, "test").upload_file(str(path))
+
+    assert state.files[file_id] == path.read_bytes()
+
+
+def test_restart_finds_the_batch_created_before_a_crash(stub, tmp_path):
+    state, base_url = stub
+    with pytest.raises(RuntimeError):
+        BatchJob(str(tmp_path), LABELS, api=CrashingAPI(base_url, "test"), poll_seconds=0.01).run(FILENAMES)
+    assert len(state.batches) == 1
+
+    results = BatchJob(str(tmp_path), LABELS, api=BatchAPI(base_url, "test"), poll_seconds=0.01).run(FILENAMES)
+
+    assert len(state.batches) == 1
+    assert all(result['label'] != "Error" for result in results)
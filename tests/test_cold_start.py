@@ -0,0 +1,20 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from filename_classifier import measure_cold_import
+
+# Import time budget of filename_classifier in a fresh interpreter
+MAX_IMPORT_SECONDS = 0.5
+
+
+def test_cold_import_loads_no_heavy_modules():
+    measurement = measure_cold_import("filename_classifier")
+    assert measurement['heavy_modules'] == []
+
+
+def test_cold_import_within_budget():
+    # Best of three, so a single slow start on a loaded machine does not fail the test
+    seconds = min(measure_cold_import("filename_classifier")['seconds'] for _ in range(3))
+    assert seconds <= MAX_IMPORT_SECONDS
@@ -0,0 +1,66 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crawler import FileIndex, crawl_and_classify
+
+
+class FailingOnce:
+    """
+    classify_fn answering "Error" for the listed names on its first call only.
+    """
+
+    def __init__(self, failing):
+        self.failing = set(failing)
+        self.calls = []
+
+    def __call__(self, filenames):
+        self.calls.append(list(filenames))
+        first = len(self.calls) == 1
+        return [
+            {'label': "Error", 'explanation': "HTTP 429"} if first and name in self.failing
+            else {'label': "Claims", 'explanation': "A claim"}
+            for name in filenames
+        ]
+
+
+def make_tree(root):
+    for name in ("claim_1.pdf", "claim_2.pdf", "claim_3.pdf"):
+        (root / name).write_text(name, encoding="utf-8")
+
+
+def test_recrawl_classifies_again_only_failed_files(tmp_path):
+    tree = tmp_path / "tree"
+    tree.mkdir()
+    make_tree(tree)
+    index = FileIndex(str(tmp_path / "index.sqlite"))
+    classify_fn = FailingOnce(["claim_2.pdf"])
+
+    first = crawl_and_classify([str(tree)], index, classify_fn)
+    second = crawl_and_classify([str(tree)], index, classify_fn)
+    third = crawl_and_classify([str(tree)], index, classify_fn)
+
+    assert first['classified'] == 3 and first['failed'] == 1
+    assert classify_fn.calls[1] == ["claim_2.pdf"]
+    assert second['classified'] == 1 and second['failed'] == 0 and second['unchanged'] == 2
+    assert third['classified'] == 0 and third['unchanged'] == 3
+    assert {label for _, label, _ in index.results()} == {"Claims"}
+    index.close()
+
+
+def test_moved_file_does_not_inherit_an_error(tmp_path):
+    tree = tmp_path / "tree"
+    tree.mkdir()
+    make_tree(tree)
+    index = FileIndex(str(tmp_path / "index.sqlite"))
+    classify_fn = FailingOnce(["claim_1.pdf"])
+    crawl_and_classify([str(tree)], index, classify_fn)
+
+    (tree / "sub").mkdir()
+    os.replace(tree / "claim_1.pdf", tree / "sub" / "claim_1.pdf")
+    counts = crawl_and_classify([str(tree)], index, classify_fn)
+
+    assert counts['moved'] == 0 and counts['classified'] == 1
+    assert dict((os.path.basename(path), label) for path, label, _ in index.results())['claim_1.pdf'] == "Claims"
+    index.close()
@@ -0,0 +1,105 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+np = pytest.importorskip("numpy")
+
+from distill import DistilledClassifier, DistilledRouter
+
+KINDS = {
+    'Claims': ["claim_form", "accident_claim", "claim_settlement"],
+    'Finance': ["invoice", "quarterly_budget", "expense_report"],
+    'Legal': ["nda_contract", "compliance_policy", "court_filing"],
+}
+LABELS_DICT = {label: label for label in KINDS}
+
+
+def labeled_filenames(count_per_stem=40):
+    filenames, labels = [], []
+    for label, stems in KINDS.items():
+        for stem in stems:
+            for number in range(count_per_stem):
+                filenames.append(f"{stem}_{number:03d}.pdf")
+                labels.append(label)
+    # A stem the LLM labels both ways, which the model cannot be sure about
+    for number in range(count_per_stem):
+        filenames.append(f"annual_review_{number:03d}.pdf")
+        labels.append("Finance" if number % 2 else "Legal")
+    return filenames, labels
+
+
+@pytest.fixture
+def model():
+    model = DistilledClassifier(n_features=2 ** 12)
+    filenames, labels = labeled_filenames()
+    # Fed in two batches, as labels arrive from the LLM
+    model.partial_fit(filenames[::2], labels[::2])
+    model.partial_fit(filenames[1::2], labels[1::2])
+    model.calibrate()
+    return model
+
+
+def test_partial_fit_and_predict_proba(model):
+    assert sorted(model.labels) == sorted(KINDS)
+    assert model.holdout
+
+    predicted, confidence = model.predict_proba(["claim_form_999.pdf", "invoice_999.pdf", "court_filing_999.pdf"])
+    assert predicted == ["Claims", "Finance", "Legal"]
+    assert ((confidence > 0.5) & (confidence <= 1.0)).all()
+
+
+def test_errors_are_not_learned():
+    model = DistilledClassifier(n_features=2 ** 12, holdout_percent=0)
+    assert model.partial_fit(["claim_form.pdf", "invoice.pdf"], ["Claims", "Error"]) == 1
+    assert model.labels == ["Claims"]
+
+
+def test_threshold_reaches_target_agreement_on_holdout(model):
+    threshold = model.threshold_for(0.95)
+    assert threshold <= 1.0
+
+    names = list(model.holdout)
+    predicted, confidence = model.predict_proba(names)
+    above = confidence >= threshold
+    agreement = np.mean([label == model.holdout[name] for name, label in zip(names, predicted)], where=above)
+    assert above.any()
+    assert agreement >= 0.95
+    assert model.evaluate(threshold)['agreement_above_threshold'] == pytest.approx(agreement)
+
+
+def test_save_load_round_trip(model, tmp_path):
+    path = str(tmp_path / "model.npz")
+    model.save(path)
+    loaded = DistilledClassifier.load(path)
+
+    assert loaded.labels == model.labels
+    assert loaded.holdout == model.holdout
+    assert loaded.temperature == model.temperature
+    names = ["claim_form_999.pdf", "quarterly_budget_2027.xlsx", "nda_contract_v2.docx"]
+    predicted, confidence = model.predict_proba(names)
+    loaded_predicted, loaded_confidence = loaded.predict_proba(names)
+    assert loaded_predicted == predicted
+    np.testing.assert_allclose(loaded_confidence, confidence)
+
+
+def test_router_sends_low_confidence_rows_to_classify_fn(model):
+    calls = []
+
+    def classify_fn(filenames, labels_dict=None, default_label="Others"):
+        calls.append(list(filenames))
+        return [{'label': "Legal", 'explanation': "From the LLM"} for _ in filenames]
+
+    router = DistilledRouter(model, classify_fn, threshold=0.9)
+    filenames = ["claim_form_999.pdf", "annual_review_999.pdf", "invoice_999.pdf"]
+    _, confidence = model.predict_proba(filenames)
+    assert confidence[1] < 0.9 <= min(confidence[0], confidence[2])
+
+    results = router.classify(filenames, LABELS_DICT)
+
+    assert calls == [["annual_review_999.pdf"]]
+    assert [result['label'] for result in results] == ["Claims", "Legal", "Finance"]
+    assert results[1]['explanation'] == "From the LLM"
+    assert router.counters == {'local': 2, 'llm': 1}
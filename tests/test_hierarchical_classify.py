@@ -0,0 +1,69 @@
+import asyncio
+import json
+import os
+import re
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import hierarchical_classify
+from hierarchical_classify import HierarchicalClassifier
+from taxonomy import load_bins
+
+BIN = "TechCommCustomerService"
+
+# Fine label answered by stage two for every filename; filenames missing here are left out
+FINE_LABELS = {
+    "db_migration_plan.docx": "database management",
+    "upload_failed_report.txt": "Error",
+}
+
+
+class FakeChain:
+    """
+    Chain answering stage one with BIN and stage two from FINE_LABELS.
+    """
+
+    def __init__(self, llm, system_prompt, human_template=None):
+        self.system_prompt = system_prompt
+        self.batched = human_template is not None
+
+    async def arun(self, filename=None, filenames=None, callbacks=None):
+        if not self.batched:
+            return json.dumps({'label': BIN, 'explanation': "Stage one"})
+        names = re.findall(r"^\d+\. (.+)$", filenames, re.MULTILINE)
+        return json.dumps([
+            {'filename': name, 'label': FINE_LABELS[name], 'explanation': "Stage two"}
+            for name in names if name in FINE_LABELS
+        ])
+
+
+@pytest.fixture
+def classifier(monkeypatch):
+    monkeypatch.setattr(hierarchical_classify, "build_chain", FakeChain)
+    classifier = HierarchicalClassifier(load_bins())
+    # The fake chains never call the model
+    classifier._llm = object()
+    return classifier
+
+
+def test_fine_labels_and_failures(classifier):
+    filenames = ["db_migration_plan.docx", "upload_failed_report.txt", "never_answered.pdf"]
+    results = asyncio.run(classifier.aclassify(filenames, progress=False))
+
+    assert [result['label'] for result in results] == [BIN, BIN, BIN]
+    # "Error" is a fine label of the bin, kept as an answer
+    assert [result['fine_label'] for result in results] == ["database management", "Error", BIN]
+    assert results[1]['explanation'] == "Stage two"
+    # A filename the batcher gave up on keeps the bin and the stage-one explanation
+    assert results[2]['explanation'] == "Stage one"
+
+
+def test_stage_two_labels_list_the_bin_and_no_typos(classifier):
+    labels = classifier.stage_two_labels["LegalCompliance"]
+    assert "LegalCompliance" in labels
+    assert "compliance" in labels
+    assert "comnliance" not in labels
+    assert "comnliance" not in classifier.stage_two_prompts["LegalCompliance"]
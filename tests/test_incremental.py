@@ -0,0 +1,42 @@
+import csv
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("pandas")
+
+from incremental import reclassify_file
+from stream_pipeline import classify_file, load_checkpoint
+
+
+def label_all(label, explanation):
+    def classify_fn(filenames, labels_dict=None, default_label="Others"):
+        return [{'label': label, 'explanation': explanation} for _ in filenames]
+    return classify_fn
+
+
+def test_reclassify_keeps_the_pipeline_checkpoint_in_step(tmp_path):
+    input_path = tmp_path / "input.csv"
+    output_path = str(tmp_path / "output.csv")
+    input_path.write_text("file names\n" + "\n".join(f"claim_{n}.pdf" for n in range(6)) + "\n", encoding="utf-8")
+
+    classify_file(str(input_path), output_path, {'Claims': "Claims"}, chunksize=4, classify_fn=label_all("Claims", "x"))
+    report = reclassify_file(output_path, {'Benefits': "Benefits"}, classify_fn=label_all("Benefits", "A longer explanation"))
+
+    checkpoint = load_checkpoint(output_path + ".checkpoint")
+    assert report['reclassified'] == 6
+    assert checkpoint['output_bytes'] == os.path.getsize(output_path)
+    assert 'swap' not in checkpoint
+
+    # More input rows are appended after the rewritten ones, not over them
+    with open(input_path, "a", encoding="utf-8") as f:
+        f.write("claim_6.pdf\n")
+    classify_file(str(input_path), output_path, {'Benefits': "Benefits"}, chunksize=4, classify_fn=label_all("Benefits", "y"))
+
+    with open(output_path, newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))[1:]
+    assert [row[0] for row in rows] == [f"claim_{n}.pdf" for n in range(7)]
+    assert {row[1] for row in rows} == {"Benefits"}
@@ -0,0 +1,73 @@
+import asyncio
+import json
+import os
+import sys
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import async_classify
+from async_classify import AsyncClassifier
+from metrics import Metrics
+from retry import RetryPolicy
+
+ANSWER = '{"label": "Claims", "explanation": "A claim form"}'
+
+
+class FlakyChain:
+    """
+    Chain failing with a retryable error `failures` times, then answering.
+    """
+
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.calls = 0
+
+    async def arun(self, filename, callbacks=None):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError("connection reset")
+        return ANSWER
+
+
+@pytest.fixture(autouse=True)
+def no_langchain_usage(monkeypatch):
+    # The usage callback is a langchain handler; the fake chains never report usage
+    monkeypatch.setattr(async_classify, "usage_handler", lambda: types.SimpleNamespace(prompt_tokens=0, completion_tokens=0))
+
+
+def make_classifier(chain, metrics):
+    return AsyncClassifier(chain, ["Claims"], metrics=metrics, retry_policy=RetryPolicy(5, base_delay=0.001))
+
+
+def test_counters_after_fail_fail_succeed_in_classify():
+    metrics = Metrics()
+    results = asyncio.run(make_classifier(FlakyChain(2), metrics).classify(["claim.pdf"], progress=False))
+
+    assert results == [{'label': "Claims", 'explanation': "A claim form"}]
+    assert metrics.counters['retries'] == 2
+    assert metrics.counters['requests'] == 3
+    assert metrics.counters['requests_error'] == 2
+    assert metrics.counters['requests_ok'] == 1
+
+
+def test_counters_after_fail_fail_succeed_in_classify_one():
+    metrics = Metrics()
+    result = asyncio.run(make_classifier(FlakyChain(2), metrics).classify_one("claim.pdf"))
+
+    assert result['label'] == "Claims"
+    assert metrics.counters['retries'] == 2
+    assert metrics.counters['requests'] == 3
+
+
+def test_trace_records_the_attempt_of_each_request(tmp_path):
+    trace = tmp_path / "trace.jsonl"
+    metrics = Metrics(str(trace))
+    asyncio.run(make_classifier(FlakyChain(2), metrics).classify_one("claim.pdf"))
+    metrics.close()
+
+    records = [json.loads(line) for line in trace.read_text(encoding="utf-8").splitlines()]
+    assert [record['attempt'] for record in records] == [0, 1, 2]
+    assert [record['outcome'] for record in records] == ["error", "error", "ok"]
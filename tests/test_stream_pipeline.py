@@ -0,0 +1,123 @@
+import csv
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("pandas")
+
+import stream_pipeline
+from stream_pipeline import classify_file, load_checkpoint
+
+FILENAMES = [f"claim_{number}.pdf" for number in range(10)]
+
+
+class Classifier:
+    """
+    classify_fn answering "Error" for the names in `failing` until `heal` is called, and
+    raising on the call number `crash_on`, as a killed process would stop.
+    """
+
+    def __init__(self, failing=(), crash_on=None):
+        self.failing = set(failing)
+        self.crash_on = crash_on
+        self.calls = []
+
+    def heal(self):
+        self.failing.clear()
+
+    def __call__(self, filenames):
+        self.calls.append(list(filenames))
+        if len(self.calls) == self.crash_on:
+            raise RuntimeError("crash")
+        return [
+            {'label': "Error", 'explanation': "HTTP 429"} if name in self.failing
+            else {'label': "Claims", 'explanation': f"About {name}"}
+            for name in filenames
+        ]
+
+
+@pytest.fixture
+def paths(tmp_path):
+    input_path = tmp_path / "input.csv"
+    input_path.write_text("file names\n" + "\n".join(FILENAMES) + "\n", encoding="utf-8")
+    return str(input_path), str(tmp_path / "output.csv")
+
+
+def read_rows(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.reader(f))[1:]
+
+
+def assert_consistent(output_path):
+    checkpoint = load_checkpoint(output_path + ".checkpoint")
+    assert checkpoint['output_bytes'] == os.path.getsize(output_path)
+    assert checkpoint['failures_bytes'] == os.path.getsize(output_path + ".failures")
+    assert 'swap' not in checkpoint
+    assert not os.path.exists(output_path + ".tmp")
+
+
+def test_resume_after_crash(paths):
+    input_path, output_path = paths
+    with pytest.raises(RuntimeError):
+        classify_file(input_path, output_path, chunksize=4, classify_fn=Classifier(crash_on=2))
+    assert load_checkpoint(output_path + ".checkpoint")['rows'] == 4
+
+    classify_fn = Classifier()
+    assert classify_file(input_path, output_path, chunksize=4, classify_fn=classify_fn) == 10
+
+    assert classify_fn.calls[0] == FILENAMES[4:8]
+    assert [row[0] for row in read_rows(output_path)] == FILENAMES
+    assert_consistent(output_path)
+
+
+def test_failed_rows_are_retried_in_place(paths):
+    input_path, output_path = paths
+    classify_fn = Classifier(failing=["claim_2.pdf", "claim_7.pdf"])
+    classify_file(input_path, output_path, chunksize=4, classify_fn=classify_fn)
+    assert [row[1] for row in read_rows(output_path)].count("Error") == 2
+
+    classify_fn.heal()
+    classify_file(input_path, output_path, chunksize=4, classify_fn=classify_fn)
+
+    assert ["claim_2.pdf", "claim_7.pdf"] in classify_fn.calls
+    rows = read_rows(output_path)
+    assert [row[0] for row in rows] == FILENAMES
+    assert {row[1] for row in rows} == {"Claims"}
+    assert_consistent(output_path)
+
+
+def test_crash_during_swap_is_finished_on_restart(paths, monkeypatch):
+    input_path, output_path = paths
+    classify_fn = Classifier(failing=["claim_2.pdf"])
+    classify_file(input_path, output_path, chunksize=4, classify_fn=classify_fn)
+    classify_fn.heal()
+
+    # Crash once the checkpoint names the swap, before any file is replaced
+    finish_swap = stream_pipeline.finish_swap
+
+    def crash(checkpoint_path, checkpoint):
+        raise RuntimeError("crash")
+
+    monkeypatch.setattr(stream_pipeline, "finish_swap", crash)
+    with pytest.raises(RuntimeError):
+        classify_file(input_path, output_path, chunksize=4, classify_fn=classify_fn)
+    monkeypatch.setattr(stream_pipeline, "finish_swap", finish_swap)
+
+    classify_file(input_path, output_path, chunksize=4, classify_fn=classify_fn)
+
+    rows = read_rows(output_path)
+    assert [row[0] for row in rows] == FILENAMES
+    assert {row[1] for row in rows} == {"Claims"}
+    assert_consistent(output_path)
+
+
+def test_output_without_checkpoint_is_refused(paths):
+    input_path, output_path = paths
+    classify_file(input_path, output_path, chunksize=4, classify_fn=Classifier())
+    os.remove(output_path + ".checkpoint")
+
+    with pytest.raises(ValueError):
+        classify_file(input_path, output_path, chunksize=4, classify_fn=Classifier())
@@ -0,0 +1,68 @@
+import asyncio
+import os
+import sys
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import Metrics
+from retry import RetryPolicy
+from streaming_classify import StreamingClassifier
+
+PIECES = ['{"label": "Cla', 'ims", "explanation": ', '"A claim form"}']
+
+
+class FlakyStreamingLLM:
+    """
+    Model whose stream fails before its first token `failures` times, then streams the answer.
+    """
+
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.calls = 0
+
+    async def astream(self, messages):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError("connection reset")
+        for piece in PIECES:
+            yield types.SimpleNamespace(content=piece)
+
+
+class DictScope(dict):
+    """
+    In-memory stand-in for a CacheScope.
+    """
+
+    def put(self, filename, result):
+        self[filename] = result
+
+
+def make_classifier(llm, metrics, cache_scope=None):
+    chain = types.SimpleNamespace(llm=llm, prompt=types.SimpleNamespace(format_messages=lambda filename: []))
+    return StreamingClassifier(
+        chain, ["Claims"], explanations=True, metrics=metrics, cache_scope=cache_scope,
+        retry_policy=RetryPolicy(5, base_delay=0.001)
+    )
+
+
+def test_counters_after_fail_fail_succeed():
+    metrics = Metrics()
+    results = asyncio.run(make_classifier(FlakyStreamingLLM(2), metrics).classify(["claim.pdf"], progress=False))
+
+    assert results == [{'label': "Claims", 'explanation': "A claim form"}]
+    assert metrics.counters['retries'] == 2
+    assert metrics.counters['requests'] == 3
+    assert metrics.counters['requests_ok'] == 1
+
+
+def test_cached_result_opens_no_stream():
+    llm = FlakyStreamingLLM(0)
+    scope = DictScope()
+    classifier = make_classifier(llm, Metrics(), scope)
+
+    first = asyncio.run(classifier.classify(["claim.pdf"], progress=False))
+    second = asyncio.run(classifier.classify(["claim.pdf"], progress=False))
+
+    assert first == second
+    assert llm.calls == 1
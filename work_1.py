@@ -8,8 +8,9 @@ from langchain.prompts import (
     ChatPromptTemplate
 )
 from dotenv import load_dotenv
+from label_registry import LabelRegistry
 
-def classify_filenames(filenames: List[str], labels: List[str]) -> List[str]:
+def classify_filenames(filenames: List[str], labels: List[str], max_prompt_labels: int = 20) -> List[str]:
     # Load environment variables from .env file
     load_dotenv()
 
@@ -59,16 +60,19 @@ Constraints:
         verbose=True
     )
 
+    # Index the labels so lookups are hashed and near-duplicates merge into one label
+    registry = LabelRegistry(labels)
+
     # List to store the classified labels
     classified_labels = []
 
     # Iterate over each filename to classify
     for filename in filenames:
         try:
-            # Run the chain with the current filename and labels
+            # Run the chain with the current filename and only the most relevant labels
             response = chain.run(
                 filename=filename,
-                labels=", ".join(labels)
+                labels=", ".join(registry.prompt_labels(filename, max_prompt_labels))
             )
 
             # Print the filename and raw response from the model
@@ -82,11 +86,15 @@ Constraints:
             if label.lower().startswith('label:'):
                 label = label[len('label:'):].strip()
 
+            # Map the label to its canonical form, registering it if it is new
+            known_labels = len(registry)
+            label = registry.add(label)
+
             # Add the label to the list of classified labels
             classified_labels.append(label)
 
             # Update labels if a new category was added
-            if label not in labels:
+            if len(registry) > known_labels:
                 labels.append(label)
         except Exception as e:
             # Handle any exceptions and append 'Error' as the label
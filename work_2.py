@@ -1,53 +1,31 @@
+import asyncio
 import os
 import pandas as pd
 from typing import List, Dict
 from langchain.chat_models import ChatOpenAI
-from langchain import LLMChain
-from langchain.prompts import (
-    SystemMessagePromptTemplate,
-    HumanMessagePromptTemplate,
-    ChatPromptTemplate
-)
 from dotenv import load_dotenv
+from work_4 import build_chain
+from async_classify import AsyncClassifier
+from description_refiner import DescriptionRefiner
+from taxonomy_index import index_for_labels
 
-def classify_filenames(
-    filenames: List[str],
-    labels_dict: Dict[str, str],
-    default_label: str = "other"
-) -> List[str]:
+def build_system_prompt(labels_dict: Dict[str, str], default_label: str = "other") -> str:
     """
-    Classifies filenames into labels based on their names and updates label descriptions.
+    Renders the system prompt listing every label with its description.
 
     Args:
-        filenames (List[str]): List of filenames to classify.
         labels_dict (Dict[str, str]): Dictionary with labels as keys and descriptions as values.
         default_label (str, optional): Default label for unmatched filenames. Defaults to "other".
 
     Returns:
-        List[str]: List of labels assigned to each filename.
+        str: The rendered system prompt.
     """
-    # Load environment variables from .env file
-    load_dotenv()
-
-    # Fetch environment variables
-    api_key = os.environ.get("OPENAI_API_KEY")
-    base_url = os.environ.get("BASE_URL")
-
-    # Initialize the language model with the specified parameters
-    llm = ChatOpenAI(
-        model_name="gpt-4-32k-0613",
-        openai_api_key=api_key,
-        temperature=0,
-        base_url=base_url
-    )
-
     # Prepare the labels and descriptions for the prompt
-    labels = list(labels_dict.keys())
     descriptions = [f"{label}: {description}" for label, description in labels_dict.items()]
     labels_with_descriptions = "\n".join(descriptions)
 
     # Define the system prompt with instructions for the model
-    system_prompt = f"""
+    return f"""
 You are an expert classifier.
 
 Instructions:
@@ -65,62 +43,113 @@ LIST of LABELS and DESCRIPTIONS:
 {labels_with_descriptions}
 """
 
-    # Create the SystemMessagePromptTemplate with the system prompt
-    system_msg_template = SystemMessagePromptTemplate.from_template(template=system_prompt)
 
-    # Create the HumanMessagePromptTemplate for user input
-    human_msg_template = HumanMessagePromptTemplate.from_template(
-        template="FILENAME: {filename}"
-    )
+def parse_label(response: str, labels: List[str], default_label: str = "other") -> Dict[str, str]:
+    """
+    Extracts the label from a plain-text response.
+
+    Args:
+        response (str): Raw text returned by the model.
+        labels (List[str]): List of predefined labels.
+        default_label (str, optional): Label used when the model answers outside of labels. Defaults to "other".
+
+    Returns:
+        Dict[str, str]: Dictionary containing 'label' and an empty 'explanation'.
+    """
+    # Process the response to extract the label
+    label = response.strip()
+
+    # Remove any prefixes like 'Label: ' if present
+    if label.lower().startswith('label:'):
+        label = label[len('label:'):].strip()
+
+    # Rescue near-miss labels through the taxonomy index, assign default_label otherwise
+    resolved = index_for_labels(labels).resolve(label)
+    label = resolved if resolved is not None else default_label
+
+    return {'label': label, 'explanation': ""}
 
-    # Create the ChatPromptTemplate combining system and human templates
-    prompt_template = ChatPromptTemplate.from_messages(
-        [system_msg_template, human_msg_template]
-    )
 
-    # Create the LLMChain with the language model and prompt
-    chain = LLMChain(
-        llm=llm,
-        prompt=prompt_template,
-        verbose=False
+def classify_filenames(
+    filenames: List[str],
+    labels_dict: Dict[str, str],
+    default_label: str = "other",
+    chunk_size: int = 20,
+    max_concurrency: int = 8
+) -> List[str]:
+    """
+    Classifies filenames into labels based on their names and updates label descriptions.
+
+    Filenames are classified concurrently, one chunk at a time, against a snapshot of the
+    descriptions. The filenames assigned to each label are accumulated and its description
+    is rewritten in one call per label between chunks (see DescriptionRefiner), instead of
+    one extra call per filename.
+
+    Args:
+        filenames (List[str]): List of filenames to classify.
+        labels_dict (Dict[str, str]): Dictionary with labels as keys and descriptions as values.
+        default_label (str, optional): Default label for unmatched filenames. Defaults to "other".
+        chunk_size (int, optional): Filenames classified against one descriptions snapshot,
+            and assignments that trigger a description rewrite. Defaults to 20.
+        max_concurrency (int, optional): Maximum number of requests in flight. Defaults to 8.
+
+    Returns:
+        List[str]: List of labels assigned to each filename.
+    """
+    # Load environment variables from .env file
+    load_dotenv()
+
+    # Fetch environment variables
+    api_key = os.environ.get("OPENAI_API_KEY")
+    base_url = os.environ.get("BASE_URL")
+
+    # Initialize the language model with the specified parameters
+    llm = ChatOpenAI(
+        model_name="gpt-4-32k-0613",
+        openai_api_key=api_key,
+        temperature=0,
+        base_url=base_url
     )
 
+    labels = list(labels_dict.keys())
+
+    # Description rewrites are deferred and batched per label
+    refiner = DescriptionRefiner(llm, labels_dict, refine_every=chunk_size)
+
     # List to store the classified labels
     classified_labels = []
 
-    # Iterate over each filename to classify
-    for filename in filenames:
-        try:
-            # Run the chain with the current filename
-            response = chain.run(
-                filename=filename
+    async def run():
+        # Iterate over the filenames chunk by chunk, on a single event loop
+        for start in range(0, len(filenames), chunk_size):
+            chunk = filenames[start:start + chunk_size]
+
+            # Build the chain from the descriptions snapshot used for this whole chunk
+            chain = build_chain(llm, build_system_prompt(refiner.snapshot(), default_label))
+            classifier = AsyncClassifier(
+                chain,
+                labels,
+                default_label=default_label,
+                max_concurrency=max_concurrency,
+                parse_fn=parse_label
             )
+            results = await classifier.classify(chunk, progress=False)
 
-            # Process the response to extract the label
-            label = response.strip()
-
-            # Remove any prefixes like 'Label: ' if present
-            if label.lower().startswith('label:'):
-                label = label[len('label:'):].strip()
+            for filename, result in zip(chunk, results):
+                # Add the label to the list of classified labels
+                classified_labels.append(result['label'])
 
-            # If the label is not in the predefined labels, assign default_label
-            if label not in labels:
-                label = default_label
+                # Remember the filename to update the description of its label later
+                if result['label'] != default_label:
+                    refiner.record(result['label'], filename)
 
-            # Add the label to the list of classified labels
-            classified_labels.append(label)
+            # Rewrite the descriptions of the labels with enough new filenames
+            await refiner.arefresh()
 
-            # Update the description of the label using the filename
-            if label != default_label:
-                old_description = labels_dict[label]
-                # Use the model to generate an improved description
-                new_description = update_label_description(llm, label, old_description, filename)
-                labels_dict[label] = new_description
+        # Rewrite the descriptions of the labels with the remaining filenames
+        await refiner.arefresh(final=True)
 
-        except Exception as e:
-            # Handle any exceptions and append 'Error' as the label
-            print(f"Error processing filename {filename}: {e}")
-            classified_labels.append("Error")
+    asyncio.run(run())
 
     return classified_labels
 
@@ -9,6 +9,7 @@ from langchain.prompts import (
     ChatPromptTemplate
 )
 from dotenv import load_dotenv
+from taxonomy_index import index_for_labels
 import logging
 from langchain.globals import set_verbose, set_debug
 set_verbose(False)
@@ -110,9 +111,9 @@ LIST of LABELS and DESCRIPTIONS:
             if label.lower().startswith('label:'):
                 label = label[len('label:'):].strip()
 
-            # If the label is not in the predefined labels, assign default_label
-            if label not in labels:
-                label = default_label
+            # Rescue near-miss labels through the taxonomy index, assign default_label otherwise
+            resolved = index_for_labels(labels).resolve(label)
+            label = resolved if resolved is not None else default_label
 
             # Add the label to the list of classified labels
             classified_labels.append(label)
@@ -1,37 +1,29 @@
 import os
-import pandas as pd
-from typing import List, Dict
-from langchain.chat_models import ChatOpenAI
-from langchain import LLMChain
-from langchain.prompts import (
-    SystemMessagePromptTemplate,
-    HumanMessagePromptTemplate,
-    ChatPromptTemplate
-)
-from dotenv import load_dotenv
+from typing import List, Dict, TYPE_CHECKING
 import logging
-from tqdm import tqdm  # For the progress bar
 import json
+import time
 
-def classify_filenames(
-    filenames: List[str],
-    labels_dict: Dict[str, str],
-    default_label: str = "Others"
-) -> List[Dict[str, str]]:
+from taxonomy_index import index_for_labels
+
+# langchain, pandas and tqdm take seconds to import, so they are imported on first use
+if TYPE_CHECKING:
+    from langchain.chat_models import ChatOpenAI
+    from langchain import LLMChain
+
+def create_llm(model_name: str = "gpt-4-32k-0613", **kwargs) -> "ChatOpenAI":
     """
-    Classifies filenames into labels based on their names and provides explanations.
+    Creates the chat model used for classification.
 
     Args:
-        filenames (List[str]): List of filenames to classify.
-        labels_dict (Dict[str, str]): Dictionary with labels as keys and descriptions as values.
-        default_label (str, optional): Default label for unmatched filenames. Defaults to "Others".
+        model_name (str, optional): Name of the OpenAI model. Defaults to "gpt-4-32k-0613".
+        **kwargs: Additional keyword arguments passed to ChatOpenAI.
 
     Returns:
-        List[Dict[str, str]]: List of dictionaries containing 'label' and 'explanation' for each filename.
+        ChatOpenAI: The initialized language model.
     """
-    # Set the logging level to WARNING to suppress verbose output
-    logging.getLogger("langchain").setLevel(logging.WARNING)
-    logging.getLogger("openai").setLevel(logging.WARNING)
+    from langchain.chat_models import ChatOpenAI
+    from dotenv import load_dotenv
 
     # Load environment variables from .env file
     load_dotenv()
@@ -41,20 +33,32 @@ def classify_filenames(
     base_url = os.environ.get("BASE_URL")
 
     # Initialize the language model with the specified parameters
-    llm = ChatOpenAI(
-        model_name="gpt-4-32k-0613",
+    return ChatOpenAI(
+        model_name=model_name,
         openai_api_key=api_key,
-        temperature=0,
-        base_url=base_url
+        temperature=kwargs.pop("temperature", 0),
+        base_url=base_url,
+        **kwargs
     )
 
+
+def build_system_prompt(labels_dict: Dict[str, str], default_label: str = "Others") -> str:
+    """
+    Renders the system prompt listing every label with its description.
+
+    Args:
+        labels_dict (Dict[str, str]): Dictionary with labels as keys and descriptions as values.
+        default_label (str, optional): Default label for unmatched filenames. Defaults to "Others".
+
+    Returns:
+        str: The rendered system prompt.
+    """
     # Prepare the labels and descriptions for the prompt
-    labels = list(labels_dict.keys())
     descriptions = [f"{label}: {description}" for label, description in labels_dict.items()]
     labels_with_descriptions = "\n".join(descriptions)
 
     # Define the system prompt with instructions for the model
-    system_prompt = f"""
+    return f"""
 You are an expert classifier working with a Medical Insurance company.
 
 Instructions:
@@ -75,12 +79,36 @@ LIST of LABELS and DESCRIPTIONS:
 {labels_with_descriptions}
 """
 
+
+def build_chain(
+    llm: "ChatOpenAI",
+    system_prompt: str,
+    human_template: str = "FILENAME: {filename}"
+) -> "LLMChain":
+    """
+    Builds the LLMChain that classifies a FILENAME.
+
+    Args:
+        llm (ChatOpenAI): The language model instance.
+        system_prompt (str): The rendered system prompt.
+        human_template (str, optional): Template of the human message. Defaults to "FILENAME: {filename}".
+
+    Returns:
+        LLMChain: Chain expecting the input variables of human_template.
+    """
+    from langchain import LLMChain
+    from langchain.prompts import (
+        SystemMessagePromptTemplate,
+        HumanMessagePromptTemplate,
+        ChatPromptTemplate
+    )
+
     # Create the SystemMessagePromptTemplate with the system prompt
     system_msg_template = SystemMessagePromptTemplate.from_template(template=system_prompt)
 
     # Create the HumanMessagePromptTemplate for user input
     human_msg_template = HumanMessagePromptTemplate.from_template(
-        template="FILENAME: {filename}"
+        template=human_template
     )
 
     # Create the ChatPromptTemplate combining system and human templates
@@ -89,39 +117,113 @@ LIST of LABELS and DESCRIPTIONS:
     )
 
     # Create the LLMChain with the language model and prompt
-    chain = LLMChain(
+    return LLMChain(
         llm=llm,
         prompt=prompt_template,
         verbose=False
     )
 
+
+def parse_response(response: str, labels: List[str], default_label: str = "Others") -> Dict[str, str]:
+    """
+    Parses the JSON response of the model into a label and an explanation.
+
+    Args:
+        response (str): Raw text returned by the model.
+        labels (List[str]): List of predefined labels.
+        default_label (str, optional): Label used when the model answers outside of labels
+            and no near-miss can be resolved. Defaults to "Others".
+
+    Returns:
+        Dict[str, str]: Dictionary containing 'label' and 'explanation'.
+    """
+    # Parse the JSON response
+    result = json.loads(response.strip())
+
+    # Extract label and explanation
+    label = result.get('label', '').strip()
+    explanation = result.get('explanation', '').strip()
+
+    # Rescue near-miss labels through the taxonomy index, assign default_label otherwise
+    resolved = index_for_labels(labels).resolve(label)
+    label = resolved if resolved is not None else default_label
+
+    return {
+        'label': label,
+        'explanation': explanation
+    }
+
+
+def classify_filenames(
+    filenames: List[str],
+    labels_dict: Dict[str, str],
+    default_label: str = "Others",
+    cache=None,
+    metrics=None
+) -> List[Dict[str, str]]:
+    """
+    Classifies filenames into labels based on their names and provides explanations.
+
+    Args:
+        filenames (List[str]): List of filenames to classify.
+        labels_dict (Dict[str, str]): Dictionary with labels as keys and descriptions as values.
+        default_label (str, optional): Default label for unmatched filenames. Defaults to "Others".
+        cache (ResponseCache, optional): Persistent cache of previous results. Defaults to None.
+        metrics (Metrics, optional): Instrumentation receiving every request. Defaults to None.
+
+    Returns:
+        List[Dict[str, str]]: List of dictionaries containing 'label' and 'explanation' for each filename.
+    """
+    from tqdm import tqdm  # For the progress bar
+    from metrics import usage_handler
+
+    # Set the logging level to WARNING to suppress verbose output
+    logging.getLogger("langchain").setLevel(logging.WARNING)
+    logging.getLogger("openai").setLevel(logging.WARNING)
+
+    # Initialize the language model and the chain with the rendered system prompt
+    llm = create_llm()
+    labels = list(labels_dict.keys())
+    system_prompt = build_system_prompt(labels_dict, default_label)
+    chain = build_chain(llm, system_prompt)
+
+    # Bind the cache to this model and prompt so that lookups only hash the filename
+    cache_scope = cache.scope(llm.model_name, system_prompt) if cache is not None else None
+
     # List to store the classified labels and explanations
     classified_results = []
 
     # Iterate over each filename to classify with a progress bar
     for filename in tqdm(filenames, desc="Classifying filenames"):
+        # Reuse the stored result if this request was already answered
+        if cache_scope is not None:
+            cached = cache_scope.get(filename)
+            if metrics is not None:
+                metrics.increment('cache_hits' if cached is not None else 'cache_misses')
+            if cached is not None:
+                classified_results.append(cached)
+                continue
+
+        # Capture the token usage of the call when instrumentation is enabled
+        handler = usage_handler() if metrics is not None else None
+        outcome = "error"
+        started = time.perf_counter()
         try:
             # Run the chain with the current filename
             response = chain.run(
-                filename=filename
+                filename=filename,
+                callbacks=[handler] if handler is not None else None
             )
 
-            # Parse the JSON response
-            result = json.loads(response.strip())
-
-            # Extract label and explanation
-            label = result.get('label', '').strip()
-            explanation = result.get('explanation', '').strip()
-
-            # If the label is not in the predefined labels, assign default_label
-            if label not in labels:
-                label = default_label
+            # Parse the response and add the label and explanation to the list
+            outcome = "parse_failure"
+            result = parse_response(response, labels, default_label)
+            outcome = "ok"
+            classified_results.append(result)
 
-            # Add the label and explanation to the list
-            classified_results.append({
-                'label': label,
-                'explanation': explanation
-            })
+            # Store the result so that a re-run does not call the model again
+            if cache_scope is not None:
+                cache_scope.put(filename, result)
 
         except Exception as e:
             # Handle any exceptions and append 'Error' as the label
@@ -131,10 +233,22 @@ LIST of LABELS and DESCRIPTIONS:
                 'explanation': str(e)
             })
 
+        finally:
+            if handler is not None:
+                metrics.record_request(
+                    filename,
+                    time.perf_counter() - started,
+                    outcome,
+                    prompt_tokens=handler.prompt_tokens,
+                    completion_tokens=handler.completion_tokens
+                )
+
     return classified_results
 
 # Additional code to work with pandas DataFrame
 if __name__ == "__main__":
+    import pandas as pd
+
     # Define the bins dictionary with labels and descriptions
     bins = {
         "Financial": "Documents directly related to the company's internal finances, including financial transactions and internal financial reports.",
@@ -162,15 +276,9 @@ if __name__ == "__main__":
         ]
     })
 
-    # Extract the filenames from the DataFrame
-    filenames = df['file names'].tolist()
-
-    # Classify the filenames using the classify_filenames function
-    classified_results = classify_filenames(filenames, bins, default_label="Others")
-
-    # Add the classified labels and explanations as new columns in the DataFrame
-    df['LLM_label'] = [result['label'] for result in classified_results]
-    df['Explanation'] = [result['explanation'] for result in classified_results]
+    # Classify each unique filename once and add the labels and explanations as new columns
+    import pandas_accessor  # Registers the .llm accessor
+    df = df.llm.classify(bins, default_label="Others", classify_fn=classify_filenames)
 
     # Print the updated DataFrame
     print(df[['file names', 'LLM_label', 'Explanation']])